@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit test of the ARQ payload compression.
+
+Can be invoked from CMake, pytest, coverage or directly.
+
+Uses no other files.
+"""
+
+import io
+import os
+import sys
+import tempfile
+import zlib
+
+import compression
+import pytest
+from compression import CODEC
+
+TEXT = b"FreeDATA compression test, " * 5000
+
+
+class FailingFile(io.BytesIO):
+    """File which can't be read after the first block"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        if self.reads > 1:
+            raise OSError("read error")
+        return super().read(size)
+
+
+def requires_codec(codec: CODEC):
+    return pytest.mark.skipif(
+        not compression.is_supported(codec), reason=f"{codec.name} not installed"
+    )
+
+
+@pytest.mark.parametrize(
+    "codec",
+    [
+        CODEC.NONE,
+        CODEC.LZMA,
+        CODEC.ZLIB,
+        pytest.param(CODEC.ZSTD, marks=requires_codec(CODEC.ZSTD)),
+    ],
+)
+def test_round_trip(codec: CODEC):
+    """
+    Compress with every codec and decompress by the codec id of the header.
+    """
+    total_bytes, used_codec, compressed, crc = compression.CompressionJob(TEXT, codec).start().result()
+
+    assert total_bytes == len(TEXT)
+    assert used_codec == codec
+    if codec != CODEC.NONE:
+        assert len(compressed) < len(TEXT)
+    assert crc == zlib.crc32(compressed).to_bytes(4, "big")
+    assert compression.decompress(used_codec.value, compressed) == TEXT
+
+
+@pytest.mark.parametrize("codec", [CODEC.LZMA, CODEC.ZLIB])
+def test_round_trip_file(codec: CODEC):
+    """
+    Files are read in blocks from the current position and closed.
+    """
+    file = io.BytesIO(b"skipped" + TEXT)
+    file.seek(len(b"skipped"))
+    job = compression.CompressionJob(file, codec)
+    assert job.total_bytes == len(TEXT)
+
+    total_bytes, used_codec, compressed, _ = job.start().result()
+    assert file.closed
+    assert total_bytes == len(TEXT)
+    assert compression.decompress(used_codec.value, compressed) == TEXT
+
+
+@pytest.mark.parametrize("max_size", [1, len(TEXT) * 2], ids=["on_disk", "in_memory"])
+def test_round_trip_spooled_file(max_size: int):
+    """
+    Chunked uploads are spooled to a temporary file, seek returns None for
+    these before python 3.11.
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=max_size)
+    for position in range(0, len(TEXT), 1000):
+        file.write(TEXT[position: position + 1000])
+    assert file._rolled == (max_size < len(TEXT))
+    file.seek(0)
+    job = compression.CompressionJob(file, CODEC.ZLIB)
+    assert job.total_bytes == len(TEXT)
+
+    total_bytes, used_codec, compressed, _ = job.start().result()
+    assert file.closed
+    assert total_bytes == len(TEXT)
+    assert compression.decompress(used_codec.value, compressed) == TEXT
+
+
+def test_probe_fallback():
+    """
+    Data which doesn't compress is sent uncompressed.
+    """
+    data = os.urandom(3 * compression.BLOCK_SIZE)
+    total_bytes, used_codec, compressed, _ = compression.CompressionJob(data, CODEC.LZMA).start().result()
+
+    assert used_codec == CODEC.NONE
+    assert total_bytes == len(data)
+    assert compressed == data
+
+
+def test_empty_payload():
+    total_bytes, used_codec, compressed, _ = compression.CompressionJob(b"", CODEC.ZLIB).start().result()
+
+    assert total_bytes == 0
+    assert used_codec == CODEC.NONE
+    assert compressed == b""
+
+
+def test_cancel_closes_file():
+    """
+    A cancelled job still closes its file.
+    """
+    file = io.BytesIO(TEXT * 10)
+    job = compression.CompressionJob(file, CODEC.ZLIB)
+    job.cancel()
+    job.start().result()
+
+    assert file.closed
+
+
+def test_error_raised_by_result():
+    """
+    Errors of the compression thread are raised by result.
+    """
+    file = FailingFile(TEXT * 10)
+    job = compression.CompressionJob(file, CODEC.ZLIB).start()
+
+    with pytest.raises(OSError):
+        job.result()
+    assert file.closed
+
+
+@pytest.mark.skipif(compression.is_supported(CODEC.ZSTD), reason="zstandard installed")
+def test_unsupported_codec():
+    """
+    Compression falls back to lzma, decompression raises.
+    """
+    job = compression.CompressionJob(TEXT, CODEC.ZSTD)
+    assert job.codec == CODEC.LZMA
+
+    with pytest.raises(ValueError):
+        compression.decompress(CODEC.ZSTD.value, b"")
+
+
+def test_unknown_codec_id():
+    with pytest.raises(ValueError):
+        compression.decompress(255, b"")
+
+
+@pytest.mark.parametrize("total_bytes", [1, compression.SMALL_PAYLOAD + 1, compression.LARGE_PAYLOAD + 1])
+def test_select_level(total_bytes: int):
+    """
+    Larger payloads are compressed with lower levels.
+    """
+    fast, default, best = compression.CODEC_LEVELS[CODEC.ZLIB]
+    level = compression.select_level(CODEC.ZLIB, total_bytes)
+
+    if total_bytes <= compression.SMALL_PAYLOAD:
+        assert level == best
+    elif total_bytes <= compression.LARGE_PAYLOAD:
+        assert level == default
+    else:
+        assert level == fast
+
+
+if __name__ == "__main__":
+    # Run pytest with the current script as the filename.
+    ecode = pytest.main(["-v", sys.argv[0]])
+    if ecode == 0:
+        print("errors: 0")
+    else:
+        print(ecode)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit test of the CRC algorithms against crcengine, which was used before,
+so CRCs stay compatible with other TNCs.
+
+Can be invoked from CMake, pytest, coverage or directly.
+
+Uses no other files.
+"""
+
+import os
+import sys
+
+import crc
+import pytest
+
+crcengine = pytest.importorskip("crcengine")
+
+SAMPLES = [
+    b"",
+    b"\x00",
+    b"\xff",
+    b"123456789",
+    b"AA1AA-0",
+    bytes(range(256)),
+    os.urandom(1000),
+]
+
+
+def reference(algorithm: crc.CrcAlgorithm):
+    """crcengine algorithm of the same name"""
+    if algorithm is crc.CRC24:
+        return crcengine.create(
+            params=crcengine.CrcParams(0x864CFB, 24, 0xB704CE, False, False, 0),
+            name="crc-24-openpgp",
+        )
+    return crcengine.new(algorithm.name)
+
+
+@pytest.mark.parametrize("algorithm", [crc.CRC8, crc.CRC16, crc.CRC24, crc.CRC32], ids=lambda a: a.name)
+@pytest.mark.parametrize("data", SAMPLES, ids=range(len(SAMPLES)))
+def test_crc_matches_crcengine(algorithm: crc.CrcAlgorithm, data: bytes):
+    """
+    Every algorithm calculates the same CRC as crcengine.
+    """
+    expected = reference(algorithm)(data)
+
+    assert algorithm(data) == expected
+    assert algorithm.digest(data) == expected.to_bytes(algorithm.size, "big")
+
+
+@pytest.mark.parametrize("algorithm", [crc.CRC8, crc.CRC16, crc.CRC24, crc.CRC32], ids=lambda a: a.name)
+@pytest.mark.parametrize("chunk_size", [1, 7, 100])
+def test_incremental_update(algorithm: crc.CrcAlgorithm, chunk_size: int):
+    """
+    Feeding data in chunks gives the CRC of all data.
+    """
+    data = os.urandom(1000)
+    incremental = algorithm.new()
+    for position in range(0, len(data), chunk_size):
+        incremental.update(data[position: position + chunk_size])
+
+    assert incremental.value == reference(algorithm)(data)
+    assert incremental.digest() == algorithm.digest(data)
+    assert algorithm.new(data).value == algorithm(data)
+
+
+@pytest.mark.parametrize("data", [b"AA1AA-0", memoryview(b"AA1AA-0"), bytearray(b"AA1AA-0")])
+def test_bytes_like_input(data):
+    """
+    bytearray and memoryview are accepted like bytes.
+    """
+    for algorithm in (crc.CRC8, crc.CRC16, crc.CRC24, crc.CRC32):
+        assert algorithm(data) == algorithm(b"AA1AA-0")
+
+
+if __name__ == "__main__":
+    # Run pytest with the current script as the filename.
+    ecode = pytest.main(["-v", sys.argv[0]])
+    if ecode == 0:
+        print("errors: 0")
+    else:
+        print(ecode)
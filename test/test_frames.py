@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit test of the received frame view, its address filter and the frame pool.
+
+Can be invoked from CMake, pytest, coverage or directly.
+
+Uses no other files.
+"""
+
+import ctypes
+import sys
+
+import frames
+import helpers
+import pytest
+from frames import ReceivedFrame
+from static import FRAME_TYPE as FR_TYPE
+from static import Station
+
+MYCALLSIGN = b"AA1AA-0"
+DXCALLSIGN = b"ZZ9ZZA-0"
+FRAME_SIZE = 14
+
+
+def build_frame(*fields: bytes) -> bytes:
+    """Frame padded to FRAME_SIZE with a dummy CRC16 at the end"""
+    frame = b"".join(fields)
+    return frame + bytes(FRAME_SIZE - len(frame)) + b"\xCC\xCC"
+
+
+def signalling_frame(frametype: FR_TYPE, callsign: bytes) -> bytes:
+    """frame type + destination CRC + origin CRC"""
+    return build_frame(
+        bytes([frametype.value]), helpers.get_crc_24(callsign), helpers.get_crc_24(DXCALLSIGN)
+    )
+
+
+def data_frame(session_id: bytes) -> bytes:
+    """frame type + session id + payload"""
+    return build_frame(bytes([FR_TYPE.BURST_01.value]), session_id, b"\x55" * 8)
+
+
+@pytest.fixture(autouse=True)
+def ssid_list():
+    Station.ssid_list = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+
+
+def test_view():
+    """
+    The CRC16 is stripped and fields are read from the frame.
+    """
+    data = signalling_frame(FR_TYPE.ARQ_SESSION_OPEN, MYCALLSIGN)
+    frame = ReceivedFrame(data)
+
+    assert len(frame) == FRAME_SIZE
+    assert bytes(frame) == data[:-2]
+    assert frame.hex() == data[:-2].hex()
+    assert frame.frametype == FR_TYPE.ARQ_SESSION_OPEN.value
+    assert frame.signalling_crc == helpers.get_crc_24(MYCALLSIGN)
+    assert frame.data_crc == data[2:5]
+    assert bytes(ReceivedFrame(data, crc_size=0)) == data
+
+
+def test_ctypes_buffer():
+    """
+    Frames are read from modem buffers without copying.
+    """
+    data = signalling_frame(FR_TYPE.ARQ_SESSION_OPEN, MYCALLSIGN)
+    buffer = ctypes.create_string_buffer(data, len(data))
+    frame = ReceivedFrame(buffer)
+
+    assert bytes(frame) == data[:-2]
+    buffer[0] = FR_TYPE.ARQ_SESSION_CLOSE.value
+    assert frame.frametype == FR_TYPE.ARQ_SESSION_CLOSE.value
+
+
+@pytest.mark.parametrize("frametype", sorted(frames.BROADCAST_FRAME_TYPES))
+def test_broadcast(frametype: int):
+    """
+    Broadcasts are processed regardless of callsign and session id.
+    """
+    frame = ReceivedFrame(build_frame(bytes([frametype])))
+
+    assert frame.is_for_station(MYCALLSIGN, None)
+    assert frame.is_for_station(MYCALLSIGN, b"\x01")
+
+
+def test_signalling_crc():
+    """
+    Signalling frames have the callsign CRC at [1:4].
+    """
+    assert ReceivedFrame(signalling_frame(FR_TYPE.ARQ_SESSION_OPEN, MYCALLSIGN)).is_for_station(MYCALLSIGN, None)
+    assert ReceivedFrame(signalling_frame(FR_TYPE.ARQ_SESSION_OPEN, b"AA1AA-7")).is_for_station(MYCALLSIGN, None)
+    assert not ReceivedFrame(signalling_frame(FR_TYPE.ARQ_SESSION_OPEN, b"DE2DE-0")).is_for_station(MYCALLSIGN, None)
+
+
+def test_data_crc():
+    """
+    ARQ data frames have the callsign CRC at [2:5].
+    """
+    frame = ReceivedFrame(build_frame(bytes([FR_TYPE.ARQ_DC_OPEN_W.value, 0x55]), helpers.get_crc_24(MYCALLSIGN)))
+    foreign = ReceivedFrame(build_frame(bytes([FR_TYPE.ARQ_DC_OPEN_W.value, 0x55]), helpers.get_crc_24(b"DE2DE-0")))
+
+    assert frame.is_for_station(MYCALLSIGN, None)
+    assert not foreign.is_for_station(MYCALLSIGN, None)
+
+
+@pytest.mark.parametrize("session_id", [b"\x00", b"\x01", b"\xff"])
+def test_session_id(session_id: bytes):
+    """
+    Frames of our session are processed, the session id is at [1] or [2].
+    Session id 0 is valid, too.
+    """
+    signalling = ReceivedFrame(build_frame(bytes([FR_TYPE.ARQ_SESSION_HB.value]), session_id, b"\x55" * 8))
+    data = ReceivedFrame(data_frame(session_id))
+
+    assert signalling.is_for_station(MYCALLSIGN, session_id)
+    assert data.is_for_station(MYCALLSIGN, session_id)
+
+
+def test_session_id_without_session():
+    """
+    Without a session, frames are not accepted by session id, not even 0.
+    """
+    assert not ReceivedFrame(data_frame(b"\x00")).is_for_station(MYCALLSIGN, None)
+    assert not ReceivedFrame(data_frame(b"\x01")).is_for_station(MYCALLSIGN, None)
+
+
+def test_foreign_session_id():
+    assert not ReceivedFrame(data_frame(b"\x02")).is_for_station(MYCALLSIGN, b"\x01")
+    assert not ReceivedFrame(data_frame(b"\x01")).is_for_station(MYCALLSIGN, b"\x00")
+
+
+def test_frame_type_name():
+    assert frames.frame_type_name(FR_TYPE.BEACON.value) == "BEACON"
+    assert frames.frame_type_name(99) == "99"
+
+
+def test_pool_preallocate():
+    """
+    Preallocated buffers are handed out before new ones are allocated.
+    """
+    pool = frames.FramePool(max_free=4)
+    pool.preallocate(FRAME_SIZE, 8)
+    assert len(pool.free[FRAME_SIZE]) == 4
+
+    buffers = [pool.acquire(FRAME_SIZE) for _ in range(5)]
+    assert len(pool.free[FRAME_SIZE]) == 0
+    assert all(len(buffer) == FRAME_SIZE for buffer in buffers)
+    assert len({id(buffer) for buffer in buffers}) == 5
+
+
+def test_pool_reuse():
+    """
+    Released buffers are reused for frames of the same size only.
+    """
+    pool = frames.FramePool()
+    buffer = pool.acquire(FRAME_SIZE)
+    pool.release(buffer)
+
+    assert pool.acquire(FRAME_SIZE) is buffer
+    assert pool.acquire(FRAME_SIZE) is not buffer
+    pool.release(buffer)
+    assert pool.acquire(FRAME_SIZE + 1) is not buffer
+    assert len(pool.free[FRAME_SIZE]) == 1
+
+
+def test_pool_max_free():
+    """
+    Only max_free buffers per size are kept after a burst of frames.
+    """
+    pool = frames.FramePool(max_free=2)
+    buffers = [pool.acquire(FRAME_SIZE) for _ in range(5)]
+    for buffer in buffers:
+        pool.release(buffer)
+
+    assert len(pool.free[FRAME_SIZE]) == 2
+
+
+@pytest.mark.parametrize("buffer", [bytes(FRAME_SIZE), bytearray(FRAME_SIZE), None])
+def test_pool_ignores_other_objects(buffer):
+    """
+    Frames which don't come from the pool, e.g. of demodulator processes, are ignored.
+    """
+    pool = frames.FramePool()
+    pool.release(buffer)
+
+    assert pool.free == {}
+
+
+if __name__ == "__main__":
+    # Run pytest with the current script as the filename.
+    ecode = pytest.main(["-v", sys.argv[0]])
+    if ecode == 0:
+        print("errors: 0")
+    else:
+        print(ecode)
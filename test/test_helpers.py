@@ -89,6 +89,66 @@ def test_invalid_grid(gridsq: str):
     assert gridsq.upper() != griddec
 
 
+CALLS = ["AA1AA-2", "DE2DE-0", "e4awq-4", "DJ2LS", "N2KIQ-15", "K1A", "0Z", "A"]
+GRIDS = ["EM98dc", "DE01GG", "EF42sW", "JN48ea", "AA00aa", "RR99xx"]
+
+
+def test_encode_calls():
+    """
+    Bulk encoding of call signs gives the same code words as encode_call.
+    """
+    code_words = helpers.encode_calls(CALLS)
+
+    assert code_words.shape == (len(CALLS), 6)
+    for call, code_word in zip(CALLS, code_words):
+        assert code_word.tobytes() == helpers.encode_call(call)
+
+
+def test_decode_calls():
+    """
+    Bulk decoding of call signs from an array or bytes works like decode_call.
+    """
+    expected = [helpers.decode_call(helpers.encode_call(call)) for call in CALLS]
+    code_words = helpers.encode_calls(CALLS)
+
+    assert helpers.decode_calls(code_words) == expected
+    assert helpers.decode_calls(code_words.tobytes()) == expected
+    assert helpers.decode_calls(bytes(6)) == [helpers.decode_call(bytes(6))]
+
+
+def test_encode_calls_too_long():
+    with pytest.raises(ValueError):
+        helpers.encode_calls(["AA1AAAA-2"])
+
+
+def test_encode_grids():
+    """
+    Bulk encoding of grid locators gives the same code words as encode_grid.
+    """
+    code_words = helpers.encode_grids(GRIDS)
+
+    assert code_words.shape == (len(GRIDS), 4)
+    for grid, code_word in zip(GRIDS, code_words):
+        assert code_word.tobytes() == helpers.encode_grid(grid)
+
+
+def test_decode_grids():
+    """
+    Bulk decoding of grid locators from an array or bytes works like decode_grid.
+    """
+    expected = [helpers.decode_grid(helpers.encode_grid(grid)) for grid in GRIDS]
+    code_words = helpers.encode_grids(GRIDS)
+
+    assert helpers.decode_grids(code_words) == expected
+    assert helpers.decode_grids(code_words.tobytes()) == expected
+    assert expected == [grid.upper() for grid in GRIDS]
+
+
+def test_encode_grids_invalid_length():
+    with pytest.raises(ValueError):
+        helpers.encode_grids(["JN48"])
+
+
 if __name__ == "__main__":
     # Run pytest with the current script as the filename.
     ecode = pytest.main(["-v", sys.argv[0]])
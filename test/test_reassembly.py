@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit test of the ARQ data frame reassembly buffer.
+
+Can be invoked from CMake, pytest, coverage or directly.
+
+Uses no other files.
+"""
+
+import sys
+
+import pytest
+from reassembly import ReassemblyBuffer
+
+BOF = b"BOF"
+EOF = b"EOF"
+
+
+def build_data_frame(payload: bytes, total_bytes: int = None) -> bytes:
+    """
+    Create a data frame BOF + header + payload + EOF, the header is
+    crc32 (4) + total bytes (4) + compression factor (1) + codec (1)
+    """
+    if total_bytes is None:
+        total_bytes = len(payload)
+    header = bytes(4) + total_bytes.to_bytes(4, "big") + bytes([10, 0])
+    return BOF + header + payload + EOF
+
+
+def split(data: bytes, size: int) -> list:
+    return [data[i: i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("burst_size", [1, 5, 16, 1000])
+def test_in_order_bursts(burst_size: int):
+    """
+    Bursts appended in order reassemble the data frame.
+    """
+    payload = bytes(range(256)) * 2
+    frame = build_data_frame(payload)
+    buffer = ReassemblyBuffer(BOF, EOF, capacity=16)
+
+    for burst in split(frame, burst_size):
+        buffer.append(burst)
+
+    assert bytes(buffer) == frame
+    assert buffer.bof_position == 0
+    assert buffer.eof_position == len(frame) - len(EOF)
+    assert buffer.header_received
+    assert buffer.header() == frame[len(BOF): len(BOF) + ReassemblyBuffer.HEADER_SIZE]
+    assert buffer.payload()[ReassemblyBuffer.HEADER_SIZE:] == payload
+    assert buffer.endswith(EOF)
+
+
+def test_repeated_burst():
+    """
+    A repeated burst is written at its offset again and drops data after it.
+    """
+    frame = build_data_frame(b"A" * 20 + b"B" * 20)
+    bursts = split(frame, 10)
+    buffer = ReassemblyBuffer(BOF, EOF)
+
+    for burst in bursts[:3]:
+        buffer.append(burst)
+    assert buffer.find_burst(bursts[2][:4], search_area=30) == 20
+
+    # the last burst again, e.g. after a lost ACK
+    buffer.write(20, bursts[2])
+    assert len(buffer) == 30
+    assert bytes(buffer) == frame[:30]
+    assert buffer.burst_offsets == [0, 10, 20]
+
+    # an earlier burst again, data after it is dropped
+    buffer.write(10, bursts[1])
+    assert len(buffer) == 20
+    assert buffer.burst_offsets == [0, 10]
+
+    for burst in bursts[2:]:
+        buffer.append(burst)
+    assert bytes(buffer) == frame
+    assert buffer.eof_position == len(frame) - len(EOF)
+
+
+def test_markers_split_across_bursts():
+    """
+    BOF and EOF are found if they are split across bursts.
+    """
+    buffer = ReassemblyBuffer(BOF, EOF)
+    buffer.append(b"B")
+    assert buffer.bof_position == -1
+    buffer.append(b"O")
+    assert buffer.bof_position == -1
+    buffer.append(b"F" + bytes(4) + (3).to_bytes(4, "big") + bytes([10, 0]) + b"xyzE")
+    assert buffer.bof_position == 0
+    assert buffer.header_received
+    assert buffer.eof_position == -1
+    buffer.append(b"O")
+    assert buffer.eof_position == -1
+    buffer.append(b"F")
+    assert buffer.eof_position == len(buffer) - len(EOF)
+    assert buffer.payload()[ReassemblyBuffer.HEADER_SIZE:] == b"xyz"
+
+
+def test_bof_overwritten():
+    """
+    Rewriting the burst holding BOF forgets the found position.
+    """
+    buffer = ReassemblyBuffer(BOF, EOF)
+    buffer.append(b"xxBOF")
+    assert buffer.bof_position == 2
+    buffer.write(0, b"xxBOx")
+    assert buffer.bof_position == -1
+    assert not buffer.header_received
+
+
+def test_reserve_from_header():
+    """
+    The whole frame is allocated as soon as the header arrived.
+    """
+    buffer = ReassemblyBuffer(BOF, EOF, capacity=16)
+    frame = build_data_frame(bytes(10000))
+    buffer.append(frame[:20])
+    assert len(buffer.buffer) >= len(frame)
+
+    capacity = len(buffer.buffer)
+    for burst in split(frame[20:], 100):
+        buffer.append(burst)
+    assert len(buffer.buffer) == capacity
+    assert bytes(buffer) == frame
+
+
+def test_reserve_over_limit():
+    """
+    The header is not protected by a CRC yet, so allocation is limited.
+    """
+    buffer = ReassemblyBuffer(BOF, EOF, capacity=16)
+    buffer.append(build_data_frame(b"", total_bytes=0xFFFFFFFF)[:20])
+    assert buffer.header_received
+    assert len(buffer.buffer) <= ReassemblyBuffer.MAX_RESERVE
+
+
+def test_eof_only_after_payload():
+    """
+    EOF is only searched after BOF, so EOF in front of BOF doesn't end
+    the frame. The frame ends with the first EOF after BOF.
+    """
+    buffer = ReassemblyBuffer(BOF, EOF)
+    buffer.append(b"EOF" + build_data_frame(b"payload")[:-len(EOF)])
+    assert buffer.bof_position == 3
+    assert buffer.eof_position == -1
+
+    buffer.append(EOF)
+    assert buffer.eof_position == len(buffer) - len(EOF)
+    assert buffer.payload()[ReassemblyBuffer.HEADER_SIZE:] == b"payload"
+
+
+def test_clear():
+    """
+    clear keeps the allocated buffer for the next frame.
+    """
+    buffer = ReassemblyBuffer(BOF, EOF, capacity=16)
+    buffer.append(build_data_frame(bytes(1000)))
+    capacity = len(buffer.buffer)
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.bof_position == -1
+    assert buffer.eof_position == -1
+    assert buffer.burst_offsets == []
+    assert len(buffer.buffer) == capacity
+
+
+if __name__ == "__main__":
+    # Run pytest with the current script as the filename.
+    ecode = pytest.main(["-v", sys.argv[0]])
+    if ecode == 0:
+        print("errors: 0")
+    else:
+        print(ecode)
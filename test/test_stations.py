@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unit test of the heard stations table.
+
+Can be invoked from CMake, pytest, coverage or directly.
+
+Uses no other files.
+"""
+
+import sys
+
+import pytest
+import stations
+from stations import HeardStations
+
+
+def add(heard: HeardStations, dxcallsign: bytes, snr: int = 0):
+    heard.add(dxcallsign, b"JN48ea", "BEACON", snr, 0, 14093000)
+
+
+def callsigns(items) -> list:
+    return [station.dxcallsign for station in items]
+
+
+def test_update_moves_to_end():
+    """
+    Stations are kept in least recently heard order, updates change the data.
+    """
+    heard = HeardStations()
+    for dxcallsign in (b"AA1AA", b"BB1BB", b"CC1CC"):
+        add(heard, dxcallsign)
+    add(heard, b"AA1AA", snr=5)
+
+    assert callsigns(heard) == [b"BB1BB", b"CC1CC", b"AA1AA"]
+    assert len(heard) == 3
+    assert list(heard)[-1].snr == 5
+
+
+def test_first_heard_order():
+    """
+    Clients get the stations in the order we heard them first.
+    """
+    heard = HeardStations()
+    for dxcallsign in (b"AA1AA", b"BB1BB", b"CC1CC", b"AA1AA", b"BB1BB"):
+        add(heard, dxcallsign)
+
+    assert callsigns(heard.first_heard_order()) == [b"AA1AA", b"BB1BB", b"CC1CC"]
+
+
+def test_max_size():
+    """
+    The least recently heard station is dropped if the table is full.
+    """
+    heard = HeardStations(max_size=2)
+    add(heard, b"AA1AA")
+    add(heard, b"BB1BB")
+    add(heard, b"AA1AA")
+    add(heard, b"CC1CC")
+
+    assert callsigns(heard) == [b"AA1AA", b"CC1CC"]
+
+
+def test_ttl(monkeypatch):
+    """
+    Stations which haven't been heard within ttl seconds are dropped.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(stations.time, "time", lambda: now[0])
+    heard = HeardStations(ttl=60)
+    add(heard, b"AA1AA")
+    now[0] += 30
+    add(heard, b"BB1BB")
+
+    now[0] += 31
+    heard.expire()
+    assert callsigns(heard) == [b"BB1BB"]
+
+    now[0] += 30
+    heard.expire()
+    assert len(heard) == 0
+
+
+def test_changes():
+    """
+    The change counter only changes if the table changed.
+    """
+    heard = HeardStations(ttl=60)
+    changes = heard.changes
+
+    add(heard, b"AA1AA")
+    assert heard.changes > changes
+    changes = heard.changes
+
+    heard.expire()
+    assert heard.changes == changes
+
+    add(heard, b"AA1AA")
+    assert heard.changes > changes
+    changes = heard.changes
+
+    heard.clear()
+    assert heard.changes > changes
+    assert len(heard) == 0
+
+
+def test_snapshot():
+    """
+    Iterating works on a snapshot, so the table can change meanwhile.
+    """
+    heard = HeardStations()
+    add(heard, b"AA1AA")
+    add(heard, b"BB1BB")
+
+    for station in heard:
+        add(heard, station.dxcallsign + b"-1")
+    assert len(heard) == 4
+
+
+if __name__ == "__main__":
+    # Run pytest with the current script as the filename.
+    ecode = pytest.main(["-v", sys.argv[0]])
+    if ecode == 0:
+        print("errors: 0")
+    else:
+        print(ecode)
@@ -4,7 +4,7 @@ Gather information about audio devices.
 import atexit
 import multiprocessing
 
-import crcengine
+import crc
 import sounddevice as sd
 import structlog
 
@@ -13,7 +13,7 @@ atexit.register(sd._terminate)
 log = structlog.get_logger("audio")
 
 # crc algorithm for unique audio device names
-crc_algorithm = crcengine.new("crc16-ccitt-false")  # load crc16 library
+crc_algorithm = crc.CRC16
 
 
 def get_audio_devices():
@@ -10,8 +10,8 @@ import ctypes
 import glob
 import os
 import sys
+import threading
 from enum import Enum
-from threading import Lock
 
 import numpy as np
 import structlog
@@ -99,9 +99,11 @@ else:
     files = []
 
 api = None
+codec2_file = None
 for file in files:
     try:
         api = ctypes.CDLL(file)
+        codec2_file = file
         log.info("[C2 ] Libcodec2 loaded", path=file)
         break
     except OSError as err:
@@ -113,63 +115,110 @@ if api is None or "api" not in locals():
     sys.exit(1)
 
 # ctypes function init
+# Prototypes as (restype, argtypes). Setting argtypes lets ctypes check and
+# convert arguments once per call instead of guessing them. Buffers are
+# passed as c_void_p, which accepts ctypes arrays, bytes, byref() and
+# numpy .ctypes objects.
+prototypes = {
+    "freedv_open": (ctypes.c_void_p, [ctypes.c_int]),
+    "freedv_open_advanced": (ctypes.c_void_p, [ctypes.c_int, ctypes.c_void_p]),
+    "freedv_set_sync": (None, [ctypes.c_void_p, ctypes.c_int]),
+    "freedv_set_frames_per_burst": (None, [ctypes.c_void_p, ctypes.c_int]),
+    "freedv_set_tuning_range": (None, [ctypes.c_void_p, ctypes.c_float, ctypes.c_float]),
+    "freedv_get_bits_per_modem_frame": (ctypes.c_int, [ctypes.c_void_p]),
+    "freedv_get_modem_extended_stats": (None, [ctypes.c_void_p, ctypes.c_void_p]),
+    "freedv_get_modem_stats": (None, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
+    "freedv_nin": (ctypes.c_int, [ctypes.c_void_p]),
+    "freedv_get_rx_status": (ctypes.c_int, [ctypes.c_void_p]),
+    "freedv_rawdatarx": (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
+    "freedv_rawdatatx": (None, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]),
+    "freedv_rawdatapreambletx": (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    "freedv_rawdatapostambletx": (ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p]),
+    "freedv_gen_crc16": (ctypes.c_ushort, [ctypes.c_void_p, ctypes.c_int]),
+    "freedv_get_n_max_modem_samples": (ctypes.c_int, [ctypes.c_void_p]),
+    "freedv_get_n_nom_modem_samples": (ctypes.c_int, [ctypes.c_void_p]),
+    "freedv_get_n_tx_modem_samples": (ctypes.c_int, [ctypes.c_void_p]),
+    "freedv_get_n_tx_preamble_modem_samples": (ctypes.c_int, [ctypes.c_void_p]),
+    "freedv_get_n_tx_postamble_modem_samples": (ctypes.c_int, [ctypes.c_void_p]),
+    "fdmdv_8_to_48_short": (None, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]),
+    "fdmdv_48_to_8_short": (None, [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]),
+}
+for function_name, (restype, argtypes) in prototypes.items():
+    function = getattr(api, function_name)
+    function.restype = restype
+    function.argtypes = argtypes
+
+# Optional helper library combining the calls needed for every demodulated
+# block, built from tnc/freedata_rx via CMake. It's linked against libcodec2,
+# so it's only loaded from the directory of the loaded libcodec2 or, if
+# libcodec2 has been found by the system loader, by the system loader too.
+# Otherwise it could use another libcodec2 than the codec2 instances it gets
+if sys.platform == "linux":
+    rx_pattern, rx_name = "*freedata_rx*.so", "libfreedata_rx.so"
+elif sys.platform == "darwin":
+    rx_pattern, rx_name = "*freedata_rx*.dylib", "libfreedata_rx.dylib"
+elif sys.platform in ["win32", "win64"]:
+    rx_pattern, rx_name = "*freedata_rx*.dll", "freedata_rx.dll"
+else:
+    rx_pattern, rx_name = None, None
 
-# api.freedv_set_tuning_range.restype = ctypes.c_int
-# api.freedv_set_tuning_range.argype = [ctypes.c_void_p, ctypes.c_float, ctypes.c_float]
-
-api.freedv_open.argype = [ctypes.c_int]  # type: ignore
-api.freedv_open.restype = ctypes.c_void_p
-
-api.freedv_set_sync.argype = [ctypes.c_void_p, ctypes.c_int]  # type: ignore
-api.freedv_set_sync.restype = ctypes.c_void_p
-
-api.freedv_open_advanced.argtype = [ctypes.c_int, ctypes.c_void_p]  # type: ignore
-api.freedv_open_advanced.restype = ctypes.c_void_p
-
-api.freedv_get_bits_per_modem_frame.argtype = [ctypes.c_void_p]  # type: ignore
-api.freedv_get_bits_per_modem_frame.restype = ctypes.c_int
-
-api.freedv_get_modem_extended_stats.argtype = [ctypes.c_void_p, ctypes.c_void_p]
-api.freedv_get_modem_extended_stats.restype = ctypes.c_int
-
-api.freedv_nin.argtype = [ctypes.c_void_p]  # type: ignore
-api.freedv_nin.restype = ctypes.c_int
-
-api.freedv_rawdatarx.argtype = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]  # type: ignore
-api.freedv_rawdatarx.restype = ctypes.c_int
-
-api.freedv_rawdatatx.argtype = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]  # type: ignore
-api.freedv_rawdatatx.restype = ctypes.c_int
-
-api.freedv_rawdatapostambletx.argtype = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]  # type: ignore
-api.freedv_rawdatapostambletx.restype = ctypes.c_int
-
-api.freedv_rawdatapreambletx.argtype = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]  # type: ignore
-api.freedv_rawdatapreambletx.restype = ctypes.c_int
-
-api.freedv_get_n_max_modem_samples.argtype = [ctypes.c_void_p]  # type: ignore
-api.freedv_get_n_max_modem_samples.restype = ctypes.c_int
-
-api.freedv_set_frames_per_burst.argtype = [ctypes.c_void_p, ctypes.c_int]  # type: ignore
-api.freedv_set_frames_per_burst.restype = ctypes.c_void_p
+if rx_pattern is None:
+    rx_files = []
+elif os.path.dirname(codec2_file):
+    rx_files = glob.glob(os.path.join(os.path.dirname(codec2_file), rx_pattern))
+else:
+    rx_files = [rx_name]
 
-api.freedv_get_rx_status.argtype = [ctypes.c_void_p]  # type: ignore
-api.freedv_get_rx_status.restype = ctypes.c_int
+rx_api = None
+for file in rx_files:
+    try:
+        rx_api = ctypes.CDLL(file)
+        rx_api.freedata_rx_step.restype = ctypes.c_int
+        rx_api.freedata_rx_step.argtypes = [ctypes.c_void_p] * 5
+        log.info("[C2 ] freedata_rx loaded", path=file)
+        break
+    except (OSError, AttributeError) as err:
+        rx_api = None
+        log.warning("[C2 ] freedata_rx found but not loaded", path=file, e=err)
 
-api.freedv_get_modem_stats.argtype = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]  # type: ignore
-api.freedv_get_modem_stats.restype = ctypes.c_int
+if rx_api is not None:
+    def rx_step(freedv, bytes_out, demod_in, rx_status, nin) -> int:
+        """
+        Demodulate one block and get the new modem state with a single call
 
-api.freedv_get_n_tx_postamble_modem_samples.argtype = [ctypes.c_void_p]  # type: ignore
-api.freedv_get_n_tx_postamble_modem_samples.restype = ctypes.c_int
+        Args:
+            freedv: codec2 instance
+            bytes_out: buffer for the received frame
+            demod_in: nin samples of audio
+            rx_status: ctypes.c_int, set to the rx status
+            nin: ctypes.c_int, set to nin for the next block
 
-api.freedv_get_n_tx_preamble_modem_samples.argtype = [ctypes.c_void_p]  # type: ignore
-api.freedv_get_n_tx_preamble_modem_samples.restype = ctypes.c_int
+        Returns:
+            number of bytes received
+        """
+        return rx_api.freedata_rx_step(
+            freedv, bytes_out, demod_in, ctypes.byref(rx_status), ctypes.byref(nin)
+        )
+else:
+    def rx_step(freedv, bytes_out, demod_in, rx_status, nin) -> int:
+        """
+        Demodulate one block and get the new modem state,
+        fallback if freedata_rx is not available
 
-api.freedv_get_n_tx_modem_samples.argtype = [ctypes.c_void_p]  # type: ignore
-api.freedv_get_n_tx_modem_samples.restype = ctypes.c_int
+        Args:
+            freedv: codec2 instance
+            bytes_out: buffer for the received frame
+            demod_in: nin samples of audio
+            rx_status: ctypes.c_int, set to the rx status
+            nin: ctypes.c_int, set to nin for the next block
 
-api.freedv_get_n_max_modem_samples.argtype = [ctypes.c_void_p]  # type: ignore
-api.freedv_get_n_max_modem_samples.restype = ctypes.c_int
+        Returns:
+            number of bytes received
+        """
+        nbytes = api.freedv_rawdatarx(freedv, bytes_out, demod_in)
+        rx_status.value = api.freedv_get_rx_status(freedv)
+        nin.value = api.freedv_nin(freedv)
+        return nbytes
 
 api.FREEDV_FS_8000 = 8000  # type: ignore
 
@@ -295,36 +344,120 @@ api.rx_sync_flags_to_text = [  # type: ignore
 # Audio buffer ---------------------------------------------------------
 class audio_buffer:
     """
-    Thread-safe audio buffer, which fits the needs of codec2
+    Single producer / multi consumer ring buffer, which fits the needs of codec2
 
-    made by David Rowe, VK5DGR
+    Samples are stored twice in a mirrored array of 2 * size, so every reader
+    gets a contiguous view starting at its read position which can be handed
+    to codec2 as a flat pointer without copying. Pushing only advances the
+    write position and popping only advances the read position of the
+    respective reader, so no memmove and no lock is needed.
+
+    based on the audio buffer made by David Rowe, VK5DGR
     """
 
-    # A buffer of int16 samples, using a fixed length numpy array self.buffer for storage
-    # self.nbuffer is the current number of samples in the buffer
-    def __init__(self, size):
+    # self.head is the total number of samples written to the buffer
+    # self.nbuffer is the current number of samples in the buffer for the default reader
+    def __init__(self, size, default_reader=True):
         log.debug("[C2 ] Creating audio buffer", size=size)
         self.size = size
-        self.buffer = np.zeros(size, dtype=np.int16)
-        self.nbuffer = 0
-        self.mutex = Lock()
+        self.storage = np.zeros(2 * size, dtype=np.int16)
+        self.head = 0
+        self.overflows = 0
+        self.readers = []
+        # default reader for keeping the old single consumer interface
+        # shared buffers with a reader per demodulator don't need it
+        self.reader = self.add_reader() if default_reader else None
+
+    def add_reader(self):
+        """
+        Add a new read cursor, starting at the current write position
+
+        Returns:
+            audio_buffer_reader
+        """
+        reader = audio_buffer_reader(self)
+        # replace the list instead of appending for lock free iteration in push
+        self.readers = self.readers + [reader]
+        return reader
+
+    def remove_reader(self, reader):
+        """
+        Remove a read cursor
+
+        Args:
+            reader: audio_buffer_reader
+        """
+        self.readers = [item for item in self.readers if item is not reader]
+
+    def view(self, tail):
+        """
+        Contiguous view of size samples, starting at read position tail
+
+        Args:
+            tail: absolute read position
+
+        Returns:
+            np.int16 array view
+        """
+        start = tail % self.size
+        return self.storage[start : start + self.size]
 
     def push(self, samples):
         """
         Push new data to buffer
 
         Args:
-            samples:
+            samples: at most size samples
 
         Returns:
-            Nothing
+            list of active readers which lost unread samples
         """
-        self.mutex.acquire()
+        length = len(samples)
+        assert length <= self.size
+        # samples are always written, active readers which can't keep up
+        # are overrun and resync on their next read, so a slow demodulator
+        # doesn't make the others lose audio
+        overrun = [
+            reader
+            for reader in self.readers
+            if reader.active and self.head - reader.tail + length > self.size
+        ]
+        for reader in overrun:
+            reader.overflows += 1
+        self.overflows += len(overrun)
         # Add samples at the end of the buffer
-        assert self.nbuffer + len(samples) <= self.size
-        self.buffer[self.nbuffer : self.nbuffer + len(samples)] = samples
-        self.nbuffer += len(samples)
-        self.mutex.release()
+        start = self.head % self.size
+        first = min(length, self.size - start)
+        rest = length - first
+        # write twice, so the buffer is mirrored
+        self.storage[start : start + first] = samples[:first]
+        self.storage[self.size + start : self.size + start + first] = samples[:first]
+        if rest:
+            self.storage[:rest] = samples[first:]
+            self.storage[self.size : self.size + rest] = samples[first:]
+        # publish samples to readers after they have been written
+        self.head += length
+
+        # wake up readers waiting for enough samples
+        for reader in self.readers:
+            if (
+                reader.active
+                and not reader.data_ready.is_set()
+                and self.head - reader.tail >= reader.nin
+            ):
+                reader.data_ready.set()
+
+        return overrun
+
+    @property
+    def buffer(self):
+        """Contiguous view of the default reader"""
+        return self.reader.buffer
+
+    @property
+    def nbuffer(self) -> int:
+        """Number of samples available for the default reader"""
+        return self.reader.nbuffer
 
     def pop(self, size):
         """
@@ -335,12 +468,219 @@ class audio_buffer:
         Returns:
             Nothing
         """
-        self.mutex.acquire()
-        # Remove samples from the start of the buffer
-        self.nbuffer -= size
-        self.buffer[: self.nbuffer] = self.buffer[size : size + self.nbuffer]
-        assert self.nbuffer >= 0
-        self.mutex.release()
+        self.reader.pop(size)
+
+
+class audio_buffer_reader:
+    """
+    Read cursor of an audio buffer
+    """
+
+    def __init__(self, ring: audio_buffer):
+        self.ring = ring
+        self.tail = ring.head
+        # inactive readers are unsubscribed, they don't see new samples
+        self.active = True
+        # number of samples the consumer is waiting for
+        self.nin = 0
+        # number of pushes which overwrote unread samples
+        self.overflows = 0
+        self.data_ready = threading.Event()
+
+    @property
+    def buffer(self):
+        """Contiguous view starting at the read position"""
+        return self.ring.view(self.tail)
+
+    @property
+    def nbuffer(self) -> int:
+        """Number of samples available for this reader"""
+        if not self.active:
+            return 0
+        head = self.ring.head
+        nbuffer = head - self.tail
+        if nbuffer > self.ring.size:
+            # overrun by the producer, continue with the oldest sample
+            # which is still in the buffer
+            self.tail = head - self.ring.size
+            return self.ring.size
+        return nbuffer
+
+    def subscribe(self, active: bool):
+        """
+        (Un)subscribe the reader, a subscribed reader starts with new samples
+
+        Args:
+          active: True for receiving new samples
+        """
+        if active and not self.active:
+            self.flush()
+        self.active = active
+
+    def pop(self, size):
+        """
+        Remove samples from the start of the buffer
+
+        Args:
+          size:
+
+        Returns:
+            Nothing
+        """
+        assert size <= self.ring.head - self.tail
+        self.tail += size
+
+    def wait_for_samples(self, nin, timeout=None) -> bool:
+        """
+        Block until at least nin samples are available
+
+        Args:
+          nin: number of samples needed
+          timeout: maximum time to wait in seconds
+
+        Returns:
+            True if nin samples are available
+        """
+        self.nin = nin
+        while self.nbuffer < nin:
+            self.data_ready.clear()
+            # check again, samples might have been pushed before clearing
+            if self.nbuffer >= nin:
+                break
+            if not self.data_ready.wait(timeout):
+                return self.nbuffer >= nin
+        return True
+
+    def flush(self):
+        """Skip all buffered samples"""
+        self.tail = self.ring.head
+
+
+class shared_audio_buffer(audio_buffer):
+    """
+    Audio buffer in shared memory, so demodulators running in
+    other processes can read from it
+
+    The write position and the tail, subscription state and requested nin
+    of every reader are kept in a control block in front of the samples.
+    """
+
+    def __init__(self, size, max_readers, name=None):
+        # python 3.8+, only needed for demodulator processes
+        from multiprocessing import shared_memory
+
+        log.debug("[C2 ] Creating shared audio buffer", size=size, name=name)
+        self.size = size
+        self.max_readers = max_readers
+        control_size = 1 + 3 * max_readers
+        if name is None:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=8 * control_size + 2 * 2 * size
+            )
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        # [head, tail * max_readers, active * max_readers, nin * max_readers]
+        self.control = np.ndarray(
+            (control_size,), dtype=np.int64, buffer=self.shm.buf
+        )
+        self.storage = np.ndarray(
+            (2 * size,), dtype=np.int16, buffer=self.shm.buf, offset=8 * control_size
+        )
+        if name is None:
+            self.control[:] = 0
+            self.storage[:] = 0
+        self.overflows = 0
+        self.readers = []
+        self.reader = None
+
+    @property
+    def head(self) -> int:
+        return int(self.control[0])
+
+    @head.setter
+    def head(self, value):
+        self.control[0] = value
+
+    def add_reader(self, data_ready=None):
+        """
+        Add a new read cursor in the lowest free slot
+
+        Args:
+            data_ready: event shared with the reading process
+
+        Returns:
+            shared_audio_buffer_reader
+        """
+        used_slots = {reader.slot for reader in self.readers}
+        free_slots = [slot for slot in range(self.max_readers) if slot not in used_slots]
+        assert free_slots, "no free reader slot"
+        slot = free_slots[0]
+        reader = shared_audio_buffer_reader(self, slot, data_ready)
+        reader.flush()
+        reader.active = True
+        self.readers = self.readers + [reader]
+        return reader
+
+    def remove_reader(self, reader):
+        """
+        Remove a read cursor and free its slot
+
+        Args:
+            reader: shared_audio_buffer_reader
+        """
+        reader.active = False
+        super().remove_reader(reader)
+
+    def close(self):
+        """Release shared memory of an attached process"""
+        self.storage = None
+        self.control = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Remove shared memory, it stays mapped until the creating process exits
+        """
+        self.shm.unlink()
+
+
+class shared_audio_buffer_reader(audio_buffer_reader):
+    """
+    Read cursor of a shared audio buffer, usable from another process
+    """
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, ring: shared_audio_buffer, slot, data_ready=None):
+        self.ring = ring
+        self.slot = slot
+        # counted by the producer, so only valid in the main process
+        self.overflows = 0
+        self.data_ready = data_ready if data_ready is not None else threading.Event()
+
+    @property
+    def tail(self) -> int:
+        return int(self.ring.control[1 + self.slot])
+
+    @tail.setter
+    def tail(self, value):
+        self.ring.control[1 + self.slot] = value
+
+    @property
+    def active(self) -> bool:
+        return bool(self.ring.control[1 + self.ring.max_readers + self.slot])
+
+    @active.setter
+    def active(self, value):
+        self.ring.control[1 + self.ring.max_readers + self.slot] = bool(value)
+
+    @property
+    def nin(self) -> int:
+        return int(self.ring.control[1 + 2 * self.ring.max_readers + self.slot])
+
+    @nin.setter
+    def nin(self, value):
+        self.ring.control[1 + 2 * self.ring.max_readers + self.slot] = value
 
 
 # Resampler ---------------------------------------------------------
@@ -351,30 +691,84 @@ api.FDMDV_OS_48 = 6  # type: ignore
 api.FDMDV_OS_TAPS_48K = 48  # type: ignore
 # Number of oversampling filter taps at 8kHz
 api.FDMDV_OS_TAPS_48_8K = api.FDMDV_OS_TAPS_48K // api.FDMDV_OS_48  # type: ignore
-api.fdmdv_8_to_48_short.argtype = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]  # type: ignore
-api.fdmdv_48_to_8_short.argtype = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]  # type: ignore
 
 
 class resampler:
     """
     Re-sampler class
+
+    Work buffers are preallocated and the filter memories are kept in
+    place, so streaming blocks of up to max_n48 samples doesn't allocate
+    anything if an output array is passed via out=
     """
 
     # Re-sample an array of variable length, we just store the filter memories here
     MEM8 = api.FDMDV_OS_TAPS_48_8K
     MEM48 = api.FDMDV_OS_TAPS_48K
 
-    def __init__(self):
-        log.debug("[C2 ] Create 48<->8 kHz resampler")
-        self.filter_mem8 = np.zeros(self.MEM8, dtype=np.int16)
-        self.filter_mem48 = np.zeros(self.MEM48)
+    def __init__(self, max_n48: int = 0):
+        log.debug("[C2 ] Create 48<->8 kHz resampler", max_n48=max_n48)
+        # filter memory followed by the current input block
+        self.in48_mem = np.zeros(self.MEM48 + max_n48, dtype=np.int16)
+        self.in8_mem = np.zeros(
+            self.MEM8 + max_n48 // api.FDMDV_OS_48, dtype=np.int16  # type: ignore
+        )
+        # In C: pin48=&in48_mem[MEM48]
+        self.pin48 = ctypes.c_void_p(self.in48_mem.ctypes.data + 2 * self.MEM48)
+        # In C: pin8=&in8_mem[MEM8]
+        self.pin8 = ctypes.c_void_p(self.in8_mem.ctypes.data + 2 * self.MEM8)
+
+    def reset(self):
+        """Clear filter memories"""
+        self.in48_mem[: self.MEM48] = 0
+        self.in8_mem[: self.MEM8] = 0
 
-    def resample48_to_8(self, in48):
+    @staticmethod
+    def grow(mem, mem_size, length):
+        """
+        Return a larger work buffer if length samples don't fit,
+        keeping the filter memory
+
+        Args:
+            mem: current work buffer
+            mem_size: length of the filter memory
+            length: length of the input block
+
+        Returns:
+            work buffer as np.int16
+        """
+        if len(mem) >= mem_size + length:
+            return mem
+        log.debug("[C2 ] Growing resampler buffer", length=length)
+        new_mem = np.zeros(mem_size + length, dtype=np.int16)
+        new_mem[:mem_size] = mem[:mem_size]
+        return new_mem
+
+    @staticmethod
+    def output_buffer(out, length):
+        """
+        Return the output array for length samples
+
+        Args:
+            out: optional caller provided np.int16 array
+            length: number of output samples
+
+        Returns:
+            np.int16 array of length samples
+        """
+        if out is None:
+            return np.empty(length, dtype=np.int16)
+        assert out.dtype == np.int16 and out.flags.c_contiguous
+        assert len(out) >= length
+        return out[:length]
+
+    def resample48_to_8(self, in48, out=None):
         """
         Audio resampler integration from codec2
         Downsample audio from 48000Hz to 8000Hz
         Args:
             in48: input data as np.int16
+            out: optional np.int16 array for the output, reused by the caller
 
         Returns:
             Downsampled 8000Hz data as np.int16
@@ -383,45 +777,50 @@ class resampler:
         # Length of input vector must be an integer multiple of api.FDMDV_OS_48
         assert len(in48) % api.FDMDV_OS_48 == 0  # type: ignore
 
-        # Concatenate filter memory and input samples
-        in48_mem = np.zeros(self.MEM48 + len(in48), dtype=np.int16)
-        in48_mem[: self.MEM48] = self.filter_mem48
-        in48_mem[self.MEM48 :] = in48
+        n48 = len(in48)
+        n8 = n48 // api.FDMDV_OS_48  # type: ignore
+        in48_mem = self.grow(self.in48_mem, self.MEM48, n48)
+        if in48_mem is not self.in48_mem:
+            self.in48_mem = in48_mem
+            self.pin48 = ctypes.c_void_p(in48_mem.ctypes.data + 2 * self.MEM48)
 
-        # In C: pin48=&in48_mem[MEM48]
-        pin48 = ctypes.byref(np.ctypeslib.as_ctypes(in48_mem), 2 * self.MEM48)
-        n8 = int(len(in48) / api.FDMDV_OS_48)  # type: ignore
-        out8 = np.zeros(n8, dtype=np.int16)
-        api.fdmdv_48_to_8_short(out8.ctypes, pin48, n8)  # type: ignore
+        # Filter memory is already in place, append input samples
+        in48_mem[self.MEM48 : self.MEM48 + n48] = in48
+
+        out8 = self.output_buffer(out, n8)
+        api.fdmdv_48_to_8_short(out8.ctypes, self.pin48, n8)  # type: ignore
 
         # Store memory for next time
-        self.filter_mem48 = in48_mem[: self.MEM48]
+        in48_mem[: self.MEM48] = in48_mem[n48 : n48 + self.MEM48]
 
         return out8
 
-    def resample8_to_48(self, in8):
+    def resample8_to_48(self, in8, out=None):
         """
         Audio resampler integration from codec2
         Re-sample audio from 8000Hz to 48000Hz
         Args:
             in8: input data as np.int16
+            out: optional np.int16 array for the output, reused by the caller
 
         Returns:
             48000Hz audio as np.int16
         """
         assert in8.dtype == np.int16
 
-        # Concatenate filter memory and input samples
-        in8_mem = np.zeros(self.MEM8 + len(in8), dtype=np.int16)
-        in8_mem[: self.MEM8] = self.filter_mem8
-        in8_mem[self.MEM8 :] = in8
+        n8 = len(in8)
+        in8_mem = self.grow(self.in8_mem, self.MEM8, n8)
+        if in8_mem is not self.in8_mem:
+            self.in8_mem = in8_mem
+            self.pin8 = ctypes.c_void_p(in8_mem.ctypes.data + 2 * self.MEM8)
 
-        # In C: pin8=&in8_mem[MEM8]
-        pin8 = ctypes.byref(np.ctypeslib.as_ctypes(in8_mem), 2 * self.MEM8)
-        out48 = np.zeros(api.FDMDV_OS_48 * len(in8), dtype=np.int16)  # type: ignore
-        api.fdmdv_8_to_48_short(out48.ctypes, pin8, len(in8))  # type: ignore
+        # Filter memory is already in place, append input samples
+        in8_mem[self.MEM8 : self.MEM8 + n8] = in8
+
+        out48 = self.output_buffer(out, api.FDMDV_OS_48 * n8)  # type: ignore
+        api.fdmdv_8_to_48_short(out48.ctypes, self.pin8, n8)  # type: ignore
 
         # Store memory for next time
-        self.filter_mem8 = in8_mem[: self.MEM8]
+        in8_mem[: self.MEM8] = in8_mem[n8 : n8 + self.MEM8]
 
         return out48
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+compression.py
+
+Compression of ARQ payloads. The codec id is sent in the data frame header,
+so the receiver knows how to decompress. A sample of the payload is probed
+first, data which is already compressed (jpeg, zip, ...) is sent as it is.
+Data is compressed block by block in a background thread, so compression
+can run while the data channel is being opened.
+"""
+# pylint: disable=invalid-name, line-too-long
+
+import io
+import lzma
+import threading
+import zlib
+from enum import Enum
+
+import crc
+import structlog
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = structlog.get_logger("compression")
+
+# size of blocks read from files and of the probe sample
+BLOCK_SIZE = 65536
+# send uncompressed if the probe sample doesn't shrink below this ratio
+PROBE_MAX_RATIO = 0.9
+# payloads up to this size are compressed with the highest level,
+# larger ones with lower levels for keeping compression time short
+SMALL_PAYLOAD = 65536
+LARGE_PAYLOAD = 4 * 1024 * 1024
+
+
+class CODEC(Enum):
+    """Codec ids used in the data frame header"""
+
+    NONE = 0
+    LZMA = 1
+    ZLIB = 2
+    ZSTD = 3
+
+
+# (fast, default, max) level per codec
+# lzma is limited to preset 6, as higher presets need several hundred MB of ram
+CODEC_LEVELS = {
+    CODEC.LZMA: (1, 6, 6),
+    CODEC.ZLIB: (1, 6, 9),
+    CODEC.ZSTD: (3, 9, 19),
+}
+
+
+def is_supported(codec: CODEC) -> bool:
+    """
+    Check if a codec is available on this system
+
+    Args:
+        codec: CODEC
+
+    Returns:
+        True if data can be compressed and decompressed with this codec
+    """
+    return codec != CODEC.ZSTD or zstandard is not None
+
+
+def select_level(codec: CODEC, total_bytes: int) -> int:
+    """
+    Select the compression level for the size of the payload
+
+    Args:
+        codec: CODEC
+        total_bytes: size of the uncompressed payload
+
+    Returns:
+        compression level or preset of the codec
+    """
+    fast, default, best = CODEC_LEVELS.get(codec, (0, 0, 0))
+    if total_bytes <= SMALL_PAYLOAD:
+        return best
+    if total_bytes <= LARGE_PAYLOAD:
+        return default
+    return fast
+
+
+class PassThrough:
+    """Compressor for CODEC.NONE"""
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def get_compressor(codec: CODEC, level: int):
+    """
+    Create a streaming compressor
+
+    Args:
+        codec: CODEC
+        level: compression level or preset
+
+    Returns:
+        object with compress(data) and flush()
+    """
+    if codec == CODEC.LZMA:
+        return lzma.LZMACompressor(preset=level)
+    if codec == CODEC.ZLIB:
+        return zlib.compressobj(level)
+    if codec == CODEC.ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    if codec == CODEC.NONE:
+        return PassThrough()
+    raise ValueError(f"compression codec not supported: {codec}")
+
+
+def decompress(codec_id: int, data: bytes) -> bytes:
+    """
+    Decompress a received payload
+
+    Args:
+        codec_id: codec id from the data frame header
+        data: compressed payload
+
+    Returns:
+        decompressed payload
+
+    Raises:
+        ValueError if the codec is unknown or not supported
+    """
+    try:
+        codec = CODEC(codec_id)
+    except ValueError as err:
+        raise ValueError(f"unknown compression codec: {codec_id}") from err
+    if not is_supported(codec):
+        raise ValueError(f"compression codec not supported: {codec.name}")
+
+    if codec == CODEC.LZMA:
+        return lzma.decompress(data)
+    if codec == CODEC.ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC.ZSTD:
+        # frames of compressobj don't carry the content size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return bytes(data)
+
+
+def probe(codec: CODEC, sample: bytes) -> bool:
+    """
+    Compress a sample with the fastest level and check if compression is worth it
+
+    Args:
+        codec: CODEC
+        sample: first bytes of the payload
+
+    Returns:
+        True if the sample shrinks enough
+    """
+    if codec == CODEC.NONE or not sample:
+        return False
+    compressor = get_compressor(codec, CODEC_LEVELS[codec][0])
+    compressed_size = len(compressor.compress(sample)) + len(compressor.flush())
+    return compressed_size < len(sample) * PROBE_MAX_RATIO
+
+
+class CompressionJob:
+    """Compress a payload in a background thread"""
+
+    def __init__(self, data, codec: CODEC) -> None:
+        """
+        Args:
+            data: bytes or binary file, files are read in blocks from the current position and closed
+            codec: preferred CODEC, falls back to lzma if not supported
+        """
+        self.data = data
+        if not is_supported(codec):
+            log.warning("[CMP] Compression codec not supported, using lzma", codec=codec.name)
+            codec = CODEC.LZMA
+        self.codec = codec
+        if isinstance(data, (bytes, bytearray)):
+            self.total_bytes = len(data)
+        else:
+            # seek of SpooledTemporaryFile returns None before python 3.11
+            position = data.tell()
+            data.seek(0, io.SEEK_END)
+            self.total_bytes = data.tell() - position
+            data.seek(position)
+        self.compressed = bytearray()
+        # crc32 of the compressed data, calculated while compressing
+        self.crc = crc.CRC32.new()
+        self.error = None
+        self.done = threading.Event()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="compression", daemon=True)
+
+    def start(self) -> "CompressionJob":
+        self.thread.start()
+        return self
+
+    def cancel(self) -> None:
+        """Stop compressing, a file is closed nevertheless"""
+        self.cancelled.set()
+
+    def blocks(self):
+        """Payload in blocks of BLOCK_SIZE"""
+        if isinstance(self.data, (bytes, bytearray)):
+            view = memoryview(self.data)
+            for position in range(0, len(view), BLOCK_SIZE):
+                yield view[position: position + BLOCK_SIZE]
+            return
+        with self.data:
+            while True:
+                block = self.data.read(BLOCK_SIZE)
+                if not block:
+                    return
+                yield block
+
+    def append(self, data: bytes) -> None:
+        """Append compressed data"""
+        self.compressed += data
+        self.crc.update(data)
+
+    def run(self) -> None:
+        blocks = self.blocks()
+        try:
+            sample = next(blocks, b"")
+            if not probe(self.codec, sample):
+                self.codec = CODEC.NONE
+            compressor = get_compressor(self.codec, select_level(self.codec, self.total_bytes))
+
+            total_bytes = len(sample)
+            self.append(compressor.compress(sample))
+            for block in blocks:
+                if self.cancelled.is_set():
+                    break
+                total_bytes += len(block)
+                self.append(compressor.compress(block))
+            self.append(compressor.flush())
+            self.total_bytes = total_bytes
+        except Exception as err:
+            self.error = err
+        finally:
+            # closes the file, also if we have been cancelled
+            blocks.close()
+            self.done.set()
+
+    def result(self) -> tuple:
+        """
+        Wait until compression is finished
+
+        Returns:
+            number of uncompressed bytes, CODEC, compressed data, crc32 of compressed data
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.total_bytes, self.codec, bytes(self.compressed), self.crc.digest()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+crc.py
+
+CRC algorithms used by the TNC. CRC16 and CRC32 use the C implementations
+of binascii and zlib, CRC8 and CRC24 are table driven. All of them can be
+updated incrementally, so a CRC can be calculated while streaming data.
+"""
+# pylint: disable=invalid-name, line-too-long
+
+import binascii
+import zlib
+
+
+def build_table(width: int, poly: int) -> tuple:
+    """
+    Build the lookup table for a non reflected CRC
+
+    Args:
+        width: width of the CRC in bits
+        poly: polynomial
+
+    Returns:
+        tuple of 256 register values
+    """
+    top_bit = 1 << (width - 1)
+    mask = (1 << width) - 1
+    table = []
+    for byte in range(256):
+        register = byte << (width - 8)
+        for _ in range(8):
+            register = (register << 1) ^ poly if register & top_bit else register << 1
+        table.append(register & mask)
+    return tuple(table)
+
+
+class CrcAlgorithm:
+    """A CRC algorithm, calling it returns the CRC of data like crcengine"""
+
+    def __init__(self, name: str, width: int, poly: int, init: int, xor_out: int = 0, update=None) -> None:
+        """
+        Args:
+            name: name of the algorithm
+            width: width of the CRC in bits
+            poly: polynomial, not reflected
+            init: initial register value
+            xor_out: xored with the register for the result
+            update: native function(data, register) -> register, table driven if None
+        """
+        self.name = name
+        self.width = width
+        self.init = init
+        self.xor_out = xor_out
+        self.size = width // 8
+        if update is None:
+            self.table = build_table(width, poly)
+            self.update = self.update_table
+        else:
+            self.update = lambda register, data: update(data, register)
+
+    def update_table(self, register: int, data: bytes) -> int:
+        """
+        Feed data into the register
+
+        Args:
+            register: register value
+            data: bytes
+
+        Returns:
+            register value
+        """
+        table = self.table
+        shift = self.width - 8
+        mask = (1 << self.width) - 1
+        for byte in bytes(data):
+            register = table[((register >> shift) ^ byte) & 0xFF] ^ ((register << 8) & mask)
+        return register
+
+    def __call__(self, data: bytes) -> int:
+        return self.update(self.init, data) ^ self.xor_out
+
+    def digest(self, data: bytes) -> bytes:
+        """CRC of data as big endian bytes"""
+        return self(data).to_bytes(self.size, byteorder="big")
+
+    def new(self, data: bytes = b"") -> "Crc":
+        """Incremental CRC, optionally fed with data"""
+        return Crc(self, data)
+
+
+class Crc:
+    """Incremental CRC"""
+
+    def __init__(self, algorithm: CrcAlgorithm, data: bytes = b"") -> None:
+        self.algorithm = algorithm
+        self.register = algorithm.init
+        if data:
+            self.update(data)
+
+    def update(self, data: bytes) -> "Crc":
+        """Feed the next chunk of data"""
+        self.register = self.algorithm.update(self.register, data)
+        return self
+
+    @property
+    def value(self) -> int:
+        """CRC of all data"""
+        return self.register ^ self.algorithm.xor_out
+
+    def digest(self) -> bytes:
+        """CRC of all data as big endian bytes"""
+        return self.value.to_bytes(self.algorithm.size, byteorder="big")
+
+
+# CRC-8/CCITT as crcengine "crc8-ccitt"
+CRC8 = CrcAlgorithm("crc8-ccitt", 8, 0x07, 0x00, xor_out=0x55)
+# CRC-16/CCITT-FALSE as crcengine "crc16-ccitt-false"
+CRC16 = CrcAlgorithm("crc16-ccitt-false", 16, 0x1021, 0xFFFF, update=binascii.crc_hqx)
+# CRC-24/OPENPGP
+CRC24 = CrcAlgorithm("crc-24-openpgp", 24, 0x864CFB, 0xB704CE)
+# CRC-32 as crcengine "crc32", zlib keeps the final value as register
+CRC32 = CrcAlgorithm("crc32", 32, 0x04C11DB7, 0, update=zlib.crc32)
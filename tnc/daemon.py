@@ -16,13 +16,12 @@ import atexit
 import multiprocessing
 import os
 import signal
-import socketserver
 import subprocess
 import sys
 import threading
 import time
 import audio
-import crcengine
+import crc
 import log_handler
 import serial.tools.list_ports
 import sock
@@ -61,7 +60,7 @@ class DAEMON:
 
     def __init__(self):
         # load crc engine
-        self.crc_algorithm = crcengine.new("crc16-ccitt-false")  # load crc8 library
+        self.crc_algorithm = crc.CRC16
 
         self.daemon_queue = sock.DAEMON_QUEUE
         update_audio_devices = threading.Thread(
@@ -365,11 +364,7 @@ if __name__ == "__main__":
 
     try:
         mainlog.info("[DMN] Starting TCP/IP socket", port=DAEMON.port)
-        # https://stackoverflow.com/a/16641793
-        socketserver.TCPServer.allow_reuse_address = True
-        cmdserver = sock.ThreadedTCPServer(
-            (TNC.host, DAEMON.port), sock.ThreadedTCPRequestHandler
-        )
+        cmdserver = sock.AsyncCommandServer((TNC.host, DAEMON.port))
         server_thread = threading.Thread(target=cmdserver.serve_forever)
         server_thread.daemon = True
         server_thread.start()
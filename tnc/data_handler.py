@@ -9,17 +9,20 @@ Created on Sun Dec 27 20:43:40 2020
 
 import os
 import base64
+import logging
 import sys
 import threading
 import time
 import uuid
-import lzma
 from random import randrange
 
 import codec2
+import compression
+import frames
 import helpers
 import modem
 import numpy as np
+import reassembly
 import sock
 from static import ARQ, AudioParam, Beacon, Channel, Daemon, HamlibParam, ModemParam, Station, Statistics, TCIParam, TNC
 import structlog
@@ -37,6 +40,8 @@ class DATA:
     """Terminal Node Controller for FreeDATA"""
 
     log = structlog.get_logger("DATA")
+    # stdlib logger behind log, used for checking the log level
+    stdlib_log = logging.getLogger("DATA")
 
     def __init__(self) -> None:
 
@@ -58,8 +63,10 @@ class DATA:
         self.duration_sig1_frame = 2.3
         self.longest_duration = 5.8  # datac5
 
-        # hold session id
+        # hold session id, only valid while session_active is set,
+        # as 0 is a valid session id
         self.session_id = bytes(1)
+        self.session_active = False
 
         # ------- ARQ SESSION
         self.arq_file_transfer = False
@@ -85,7 +92,10 @@ class DATA:
         # Flag to indicate if we received a request for repeater frames
         self.rpt_request_received = False
         self.rpt_request_buffer = []  # requested frames, saved in a list
+        self.rpt_request_frames = []  # frames of the burst missing on IRS side
         self.burst_rpt_counter = 0
+        # bitmap of received frames in burst NACK frames, one bit per frame
+        self.burst_bitmap_size = 5
 
         self.rx_start_of_transmission = 0  # time of transmission start
 
@@ -165,6 +175,13 @@ class DATA:
         # save last used payload for optimising buffer search area
         self.arq_burst_last_payload = self.arq_burst_maximum_payload
 
+        # burst header with the data offset of the burst, negotiated in the data channel opener
+        # frame type (1) + n frames per burst (1) + session id (1) + offset (4)
+        self.arq_offset_header = False
+        self.arq_offset_header_size = 7
+        # data offset of the burst we are receiving
+        self.rx_burst_offset = 0
+
         self.is_IRS = False
         self.burst_nack = False
         self.burst_nack_counter = 0
@@ -173,6 +190,9 @@ class DATA:
 
         self.rx_frame_bof_received = False
         self.rx_frame_eof_received = False
+        # reassembly buffer for received data frames
+        self.rx_frame_buffer = reassembly.ReassemblyBuffer(self.data_frame_bof, self.data_frame_eof)
+        ARQ.rx_frame_buffer = self.rx_frame_buffer
 
         # TIMEOUTS
         self.burst_ack_timeout_seconds = 4.5  # timeout for burst  acknowledges
@@ -199,6 +219,14 @@ class DATA:
                 self.arq_received_data_channel_opener,
                 "ARQ Data Channel Open (Wide)",
             ),
+            FR_TYPE.ARQ_DC_OPEN_OFFSET_N.value: (
+                self.arq_received_data_channel_opener,
+                "ARQ Data Channel Open with offset (Narrow)",
+            ),
+            FR_TYPE.ARQ_DC_OPEN_OFFSET_W.value: (
+                self.arq_received_data_channel_opener,
+                "ARQ Data Channel Open with offset (Wide)",
+            ),
             FR_TYPE.ARQ_SESSION_CLOSE.value: (
                 self.received_session_close,
                 "ARQ CLOSE SESSION",
@@ -227,6 +255,14 @@ class DATA:
             FR_TYPE.FEC_WAKEUP.value: (self.broadcast.received_fec_wakeup, "FEC WAKEUP"),
 
         }
+        # Handlers indexed by the frame type byte, so process_data needs a
+        # single lookup. Handlers are called with (frame, freedv, bytes_per_frame)
+        self.rx_dispatch_table = [self.received_unknown_frame] * 256
+        for frametype, (function, _) in self.rx_dispatcher.items():
+            self.rx_dispatch_table[frametype] = self.signalling_frame_handler(function)
+        for frametype in range(FR_TYPE.BURST_01.value, FR_TYPE.BURST_51.value + 1):
+            self.rx_dispatch_table[frametype] = self.received_burst
+        self.rx_dispatch_table[FR_TYPE.TEST_FRAME.value] = self.received_test_frame
         self.command_dispatcher = {
             # "CONNECT": (self.arq_session_handler, "CONNECT"),
             "CQ": (self.transmit_cq, "CQ"),
@@ -321,7 +357,7 @@ class DATA:
                     Beacon.beacon_state = False
 
             elif data[0] == "ARQ_RAW":
-                # [1] DATA_OUT bytes
+                # [1] DATA_OUT bytes or binary file from a chunked upload
                 # [2] self.transmission_uuid str
                 # [3] mycallsign with ssid
                 # [4] dxcallsign with ssid
@@ -349,12 +385,16 @@ class DATA:
         """Queue received data for processing"""
         while True:
             data = self.data_queue_received.get()
-            # [0] bytes
+            # [0] bytes, frame buffer owned by us
             # [1] freedv instance
             # [2] bytes_per_frame
-            self.process_data(
-                bytes_out=data[0], freedv=data[1], bytes_per_frame=data[2]
-            )
+            try:
+                self.process_data(
+                    bytes_out=data[0], freedv=data[1], bytes_per_frame=data[2]
+                )
+            finally:
+                # handlers got a copy of the frame, so the buffer can be reused
+                frames.FRAME_POOL.release(data[0])
 
     def process_data(self, bytes_out, freedv, bytes_per_frame: int) -> None:
         """
@@ -368,87 +408,66 @@ class DATA:
         Returns:
 
         """
-        self.log.debug(
-            "[TNC] process_data:", n_retries_per_burst=self.n_retries_per_burst
-        )
+        frame = frames.ReceivedFrame(bytes_out)
 
         # Process data only if broadcast or we are the receiver
-        # bytes_out[1:4] == callsign check for signalling frames,
-        # bytes_out[2:5] == transmission
-        # we could also create an own function, which returns True.
-        frametype = int.from_bytes(bytes(bytes_out[:1]), "big")
-
-        # check for callsign CRC
-        _valid1, _ = helpers.check_callsign(self.mycallsign, bytes(bytes_out[1:4]))
-        _valid2, _ = helpers.check_callsign(self.mycallsign, bytes(bytes_out[2:5]))
-
-        # check for session ID
-        # signalling frames
-        _valid3 = helpers.check_session_id(self.session_id, bytes(bytes_out[1:2]))
-        # arq data frames
-        _valid4 = helpers.check_session_id(self.session_id, bytes(bytes_out[2:3]))
-        if (
-                _valid1
-                or _valid2
-                or _valid3
-                or _valid4
-                or frametype
-                in [
-            FR_TYPE.CQ.value,
-            FR_TYPE.QRV.value,
-            FR_TYPE.PING.value,
-            FR_TYPE.BEACON.value,
-            FR_TYPE.IS_WRITING.value,
-            FR_TYPE.FEC.value,
-            FR_TYPE.FEC_WAKEUP.value,
-        ]
-        ):
-
-            # CHECK IF FRAMETYPE IS BETWEEN 10 and 50 ------------------------
-            # frame = frametype - 10
-            # n_frames_per_burst = int.from_bytes(bytes(bytes_out[1:2]), "big")
-
-            # Dispatch activity based on received frametype
-            if frametype in self.rx_dispatcher:
-                # Process frames "known" by rx_dispatcher
-                # self.log.debug(f"[TNC] {self.rx_dispatcher[frametype][1]} RECEIVED....")
-                self.rx_dispatcher[frametype][0](bytes_out[:-2])
-
-            # Process frametypes requiring a different set of arguments.
-            elif FR_TYPE.BURST_51.value >= frametype >= FR_TYPE.BURST_01.value:
-                # get snr of received data
-                # FIXME: find a fix for this - after moving to classes, this no longer works
-                # snr = self.calculate_snr(freedv)
-                snr = ModemParam.snr
-                self.log.debug("[TNC] RX SNR", snr=snr)
-                # send payload data to arq checker without CRC16
-                self.arq_data_received(
-                    bytes(bytes_out[:-2]), bytes_per_frame, snr, freedv
-                )
+        if self.is_frame_for_us(frame):
+            self.rx_dispatch_table[frame.frametype](frame, freedv, bytes_per_frame)
 
-                # if we received the last frame of a burst or the last remaining rpt frame, do a modem unsync
-                # if ARQ.rx_burst_buffer.count(None) <= 1 or (frame+1) == n_frames_per_burst:
-                #    self.log.debug(f"[TNC] LAST FRAME OF BURST --> UNSYNC {frame+1}/{n_frames_per_burst}")
-                #    self.c_lib.freedv_set_sync(freedv, 0)
-
-            # TESTFRAMES
-            elif frametype == FR_TYPE.TEST_FRAME.value:
-                self.log.debug("[TNC] TESTFRAME RECEIVED", frame=bytes_out[:])
-
-            # Unknown frame type
-            else:
-                self.log.warning(
-                    "[TNC] ARQ - other frame type", frametype=FR_TYPE(frametype).name
-                )
-
-        else:
+        elif self.stdlib_log.isEnabledFor(logging.DEBUG):
             # for debugging purposes to receive all data
             self.log.debug(
                 "[TNC] Foreign frame received",
-                frame=bytes_out[:-2].hex(),
-                frame_type=FR_TYPE(int.from_bytes(bytes_out[:1], byteorder="big")).name,
+                frame=frame.hex(),
+                frame_type=frames.frame_type_name(frame.frametype),
             )
 
+    def is_frame_for_us(self, frame: frames.ReceivedFrame) -> bool:
+        """
+        Check if a frame is a broadcast or addressed to us
+
+        Args:
+          frame: ReceivedFrame
+
+        Returns:
+          True if the frame should be processed
+        """
+        return frame.is_for_station(
+            self.mycallsign, self.session_id if self.session_active else None
+        )
+
+    @staticmethod
+    def signalling_frame_handler(function):
+        """Adapt a handler of rx_dispatcher to the signature of rx_dispatch_table"""
+
+        def handler(frame, freedv, bytes_per_frame):
+            function(bytes(frame))
+
+        return handler
+
+    def received_burst(self, frame: frames.ReceivedFrame, freedv, bytes_per_frame: int) -> None:
+        """Process a frame of an arq data burst"""
+        # get snr of received data
+        # FIXME: find a fix for this - after moving to classes, this no longer works
+        # snr = self.calculate_snr(freedv)
+        snr = ModemParam.snr
+        self.log.debug("[TNC] RX SNR", snr=snr)
+        # send payload data to arq checker without CRC16
+        self.arq_data_received(bytes(frame), bytes_per_frame, snr, freedv)
+
+        # if we received the last frame of a burst or the last remaining rpt frame, do a modem unsync
+        # if ARQ.rx_burst_buffer.count(None) <= 1 or (frame+1) == n_frames_per_burst:
+        #    self.log.debug(f"[TNC] LAST FRAME OF BURST --> UNSYNC {frame+1}/{n_frames_per_burst}")
+        #    self.c_lib.freedv_set_sync(freedv, 0)
+
+    def received_test_frame(self, frame: frames.ReceivedFrame, freedv, bytes_per_frame: int) -> None:
+        self.log.debug("[TNC] TESTFRAME RECEIVED", frame=bytes(frame))
+
+    def received_unknown_frame(self, frame: frames.ReceivedFrame, freedv, bytes_per_frame: int) -> None:
+        self.log.warning(
+            "[TNC] ARQ - other frame type", frametype=frames.frame_type_name(frame.frametype)
+        )
+
     def enqueue_frame_for_tx(
             self,
             frame_to_tx,  # : list[bytearray], # this causes a crash on python 3.7
@@ -571,23 +590,32 @@ class DATA:
         self.enqueue_frame_for_tx([ack_frame], c2_mode=FREEDV_MODE.sig1.value, copies=3, repeat_delay=0)
 
     def send_retransmit_request_frame(self) -> None:
-        # check where a None is in our burst buffer and do frame+1, because lists start at 0
-        # FIXME: Check to see if there's a `frame - 1` in the receive portion. Remove both if there is.
-        #print(ARQ.rx_burst_buffer)
-        missing_frames = [
-            frame + 1
-            for frame, element in enumerate(ARQ.rx_burst_buffer)
-            if element is None
-        ]
+        """
+        Build and send a NACK frame with a bitmap of the frames we received from
+        the actual burst, so the ISS only needs to send the missing frames again.
+        Our burst buffer is kept for the repeated frames.
+        """
+        # bit n is set if we received frame n of the burst
+        received_frames = 0
+        for frame, element in enumerate(ARQ.rx_burst_buffer):
+            if element is not None:
+                received_frames |= 1 << frame
 
-        rpt_frame = bytearray(self.length_sig1_frame)
-        rpt_frame[:1] = bytes([FR_TYPE.FR_REPEAT.value])
-        rpt_frame[1:2] = self.session_id
-        rpt_frame[2:2 + len(missing_frames)] = missing_frames
+        nack_frame = bytearray(self.length_sig1_frame)
+        nack_frame[:1] = bytes([FR_TYPE.BURST_NACK.value])
+        nack_frame[1:2] = self.session_id
+        nack_frame[2:3] = helpers.snr_to_bytes(0)
+        nack_frame[3:4] = bytes([int(self.speed_level)])
+        nack_frame[4:5] = bytes([int(self.rx_n_frames_per_burst)])
+        nack_frame[5:9] = len(ARQ.rx_frame_buffer).to_bytes(4, byteorder="big")
+        nack_frame[9:9 + self.burst_bitmap_size] = received_frames.to_bytes(self.burst_bitmap_size, byteorder="big")
 
-        self.log.info("[TNC] ARQ | RX | Requesting", frames=missing_frames)
+        self.log.info(
+            "[TNC] ARQ | RX | Requesting",
+            frames=[frame for frame, element in enumerate(ARQ.rx_burst_buffer) if element is None],
+        )
         # Transmit frame
-        self.enqueue_frame_for_tx([rpt_frame], c2_mode=FREEDV_MODE.sig1.value, copies=1, repeat_delay=0)
+        self.enqueue_frame_for_tx([nack_frame], c2_mode=FREEDV_MODE.sig1.value, copies=1, repeat_delay=0)
 
     def send_burst_nack_frame(self, snr: bytes) -> None:
         """Build and send NACK frame for received DATA frame"""
@@ -706,8 +734,16 @@ class DATA:
         if len(ARQ.rx_burst_buffer) != self.rx_n_frames_per_burst:
             ARQ.rx_burst_buffer = [None] * self.rx_n_frames_per_burst
 
+        if self.arq_offset_header:
+            # frames of a burst are consecutive, so the offset of the first one is enough
+            if self.rx_n_frame_of_burst == 0:
+                self.rx_burst_offset = int.from_bytes(data_in[3:7], "big")
+            burst_header_size = self.arq_offset_header_size
+        else:
+            burst_header_size = self.arq_burst_header_size
+
         # Append data to rx burst buffer
-        ARQ.rx_burst_buffer[self.rx_n_frame_of_burst] = data_in[self.arq_burst_header_size:]  # type: ignore
+        ARQ.rx_burst_buffer[self.rx_n_frame_of_burst] = data_in[burst_header_size:]  # type: ignore
 
         Station.dxgrid = b'------'
         helpers.add_to_heard_stations(
@@ -724,13 +760,11 @@ class DATA:
         if None not in ARQ.rx_burst_buffer:
             # then iterate through burst buffer and stick the burst together
             # the temp burst buffer is needed for checking, if we already received data
-            temp_burst_buffer = b""
-            for value in ARQ.rx_burst_buffer:
-                # ARQ.rx_frame_buffer += ARQ.rx_burst_buffer[i]
-                temp_burst_buffer += bytes(value)  # type: ignore
+            temp_burst_buffer = b"".join(ARQ.rx_burst_buffer)  # type: ignore
 
             # free up burst buffer
             ARQ.rx_burst_buffer = []
+            rx_frame_buffer = self.rx_frame_buffer
 
             # TODO: Needs to be removed as soon as mode error is fixed
             # catch possible modem error which leads into false byteorder
@@ -740,7 +774,7 @@ class DATA:
             # This might only work for datac1 and datac3
             try:
                 # area_of_interest = (modem.get_bytes_per_frame(self.mode_list[speed_level] - 1) -3) * 2
-                if ARQ.rx_frame_buffer.endswith(temp_burst_buffer[:246]) and len(temp_burst_buffer) >= 246:
+                if rx_frame_buffer.endswith(temp_burst_buffer[:246]) and len(temp_burst_buffer) >= 246:
                     self.log.warning(
                         "[TNC] ARQ | RX | wrong byteorder received - dropping data"
                     )
@@ -752,12 +786,32 @@ class DATA:
                 )
 
             self.log.debug("[TNC] temp_burst_buffer", buffer=temp_burst_buffer)
-            self.log.debug("[TNC] ARQ.rx_frame_buffer", buffer=ARQ.rx_frame_buffer)
+            self.log.debug("[TNC] ARQ.rx_frame_buffer", length=len(rx_frame_buffer))
+
+            # with offset headers we know where the burst belongs, so we can write it in place.
+            # A burst we already received is just written again.
+            if self.arq_offset_header:
+                if self.rx_burst_offset > len(rx_frame_buffer):
+                    # ISS will continue at our buffer position reported with the ACK
+                    self.log.warning(
+                        "[TNC] ARQ | RX | missing data before burst - dropping burst",
+                        offset=self.rx_burst_offset,
+                        length=len(rx_frame_buffer),
+                    )
+                elif self.rx_burst_offset + len(temp_burst_buffer) < len(rx_frame_buffer):
+                    self.log.info(
+                        "[TNC] ARQ | RX | Frame already received - sending ACK again",
+                        offset=self.rx_burst_offset,
+                    )
+                else:
+                    rx_frame_buffer.write(self.rx_burst_offset, temp_burst_buffer)
+
+                self.arq_burst_last_payload = len(temp_burst_buffer)
 
             # if frame buffer ends not with the current frame, we are going to append new data
             # if data already exists, we received the frame correctly,
             # but the ACK frame didn't receive its destination (ISS)
-            if ARQ.rx_frame_buffer.endswith(temp_burst_buffer):
+            elif rx_frame_buffer.endswith(temp_burst_buffer):
                 self.log.info(
                     "[TNC] ARQ | RX | Frame already received - sending ACK again"
                 )
@@ -772,24 +826,20 @@ class DATA:
 
                 search_area = self.arq_burst_last_payload * self.rx_n_frames_per_burst
 
-                search_position = len(ARQ.rx_frame_buffer) - search_area
-                # if search position < 0, then search position = 0
-                search_position = max(0, search_position)
-
                 # find position of data. returns -1 if nothing found in area else >= 0
+                # a repeated burst starts where the burst we have already received
+                # started, so only burst starts need to be checked.
                 # we are beginning from the end, so if data exists twice or more,
                 # only the last one should be replaced
                 # we are going to only check position against minimum data frame payload
                 # use case: receive data, which already contains received data
                 # while the payload of data received before is shorter than actual payload
-                get_position = ARQ.rx_frame_buffer[search_position:].rfind(
-                    temp_burst_buffer[:self.arq_burst_minimum_payload]
+                get_position = rx_frame_buffer.find_burst(
+                    temp_burst_buffer[:self.arq_burst_minimum_payload], search_area
                 )
                 # if we find data, replace it at this position with the new data and strip it
                 if get_position >= 0:
-                    ARQ.rx_frame_buffer = ARQ.rx_frame_buffer[
-                                             : search_position + get_position
-                                             ]
+                    rx_frame_buffer.write(get_position, temp_burst_buffer)
                     self.log.warning(
                         "[TNC] ARQ | RX | replacing existing buffer data",
                         area=search_area,
@@ -797,8 +847,7 @@ class DATA:
                     )
                 else:
                     self.log.debug("[TNC] ARQ | RX | appending data to buffer")
-
-                ARQ.rx_frame_buffer += temp_burst_buffer
+                    rx_frame_buffer.append(temp_burst_buffer)
 
                 self.arq_burst_last_payload = len(temp_burst_buffer)
 
@@ -881,13 +930,14 @@ class DATA:
         # We have a BOF and EOF flag in our data. If we received both we received our frame.
         # In case of loosing data, but we received already a BOF and EOF we need to make sure, we
         # received the complete last burst by checking it for Nones
-        bof_position = ARQ.rx_frame_buffer.find(self.data_frame_bof)
-        eof_position = ARQ.rx_frame_buffer.find(self.data_frame_eof)
+        # Both positions are tracked by the buffer while writing bursts
+        bof_position = self.rx_frame_buffer.bof_position
+        eof_position = self.rx_frame_buffer.eof_position
 
         # get total bytes per transmission information as soon we received a frame with a BOF
 
-        if bof_position >= 0:
-            self.arq_extract_statistics_from_data_frame(bof_position, eof_position)
+        if self.rx_frame_buffer.header_received:
+            self.arq_extract_statistics_from_data_frame()
         if (
                 bof_position >= 0
                 and eof_position > 0
@@ -902,22 +952,22 @@ class DATA:
             self.rx_frame_eof_received = True
 
             # Extract raw data from buffer
-            payload = ARQ.rx_frame_buffer[
-                      bof_position + len(self.data_frame_bof): eof_position
-                      ]
+            payload = self.rx_frame_buffer.payload()
             # Get the data frame crc
             data_frame_crc = payload[:4]  # 0:4 = 4 bytes
             # Get the data frame length
             frame_length = int.from_bytes(payload[4:8], "big")  # 4:8 = 4 bytes
             ARQ.total_bytes = frame_length
             # 8:9 = compression factor
+            # 9:10 = compression codec
+            compression_codec = int.from_bytes(payload[9:10], "big")
 
-            data_frame = payload[9:]
+            data_frame = payload[10:]
             data_frame_crc_received = helpers.get_crc_32(data_frame)
 
             # Check if data_frame_crc is equal with received crc
             if data_frame_crc == data_frame_crc_received:
-                self.arq_process_received_data_frame(data_frame, snr)
+                self.arq_process_received_data_frame(data_frame, compression_codec, snr)
             else:
                 self.send_data_to_socket_queue(
                     freedata="tnc-message",
@@ -956,10 +1006,8 @@ class DATA:
             # Finally cleanup our buffers and states,
             self.arq_cleanup()
 
-    def arq_extract_statistics_from_data_frame(self, bof_position, eof_position):
-        payload = ARQ.rx_frame_buffer[
-                  bof_position + len(self.data_frame_bof): eof_position
-                  ]
+    def arq_extract_statistics_from_data_frame(self):
+        payload = self.rx_frame_buffer.header()
         frame_length = int.from_bytes(payload[4:8], "big")  # 4:8 4bytes
         ARQ.total_bytes = frame_length
         compression_factor = int.from_bytes(payload[8:9], "big")  # 4:8 4bytes
@@ -1018,10 +1066,12 @@ class DATA:
         # Update modes we are listening to
         self.set_listening_modes(False, True, self.mode_list[self.speed_level])
 
-    def arq_process_received_data_frame(self, data_frame, snr):
+    def arq_process_received_data_frame(self, data_frame, compression_codec, snr):
         """
-
-
+        Args:
+          data_frame:bytes: compressed payload
+          compression_codec:int: codec id of the data frame header
+          snr:float:
         """
         # transmittion duration
         duration = time.time() - self.rx_start_of_transmission
@@ -1032,14 +1082,30 @@ class DATA:
                       bytesperminute=ARQ.bytes_per_minute, total_bytes=ARQ.total_bytes, duration=duration)
 
         # Decompress the data frame
-        data_frame_decompressed = lzma.decompress(data_frame)
-        ARQ.arq_compression_factor = len(data_frame_decompressed) / len(
+        try:
+            data_frame_decompressed = compression.decompress(compression_codec, data_frame)
+        except Exception as e:
+            # e.g. zstd, if the zstandard package isn't installed
+            self.log.error("[TNC] ARQ | RX | can't decompress data frame", e=e, codec=compression_codec)
+            self.send_data_to_socket_queue(
+                freedata="tnc-message",
+                arq="transmission",
+                status="failed",
+                reason="compression not supported",
+                uuid=self.transmission_uuid,
+                mycallsign=str(self.mycallsign, 'UTF-8'),
+                dxcallsign=str(self.dxcallsign, 'UTF-8'),
+                irs=helpers.bool_to_string(self.is_IRS)
+            )
+            return
+        ARQ.arq_compression_factor = len(data_frame_decompressed) / max(len(
             data_frame
-        )
+        ), 1)
         data_frame = data_frame_decompressed
 
         self.transmission_uuid = str(uuid.uuid4())
-        timestamp = int(time.time())
+        # not rounded to seconds, so clients can page with RX_BUFFER.since
+        timestamp = time.time()
 
         # Re-code data_frame in base64, UTF-8 for JSON UI communication.
         base64_data = base64.b64encode(data_frame).decode("UTF-8")
@@ -1149,12 +1215,13 @@ class DATA:
             snr=snr,
         )
 
-    def arq_transmit(self, data_out: bytes):
+    def arq_transmit(self, data_out):
         """
         Transmit ARQ frame
 
         Args:
-          data_out:bytes:
+          data_out:bytes, binary file or a running compression.CompressionJob
+                   files are read in blocks and closed
 
 
         """
@@ -1167,14 +1234,27 @@ class DATA:
         self.tx_n_retry_of_burst = 0  # retries we already sent data
         # Maximum number of retries to send before declaring a frame is lost
 
+        # Compress data frame
+        try:
+            if not isinstance(data_out, compression.CompressionJob):
+                data_out = self.start_compression(data_out)
+            total_bytes, compression_codec, data_frame_compressed, frame_payload_crc = data_out.result()
+        except Exception as e:
+            # e.g. the file of a chunked upload can't be read
+            self.log.error("[TNC] ARQ | TX | can't compress data frame", e=e)
+            if not isinstance(data_out, (bytes, bytearray, compression.CompressionJob)):
+                data_out.close()
+            self.arq_transmit_failed()
+            return
+        self.log.info("[TNC] ARQ | TX | compression", codec=compression_codec.name,
+                      total_bytes=total_bytes, compressed_bytes=len(data_frame_compressed))
+
         # save len of data_out to TOTAL_BYTES for our statistics
-        ARQ.total_bytes = len(data_out)
+        ARQ.total_bytes = total_bytes
         self.arq_file_transfer = True
-        frame_total_size = len(data_out).to_bytes(4, byteorder="big")
+        frame_total_size = total_bytes.to_bytes(4, byteorder="big")
 
-        # Compress data frame
-        data_frame_compressed = lzma.compress(data_out)
-        compression_factor = len(data_out) / len(data_frame_compressed)
+        compression_factor = total_bytes / max(len(data_frame_compressed), 1)
         ARQ.arq_compression_factor = np.clip(compression_factor, 0, 255)
         compression_factor = bytes([int(ARQ.arq_compression_factor * 10)])
 
@@ -1204,7 +1284,7 @@ class DATA:
         self.calculate_transfer_rate_tx(tx_start_of_transmission, 0, len(data_out))
 
         # Append a crc at the beginning and end of file indicators
-        frame_payload_crc = helpers.get_crc_32(data_out)
+        # the crc has been calculated while compressing
         self.log.debug("[TNC] frame payload CRC:", crc=frame_payload_crc.hex())
 
         # Assemble the data frame
@@ -1213,6 +1293,7 @@ class DATA:
                 + frame_payload_crc
                 + frame_total_size
                 + compression_factor
+                + bytes([compression_codec.value])
                 + data_out
                 + self.data_frame_eof
         )
@@ -1274,6 +1355,8 @@ class DATA:
                     #####arqheader[:1] = bytes([FR_TYPE.BURST_01.value])
                     arqheader[1:2] = bytes([n_frames_per_burst])
                     arqheader[2:3] = self.session_id
+                    if self.arq_offset_header:
+                        arqheader[3:7] = bufferposition.to_bytes(4, byteorder="big")
 
                     # only check for buffer position if at least one NACK received
                     self.log.info("[TNC] ----- data buffer position:", iss_buffer_pos=bufferposition,
@@ -1319,14 +1402,26 @@ class DATA:
                 self.enqueue_frame_for_tx(tempbuffer, c2_mode=data_mode)
 
                 # After transmission finished, wait for an ACK or RPT frame
-                while (
-                        ARQ.arq_state
-                        and not self.burst_ack
-                        and not self.burst_nack
-                        and not self.rpt_request_received
-                        and not self.data_frame_ack_received
-                ):
-                    threading.Event().wait(0.01)
+                while True:
+                    while (
+                            ARQ.arq_state
+                            and not self.burst_ack
+                            and not self.burst_nack
+                            and not self.rpt_request_received
+                            and not self.data_frame_ack_received
+                    ):
+                        threading.Event().wait(0.01)
+
+                    if not self.rpt_request_received:
+                        break
+
+                    # IRS is missing some frames of the burst, so we are only sending these again
+                    self.rpt_request_received = False
+                    self.log.warning(
+                        "[TNC] arq_transmit: Received BURST NACK with missing frames. Resending missing frames",
+                        frames=len(self.rpt_request_frames),
+                    )
+                    self.enqueue_frame_for_tx(self.rpt_request_frames, c2_mode=data_mode)
 
                 # Once we receive a burst ack, reset its state and break the RETRIES loop
                 if self.burst_ack:
@@ -1335,6 +1430,10 @@ class DATA:
                     self.log.debug(
                         "[TNC] arq_transmit: Received BURST ACK. Sending next chunk."
                         , irs_snr=self.burst_ack_snr)
+                    # the IRS reports the exact position of its buffer if we are sending offsets,
+                    # so we continue there. This also covers bursts the IRS had to drop.
+                    if self.arq_offset_header:
+                        bufferposition_end = self.irs_buffer_position
                     # update temp bufferposition for n frames per burst early calculation
                     bufferposition_burst_start = bufferposition_end
                     break  # break retry loop
@@ -1354,6 +1453,8 @@ class DATA:
                         bufferposition=bufferposition
                     )
 
+                    if self.arq_offset_header:
+                        bufferposition_burst_start = self.irs_buffer_position
                     bufferposition = bufferposition_burst_start
                     self.burst_nack = False  # reset nack state
 
@@ -1505,30 +1606,45 @@ class DATA:
             if frametype == FR_TYPE.BURST_ACK.value:
                 # Increase speed level if we received a burst ack
                 # self.speed_level = min(self.speed_level + 1, len(self.mode_list) - 1)
+                # set buffer position first, it's read by arq_transmit as soon as we set the ack flag
+                self.irs_buffer_position = int.from_bytes(data_in[4:8], "big")
                 # Force data retry loops of TX TNC to stop and continue with next frame
                 self.burst_ack = True
                 # Reset burst nack counter
                 self.burst_nack_counter = 0
                 # Reset n retries per burst counter
                 self.n_retries_per_burst = 0
-                self.irs_buffer_position = int.from_bytes(data_in[4:8], "big")
 
                 self.burst_ack_snr = helpers.snr_from_bytes(data_in[2:3])
             else:
 
                 # Decrease speed level if we received a burst nack
                 # self.speed_level = max(self.speed_level - 1, 0)
-                # Set flag to retry frame again.
-                self.burst_nack = True
-                # Increment burst nack counter
-                self.burst_nack_counter += 1
-                self.burst_ack_snr = 'NaN'
                 self.irs_buffer_position = int.from_bytes(data_in[5:9], "big")
+                self.burst_ack_snr = 'NaN'
+
+                # IRS tells us which frames of the burst it received
+                received_frames = int.from_bytes(data_in[9:9 + self.burst_bitmap_size], "big")
+                missing_frames = [
+                    frame
+                    for n_frame, frame in enumerate(self.rpt_request_buffer)
+                    if not received_frames >> n_frame & 1
+                ]
+                if received_frames and missing_frames:
+                    # Set flag to send the missing frames only
+                    self.rpt_request_frames = missing_frames
+                    self.rpt_request_received = True
+                else:
+                    # Set flag to retry frame again.
+                    self.burst_nack = True
+                    # Increment burst nack counter
+                    self.burst_nack_counter += 1
 
                 self.log.warning(
                     "[TNC] ARQ | TX | Burst NACK received",
                     burst_nack_counter=self.burst_nack_counter,
                     irs_buffer_position=self.irs_buffer_position,
+                    missing_frames=len(missing_frames) if received_frames else "all",
                 )
 
             # Update data_channel timestamp
@@ -1773,7 +1889,8 @@ class DATA:
         ARQ.arq_session_state = "connecting"
 
         # create a random session id
-        self.session_id = np.random.bytes(1)
+        self.session_id = helpers.new_session_id()
+        self.session_active = True
 
         connection_frame = bytearray(self.length_sig0_frame)
         connection_frame[:1] = bytes([FR_TYPE.ARQ_SESSION_OPEN.value])
@@ -1865,6 +1982,7 @@ class DATA:
         self.arq_session_last_received = int(time.time())
 
         self.session_id = bytes(data_in[1:2])
+        self.session_active = True
         Station.dxcallsign_crc = bytes(data_in[5:8])
         self.dxcallsign = helpers.bytes_to_callsign(bytes(data_in[8:14]))
         Station.dxcallsign = self.dxcallsign
@@ -2053,9 +2171,24 @@ class DATA:
     ##########################################################################################################
     # ARQ DATA CHANNEL HANDLER
     ##########################################################################################################
+    def start_compression(self, data_out) -> compression.CompressionJob:
+        """
+        Start compressing data in the background with the configured codec
+
+        Args:
+          data_out:bytes or binary file, files are read in blocks and closed
+
+        Returns:
+            running compression job
+        """
+        codec = compression.CODEC.__members__.get(
+            str(ARQ.arq_compression).upper(), compression.CODEC.LZMA
+        )
+        return compression.CompressionJob(data_out, codec).start()
+
     def open_dc_and_transmit(
             self,
-            data_out: bytes,
+            data_out,
             transmission_uuid: str,
             mycallsign,
             dxcallsign,
@@ -2065,7 +2198,7 @@ class DATA:
         Open data channel and transmit data
 
         Args:
-          data_out:bytes:
+          data_out:bytes or binary file:
           transmission_uuid:str:
           mycallsign:bytes:
           attempts:int: Overriding number of attempts initiating a connection
@@ -2096,10 +2229,16 @@ class DATA:
 
         self.datachannel_timeout = False
 
-        # we need to compress data for getting a compression factor.
-        # so we are compressing twice. This is not that nice and maybe there is another way
-        # for calculating transmission statistics
-        # ARQ.arq_compression_factor = len(data_out) / len(lzma.compress(data_out))
+        # compress while we are opening the data channel
+        try:
+            compression_job = self.start_compression(data_out)
+        except Exception as e:
+            # e.g. the file of a chunked upload can't be read
+            self.log.error("[TNC] ARQ | TX | can't compress data frame", e=e)
+            if not isinstance(data_out, (bytes, bytearray)):
+                data_out.close()
+            self.arq_transmit_failed()
+            return False
 
         self.arq_open_data_channel(mycallsign)
 
@@ -2108,9 +2247,11 @@ class DATA:
             threading.Event().wait(0.01)
 
         if ARQ.arq_state:
-            self.arq_transmit(data_out)
+            self.arq_transmit(compression_job)
             return True
 
+        # data channel couldn't be opened, a chunked upload is closed by the job
+        compression_job.cancel()
         return False
 
     def arq_open_data_channel(
@@ -2127,20 +2268,24 @@ class DATA:
             False if the data channel failed to open
         """
         self.is_IRS = False
+        self.arq_offset_header = False
 
         # init a new random session id if we are not in an arq session
         if not ARQ.arq_session:
-            self.session_id = np.random.bytes(1)
+            self.session_id = helpers.new_session_id()
+        self.session_active = True
 
         # Update data_channel timestamp
         self.data_channel_last_received = int(time.time())
 
         if TNC.low_bandwidth_mode:
             frametype = bytes([FR_TYPE.ARQ_DC_OPEN_N.value])
+            offset_frametype = bytes([FR_TYPE.ARQ_DC_OPEN_OFFSET_N.value])
             self.log.debug("[TNC] Requesting low bandwidth mode")
 
         else:
             frametype = bytes([FR_TYPE.ARQ_DC_OPEN_W.value])
+            offset_frametype = bytes([FR_TYPE.ARQ_DC_OPEN_OFFSET_W.value])
             self.log.debug("[TNC] Requesting high bandwidth mode")
 
         connection_frame = bytearray(self.length_sig0_frame)
@@ -2189,6 +2334,13 @@ class DATA:
                     while ModemParam.channel_busy and time.time() < channel_busy_timeout and not self.check_if_mode_fits_to_busy_slot():
                         threading.Event().wait(0.01)
 
+                # offer offset headers with the first half of our attempts,
+                # then fall back to the default opener in case the IRS doesn't know it
+                if ARQ.arq_offset_header and attempt < self.data_channel_max_retries // 2:
+                    connection_frame[:1] = offset_frametype
+                else:
+                    connection_frame[:1] = frametype
+
                 self.enqueue_frame_for_tx([connection_frame], c2_mode=FREEDV_MODE.sig0.value, copies=1, repeat_delay=0)
 
                 timeout = time.time() + self.duration_sig1_frame * 3 + (ModemParam.tx_delay / 1000 * 2)
@@ -2290,6 +2442,17 @@ class DATA:
         # n_frames_per_burst = int.from_bytes(bytes(data_in[13:14]), "big")
 
         frametype = int.from_bytes(bytes(data_in[:1]), "big")
+
+        # ISS offers burst headers with data offset
+        self.arq_offset_header = frametype in [
+            FR_TYPE.ARQ_DC_OPEN_OFFSET_W.value,
+            FR_TYPE.ARQ_DC_OPEN_OFFSET_N.value,
+        ]
+        if frametype == FR_TYPE.ARQ_DC_OPEN_OFFSET_W.value:
+            frametype = FR_TYPE.ARQ_DC_OPEN_W.value
+        elif frametype == FR_TYPE.ARQ_DC_OPEN_OFFSET_N.value:
+            frametype = FR_TYPE.ARQ_DC_OPEN_N.value
+
         # check if we received low bandwidth mode
         # possible channel constellations
         # ISS(w) <-> IRS(w)
@@ -2373,6 +2536,7 @@ class DATA:
         )
 
         self.session_id = data_in[13:14]
+        self.session_active = True
 
         # check again if callsign ssid override
         _, self.mycallsign = helpers.check_callsign(self.mycallsign, data_in[1:4])
@@ -2409,6 +2573,7 @@ class DATA:
         connection_frame[:1] = frametype
         connection_frame[1:2] = self.session_id
         connection_frame[8:9] = bytes([self.speed_level])
+        connection_frame[9:10] = bytes([int(self.arq_offset_header)])
         connection_frame[13:14] = bytes([ARQ.arq_protocol_version])
 
         self.enqueue_frame_for_tx([connection_frame], c2_mode=FREEDV_MODE.sig0.value, copies=1, repeat_delay=0)
@@ -2469,6 +2634,10 @@ class DATA:
                 self.time_list = self.time_list_high_bw
                 self.log.debug("[TNC] high bandwidth mode", modes=self.mode_list)
 
+            # IRS accepted burst headers with data offset
+            self.arq_offset_header = ARQ.arq_offset_header and data_in[9:10] == b"\x01"
+            self.log.debug("[TNC] burst headers with data offset", enabled=self.arq_offset_header)
+
             # set speed level from session opener frame which is selected by SNR measurement
             self.speed_level = int.from_bytes(bytes(data_in[8:9]), "big")
             self.log.debug("[TNC] speed level selected for given SNR", speed_level=self.speed_level)
@@ -3144,11 +3313,13 @@ class DATA:
         self.burst_rpt_counter = 0
         self.data_frame_ack_received = False
         ARQ.rx_burst_buffer = []
-        ARQ.rx_frame_buffer = b""
+        self.rx_frame_buffer.clear()
         self.burst_ack_snr = 0
         self.arq_burst_last_payload = 0
         self.rx_n_frame_of_burst = 0
         self.rx_n_frames_per_burst = 0
+        self.arq_offset_header = False
+        self.rx_burst_offset = 0
 
         # reset modem receiving state to reduce cpu load
         modem.RECEIVE_SIG0 = True
@@ -3160,7 +3331,7 @@ class DATA:
         modem.RECEIVE_FSK_LDPC_1 = False
 
         # reset buffer overflow counter
-        AudioParam.buffer_overflow_counter = [0, 0, 0, 0, 0]
+        AudioParam.buffer_overflow_counter = [0, 0, 0, 0, 0, 0, 0]
 
         self.is_IRS = False
         self.burst_nack = False
@@ -3186,6 +3357,7 @@ class DATA:
             self.dxcallsign = b"AA0AA-0"
             self.mycallsign = Station.mycallsign
             self.session_id = bytes(1)
+            self.session_active = False
 
         ARQ.arq_session_state = "disconnected"
         ARQ.speed_list = []
@@ -3317,7 +3489,11 @@ class DATA:
             print(
                 f"frames_per_burst {self.rx_n_frame_of_burst} / {self.rx_n_frames_per_burst}, Repeats: {self.burst_rpt_counter} Nones: {ARQ.rx_burst_buffer.count(None)}")
 
-            if self.rx_n_frames_per_burst > 1 and self.burst_rpt_counter < 3 and ARQ.rx_burst_buffer.count(None) > 0:
+            if (
+                    1 < self.rx_n_frames_per_burst <= self.burst_bitmap_size * 8
+                    and self.burst_rpt_counter < 3
+                    and ARQ.rx_burst_buffer.count(None) > 0
+            ):
                 # reset self.burst_last_received
                 self.burst_last_received = time.time() + self.time_list[self.speed_level] * frames_left
                 self.burst_rpt_counter += 1
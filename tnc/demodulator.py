@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+demodulator.py
+
+Optional multi process demodulation. Every codec2 receive instance runs in
+its own worker process and reads the 8 kHz audio from a shared memory
+audio buffer, so the Python glue around the codec2 calls doesn't serialize
+on the GIL of the main process. Results are sent back through a pipe.
+
+"""
+# pylint: disable=invalid-name, line-too-long, c-extension-no-member
+
+import atexit
+import ctypes
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import threading
+
+import codec2
+import structlog
+
+log = structlog.get_logger("demodulator")
+
+
+def open_rx_instance(mode, adv, tuning_range_fmin, tuning_range_fmax):
+    """
+    Open and configure a codec2 instance for receiving
+
+    Args:
+        mode: codec2 mode
+        adv: advanced FSK parameters or None
+        tuning_range_fmin: lower limit of the tuning range
+        tuning_range_fmax: upper limit of the tuning range
+
+    Returns:
+        c2instance, bytes_per_frame, bytes_out, nin
+    """
+    if adv:
+        # FSK Long-distance Parity Code 1 - data frames
+        c2instance = ctypes.cast(
+            codec2.api.freedv_open_advanced(
+                codec2.FREEDV_MODE.fsk_ldpc.value,
+                ctypes.byref(adv),
+            ),
+            ctypes.c_void_p,
+        )
+    else:
+        # create codec2 instance
+        c2instance = ctypes.cast(codec2.api.freedv_open(mode), ctypes.c_void_p)
+
+    # set tuning range
+    codec2.api.freedv_set_tuning_range(
+        c2instance,
+        ctypes.c_float(tuning_range_fmin),
+        ctypes.c_float(tuning_range_fmax),
+    )
+
+    # get bytes per frame
+    bytes_per_frame = int(codec2.api.freedv_get_bits_per_modem_frame(c2instance) / 8)
+
+    # create byte out buffer
+    bytes_out = ctypes.create_string_buffer(bytes_per_frame)
+
+    # set initial frames per burst
+    codec2.api.freedv_set_frames_per_burst(c2instance, 1)
+
+    # get initial nin
+    nin = codec2.api.freedv_nin(c2instance)
+
+    return c2instance, bytes_per_frame, bytes_out, nin
+
+
+def get_scatter_data(freedv) -> list:
+    """
+    Ask codec2 for the received symbols and return the scatter plot data
+
+    Args:
+        freedv: codec2 instance to query
+
+    Returns:
+        list of {"x": str, "y": str}, sampled down to about 150 points
+    """
+    modemStats = codec2.MODEMSTATS()
+    codec2.api.freedv_get_modem_extended_stats(freedv, ctypes.byref(modemStats))
+
+    scatterdata = []
+    for i, j in itertools.product(range(codec2.MODEM_STATS_NC_MAX), range(1, codec2.MODEM_STATS_NR_MAX, 2)):
+        xsymbols = round(modemStats.rx_symbols[i][j - 1] // 1000)
+        ysymbols = round(modemStats.rx_symbols[i][j] // 1000)
+        if xsymbols != 0.0 and ysymbols != 0.0:
+            scatterdata.append({"x": str(xsymbols), "y": str(ysymbols)})
+
+    # Send all the data if we have too-few samples, otherwise send a sampling
+    if 150 > len(scatterdata) > 0:
+        return scatterdata
+    # only take every tenth data point
+    return scatterdata[::10]
+
+
+def get_snr(freedv) -> float:
+    """
+    Ask codec2 for the signal-to-noise ratio of the received signal
+
+    Args:
+        freedv: codec2 instance to query
+
+    Returns:
+        snr rounded to one decimal
+    """
+    modem_stats_snr = ctypes.c_float()
+    modem_stats_sync = ctypes.c_int()
+    codec2.api.freedv_get_modem_stats(
+        freedv, ctypes.byref(modem_stats_sync), ctypes.byref(modem_stats_snr)
+    )
+    return round(modem_stats_snr.value, 1)
+
+
+def demodulator_process(
+        mode_name,
+        mode,
+        adv_name,
+        buffer_name,
+        buffer_size,
+        max_readers,
+        slot,
+        data_ready,
+        connection,
+        tuning_range,
+        enable_scatter,
+) -> None:
+    """
+    Worker process running a single codec2 receive instance
+
+    Messages sent to the main process:
+        ("state", rx_status) if the modem state changes or on decoding errors
+        ("frame", bytes_out, bytes_per_frame, snr, scatter) for decoded frames
+
+    Commands received from the main process:
+        ("sync", value), ("frames_per_burst", value), ("stop", None)
+    """
+    audiobuffer = codec2.shared_audio_buffer(buffer_size, max_readers, name=buffer_name)
+    reader = codec2.shared_audio_buffer_reader(audiobuffer, slot, data_ready)
+    adv = getattr(codec2.api, adv_name) if adv_name else None
+    freedv, bytes_per_frame, bytes_out, nin = open_rx_instance(mode, adv, *tuning_range)
+    parent = multiprocessing.parent_process()
+    last_rx_status = 0
+    # outputs of codec2.rx_step
+    rx_status_out = ctypes.c_int()
+    nin_out = ctypes.c_int()
+
+    try:
+        while True:
+            while connection.poll():
+                command, value = connection.recv()
+                if command == "stop":
+                    return
+                if command == "sync":
+                    codec2.api.freedv_set_sync(freedv, value)
+                elif command == "frames_per_burst":
+                    codec2.api.freedv_set_frames_per_burst(freedv, value)
+
+            if reader.nbuffer < nin:
+                # sleep until new audio or a command arrives
+                reader.nin = nin
+                reader.data_ready.clear()
+                if reader.nbuffer < nin and not reader.data_ready.wait(1):
+                    if parent is not None and not parent.is_alive():
+                        return
+                continue
+
+            nbytes = codec2.rx_step(freedv, bytes_out, reader.buffer.ctypes, rx_status_out, nin_out)
+            rx_status = rx_status_out.value
+            if rx_status != last_rx_status or rx_status == 10:
+                connection.send(("state", rx_status))
+                last_rx_status = rx_status
+
+            reader.pop(nin)
+            nin = nin_out.value
+            if nbytes == bytes_per_frame:
+                connection.send(
+                    (
+                        "frame",
+                        bytes(bytes_out),
+                        bytes_per_frame,
+                        get_snr(freedv),
+                        get_scatter_data(freedv) if enable_scatter else [],
+                    )
+                )
+    except (EOFError, BrokenPipeError):
+        # main process is gone
+        pass
+    finally:
+        reader.active = False
+        audiobuffer.close()
+
+
+class DemodulatorPool:
+    """Run codec2 demodulators in worker processes"""
+
+    log = structlog.get_logger("DemodulatorPool")
+
+    def __init__(self, audiobuffer: codec2.shared_audio_buffer, callback) -> None:
+        """
+        Args:
+            audiobuffer: shared audio buffer the workers read from
+            callback: called with (mode_name, message) for every worker message
+        """
+        # spawn instead of fork, as the main process is already running threads
+        self.context = multiprocessing.get_context("spawn")
+        self.audiobuffer = audiobuffer
+        self.callback = callback
+        self.workers = {}
+        self.lock = threading.Lock()
+
+        receive_thread = threading.Thread(
+            target=self.worker_receive, name="DEMODULATOR POOL", daemon=True
+        )
+        receive_thread.start()
+
+        # stop workers before multiprocessing terminates them on exit
+        atexit.register(self.stop)
+
+    def start(self, mode_name, mode, adv_name, reader, tuning_range, enable_scatter) -> None:
+        """
+        Start a worker process for a codec2 mode
+
+        Args:
+            mode_name: name used for messages and logging
+            mode: codec2 mode
+            adv_name: name of advanced FSK parameters in codec2.api or None
+            reader: shared_audio_buffer_reader of this demodulator
+            tuning_range: (fmin, fmax)
+            enable_scatter: send scatter data with decoded frames
+        """
+        reader.data_ready = self.context.Event()
+        connection, child_connection = self.context.Pipe()
+        process = self.context.Process(
+            target=demodulator_process,
+            args=(
+                mode_name,
+                mode,
+                adv_name,
+                self.audiobuffer.name,
+                self.audiobuffer.size,
+                self.audiobuffer.max_readers,
+                reader.slot,
+                reader.data_ready,
+                child_connection,
+                tuning_range,
+                enable_scatter,
+            ),
+            name=f"DEMODULATOR {mode_name}",
+            daemon=True,
+        )
+        process.start()
+        child_connection.close()
+        with self.lock:
+            self.workers[mode_name] = (process, connection, reader)
+        self.log.info("[MDM] Started demodulator process", mode=mode_name, pid=process.pid)
+
+    def send_command(self, command, value, mode_names=None) -> None:
+        """
+        Send a command to workers and wake them up
+
+        Args:
+            command: "sync", "frames_per_burst" or "stop"
+            value: command value
+            mode_names: list of workers, all if None
+        """
+        with self.lock:
+            workers = list(self.workers.items())
+        for mode_name, (_, connection, reader) in workers:
+            if mode_names is None or mode_name in mode_names:
+                try:
+                    connection.send((command, value))
+                    reader.data_ready.set()
+                except (OSError, BrokenPipeError) as err:
+                    self.log.warning("[MDM] Demodulator not reachable", mode=mode_name, e=err)
+
+    def worker_receive(self) -> None:
+        """Forward messages of all workers to the callback"""
+        while True:
+            with self.lock:
+                connections = {
+                    connection: mode_name
+                    for mode_name, (_, connection, _) in self.workers.items()
+                }
+            if not connections:
+                threading.Event().wait(0.1)
+                continue
+
+            for connection in multiprocessing.connection.wait(list(connections), timeout=0.5):
+                mode_name = connections[connection]
+                try:
+                    message = connection.recv()
+                except EOFError:
+                    self.log.warning("[MDM] Demodulator process stopped", mode=mode_name)
+                    with self.lock:
+                        _, _, reader = self.workers.pop(mode_name)
+                    # nobody is reading anymore, free the reader slot
+                    self.audiobuffer.remove_reader(reader)
+                    continue
+                try:
+                    self.callback(mode_name, message)
+                except Exception as err:
+                    self.log.warning("[MDM] Demodulator message processing failed", mode=mode_name, e=err)
+
+    def stop(self) -> None:
+        """Stop all workers and remove the shared audio buffer"""
+        self.send_command("stop", None)
+        with self.lock:
+            workers = list(self.workers.values())
+        for process, _, _ in workers:
+            process.join(timeout=2)
+        self.audiobuffer.unlink()
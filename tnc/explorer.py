@@ -50,14 +50,14 @@ class explorer():
 
         for i in TNC.heard_stations:
             try:
-                callsign = str(i[0], "UTF-8")
-                grid = str(i[1], "UTF-8")
-                timestamp = i[2]
-                frequency = i[6]
+                callsign = str(i.dxcallsign, "UTF-8")
+                grid = str(i.dxgrid, "UTF-8")
+                timestamp = i.timestamp
+                frequency = i.frequency
                 try:
-                    snr = i[4].split("/")[1]
+                    snr = i.snr.split("/")[1]
                 except AttributeError:
-                    snr = str(i[4])
+                    snr = str(i.snr)
                 station_data["lastheard"].append({"callsign": callsign, "grid": grid, "snr": snr, "timestamp": timestamp, "frequency": frequency})
             except Exception as e:
                 log.debug("[EXPLORER] not publishing station", e=e)
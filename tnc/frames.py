@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+frames.py
+
+View on received frames. Frames are parsed without copying the payload,
+header fields are decoded on first access only, so frames which are not
+addressed to us are dropped after reading a few bytes.
+
+Demodulators decode into buffers of a FramePool. A buffer with a received
+frame is handed to the data handler, which owns it until it's released
+back to the pool, so the next decode can't overwrite an unprocessed frame.
+"""
+# pylint: disable=invalid-name, line-too-long
+
+import ctypes
+import threading
+from collections import deque
+
+import helpers
+from static import FRAME_TYPE as FR_TYPE
+
+# frame type byte -> name, for logging
+FRAME_TYPE_NAMES = {frametype.value: frametype.name for frametype in FR_TYPE}
+
+# frame types which are processed regardless of callsign and session id
+BROADCAST_FRAME_TYPES = frozenset(
+    frametype.value
+    for frametype in (
+        FR_TYPE.CQ,
+        FR_TYPE.QRV,
+        FR_TYPE.PING,
+        FR_TYPE.BEACON,
+        FR_TYPE.IS_WRITING,
+        FR_TYPE.FEC,
+        FR_TYPE.FEC_WAKEUP,
+    )
+)
+
+
+def frame_type_name(frametype: int) -> str:
+    """
+    Name of a frame type
+
+    Args:
+        frametype: frame type byte
+
+    Returns:
+        name of FRAME_TYPE or the number for unknown frame types
+    """
+    return FRAME_TYPE_NAMES.get(frametype, str(frametype))
+
+
+class ReceivedFrame:
+    """A received frame without CRC16"""
+
+    __slots__ = ("view", "_signalling_crc", "_data_crc")
+
+    def __init__(self, data, crc_size: int = 2) -> None:
+        """
+        Args:
+            data: bytes like object of the frame as returned by the modem, not copied
+            crc_size: size of the CRC at the end of the frame
+        """
+        self.view = memoryview(data).cast("B")[: -crc_size or None]
+        self._signalling_crc = None
+        self._data_crc = None
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def __bytes__(self) -> bytes:
+        return self.view.tobytes()
+
+    def hex(self) -> str:
+        return self.view.hex()
+
+    @property
+    def frametype(self) -> int:
+        return self.view[0]
+
+    @property
+    def signalling_session_id(self) -> int:
+        """Session id of signalling frames"""
+        return self.view[1]
+
+    @property
+    def data_session_id(self) -> int:
+        """Session id of arq data frames"""
+        return self.view[2]
+
+    @property
+    def signalling_crc(self) -> bytes:
+        """Callsign CRC of signalling frames"""
+        if self._signalling_crc is None:
+            self._signalling_crc = self.view[1:4].tobytes()
+        return self._signalling_crc
+
+    @property
+    def data_crc(self) -> bytes:
+        """Callsign CRC of arq data frames"""
+        if self._data_crc is None:
+            self._data_crc = self.view[2:5].tobytes()
+        return self._data_crc
+
+    def is_for_station(self, mycallsign: bytes, session_id) -> bool:
+        """
+        Check if the frame is a broadcast or addressed to us, cheapest checks first
+
+        Args:
+            mycallsign: our callsign
+            session_id: session id as single byte, None if we don't have a session
+
+        Returns:
+            True if the frame should be processed
+        """
+        if self.frametype in BROADCAST_FRAME_TYPES:
+            return True
+
+        # check for session ID
+        # signalling frames [1:2], arq data frames [2:3]
+        if session_id is not None and session_id[0] in (self.signalling_session_id, self.data_session_id):
+            return True
+
+        # check for callsign CRC
+        # signalling frames [1:4], arq data frames [2:5]
+        return (
+            helpers.check_callsign(mycallsign, self.signalling_crc)[0]
+            or helpers.check_callsign(mycallsign, self.data_crc)[0]
+        )
+
+
+class FramePool:
+    """Preallocated frame buffers, grouped by size"""
+
+    def __init__(self, max_free: int = 32) -> None:
+        """
+        Args:
+            max_free: maximum number of free buffers kept per size
+        """
+        self.max_free = max_free
+        self.free = {}
+        self.lock = threading.Lock()
+
+    def preallocate(self, size: int, count: int) -> None:
+        """
+        Allocate free buffers up front
+
+        Args:
+            size: bytes per frame
+            count: number of free buffers of this size
+        """
+        with self.lock:
+            buffers = self.free.setdefault(size, deque())
+            while len(buffers) < min(count, self.max_free):
+                buffers.append(ctypes.create_string_buffer(size))
+
+    def acquire(self, size: int):
+        """
+        Get a buffer, a new one is allocated if all buffers are in use
+
+        Args:
+            size: bytes per frame
+
+        Returns:
+            ctypes char buffer owned by the caller
+        """
+        with self.lock:
+            buffers = self.free.get(size)
+            if buffers:
+                return buffers.pop()
+        return ctypes.create_string_buffer(size)
+
+    def release(self, buffer) -> None:
+        """
+        Return a buffer after processing its frame, the caller must not use it anymore.
+        Other objects like frames of demodulator processes are ignored
+
+        Args:
+            buffer: buffer from acquire
+        """
+        if not isinstance(buffer, ctypes.Array):
+            return
+        with self.lock:
+            buffers = self.free.setdefault(len(buffer), deque())
+            if len(buffers) < self.max_free:
+                buffers.append(buffer)
+
+
+FRAME_POOL = FramePool()
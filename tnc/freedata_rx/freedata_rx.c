@@ -0,0 +1,37 @@
+/*
+ * freedata_rx.c
+ *
+ * Small helper library for the FreeDATA TNC, combining the codec2 calls
+ * which are needed for every demodulated block, so Python only has to do
+ * a single call into C per block.
+ *
+ * Built via the top level CMakeLists.txt, loaded by tnc/codec2.py if found
+ * next to the libcodec2 it has been linked against.
+ */
+
+#include "freedv_api.h"
+
+#ifdef _WIN32
+#define FREEDATA_EXPORT __declspec(dllexport)
+#else
+#define FREEDATA_EXPORT
+#endif
+
+/*
+ * Demodulate one block of nin samples
+ *
+ * f             codec2 instance
+ * bytes_out     buffer for the received frame
+ * demod_in      nin samples of 8 kHz audio
+ * rx_status     returns freedv_get_rx_status()
+ * nin           returns freedv_nin() for the next block
+ *
+ * returns number of bytes received, same as freedv_rawdatarx()
+ */
+FREEDATA_EXPORT int freedata_rx_step(struct freedv *f, unsigned char *bytes_out,
+                                     short demod_in[], int *rx_status, int *nin) {
+    int nbytes = freedv_rawdatarx(f, bytes_out, demod_in);
+    *rx_status = freedv_get_rx_status(f);
+    *nin = freedv_nin(f);
+    return nbytes;
+}
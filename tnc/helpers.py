@@ -4,9 +4,10 @@ Created on Fri Dec 25 21:25:14 2020
 
 @author: DJ2LS
 """
+import functools
 import time
 from datetime import datetime,timezone
-import crcengine
+import crc
 import static
 from static import ARQ, AudioParam, Beacon, Channel, Daemon, HamlibParam, ModemParam, Station, Statistics, TCIParam, TNC
 import structlog
@@ -15,6 +16,9 @@ import threading
 
 log = structlog.get_logger("helpers")
 
+# number of cached callsigns and grids per codec function
+CODEC_CACHE_SIZE = 1024
+
 
 def wait(seconds: float) -> bool:
     """
@@ -44,10 +48,7 @@ def get_crc_8(data) -> bytes:
     Returns:
         CRC-8 (CCITT) of the provided data as bytes
     """
-    crc_algorithm = crcengine.new("crc8-ccitt")  # load crc8 library
-    crc_data = crc_algorithm(data)
-    crc_data = crc_data.to_bytes(1, byteorder="big")
-    return crc_data
+    return crc.CRC8.digest(data)
 
 
 def get_crc_16(data) -> bytes:
@@ -63,10 +64,7 @@ def get_crc_16(data) -> bytes:
     Returns:
         CRC-16 (CCITT) of the provided data as bytes
     """
-    crc_algorithm = crcengine.new("crc16-ccitt-false")  # load crc16 library
-    crc_data = crc_algorithm(data)
-    crc_data = crc_data.to_bytes(2, byteorder="big")
-    return crc_data
+    return crc.CRC16.digest(data)
 
 
 def get_crc_24(data) -> bytes:
@@ -83,18 +81,7 @@ def get_crc_24(data) -> bytes:
     Returns:
         CRC-24 (OpenPGP) of the provided data as bytes
     """
-    crc_algorithm = crcengine.create(
-        0x864CFB,
-        24,
-        0xB704CE,
-        ref_in=False,
-        ref_out=False,
-        xor_out=0,
-        name="crc-24-openpgp",
-    )
-    crc_data = crc_algorithm(data)
-    crc_data = crc_data.to_bytes(3, byteorder="big")
-    return crc_data
+    return crc.CRC24.digest(data)
 
 
 def get_crc_32(data: bytes) -> bytes:
@@ -110,10 +97,7 @@ def get_crc_32(data: bytes) -> bytes:
     Returns:
         CRC-32 of the provided data as bytes
     """
-    crc_algorithm = crcengine.new("crc32")  # load crc32 library
-    crc_data = crc_algorithm(data)
-    crc_data = crc_data.to_bytes(4, byteorder="big")
-    return crc_data
+    return crc.CRC32.digest(data)
 
 
 def add_to_heard_stations(dxcallsign, dxgrid, datatype, snr, offset, frequency):
@@ -130,48 +114,10 @@ def add_to_heard_stations(dxcallsign, dxgrid, datatype, snr, offset, frequency):
     Returns:
         Nothing
     """
-    # check if buffer empty
-    if len(TNC.heard_stations) == 0:
-        TNC.heard_stations.append(
-            [dxcallsign, dxgrid, int(datetime.now(timezone.utc).timestamp()), datatype, snr, offset, frequency]
-        )
-    # if not, we search and update
-    else:
-        for i in range(len(TNC.heard_stations)):
-            # Update callsign with new timestamp
-            if TNC.heard_stations[i].count(dxcallsign) > 0:
-                TNC.heard_stations[i] = [
-                    dxcallsign,
-                    dxgrid,
-                    int(time.time()),
-                    datatype,
-                    snr,
-                    offset,
-                    frequency,
-                ]
-                break
-            # Insert if nothing found
-            if i == len(TNC.heard_stations) - 1:
-                TNC.heard_stations.append(
-                    [
-                        dxcallsign,
-                        dxgrid,
-                        int(time.time()),
-                        datatype,
-                        snr,
-                        offset,
-                        frequency,
-                    ]
-                )
-                break
-
-
-#    for idx, item in enumerate(TNC.heard_stations):
-#        if dxcallsign in item:
-#            item = [dxcallsign, int(time.time())]
-#            TNC.heard_stations[idx] = item
+    TNC.heard_stations.add(dxcallsign, dxgrid, datatype, snr, offset, frequency)
 
 
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
 def callsign_to_bytes(callsign) -> bytes:
     """
 
@@ -281,10 +227,31 @@ def bytes_to_callsign(bytestring: bytes) -> bytes:
     return bytes(f"{callsign}-{ssid}", "utf-8")
 
 
+@functools.lru_cache(maxsize=16)
+def get_callsign_crc_table(callsign: bytes, ssid_list: tuple) -> dict:
+    """
+    Build a lookup table of CRC24 to callsign with SSID. Cached, so the
+    table is only calculated again if the callsign or the SSID list changes.
+
+    Args:
+        callsign: Callsign without SSID
+        ssid_list: SSIDs we are responding to
+
+    Returns:
+        dict of CRC24 bytes to callsign with SSID bytes
+    """
+    crc_table = {}
+    for ssid in ssid_list:
+        call_with_ssid = callsign + b"-" + str(ssid).encode("utf-8")
+        # keep the first SSID in case of a collision, like a linear search
+        crc_table.setdefault(get_crc_24(call_with_ssid), call_with_ssid)
+    return crc_table
+
+
 def check_callsign(callsign: bytes, crc_to_check: bytes):
     """
     Function to check a crc against a callsign to calculate the
-    ssid by generating crc until we find the correct SSID
+    ssid by looking up the crc of all callsign and SSID combinations
 
     Args:
         callsign: Callsign which we want to check
@@ -294,30 +261,14 @@ def check_callsign(callsign: bytes, crc_to_check: bytes):
         [True, Callsign + SSID]
         False
     """
+    # We want the callsign without SSID
+    callsign = bytes(callsign).split(b"-")[0]
 
-    log.debug("[HLP] check_callsign: Checking:", callsign=callsign)
-    try:
-        # We want the callsign without SSID
-        callsign = callsign.split(b"-")[0]
-
-    except IndexError:
-        # This is expected when `callsign` doesn't have a dash.
-        pass
-    except Exception as err:
-        log.debug("[HLP] check_callsign: Error callsign SSID to integer:", e=err)
-
-    for ssid in Station.ssid_list:
-        call_with_ssid = bytearray(callsign)
-        call_with_ssid.extend("-".encode("utf-8"))
-        call_with_ssid.extend(str(ssid).encode("utf-8"))
-
-        callsign_crc = get_crc_24(call_with_ssid)
-
-        if callsign_crc == crc_to_check:
-            log.debug("[HLP] check_callsign matched:", call_with_ssid=call_with_ssid)
-            return [True, bytes(call_with_ssid)]
-
-    return [False, b'']
+    crc_table = get_callsign_crc_table(callsign, tuple(Station.ssid_list))
+    call_with_ssid = crc_table.get(bytes(crc_to_check))
+    if call_with_ssid is None:
+        return [False, b'']
+    return [True, call_with_ssid]
 
 
 def check_session_id(id: bytes, id_to_check: bytes):
@@ -338,6 +289,18 @@ def check_session_id(id: bytes, id_to_check: bytes):
     return id == id_to_check
 
 
+def new_session_id() -> bytes:
+    """
+    Create a random session id. 0 is never used, as frames of
+    older TNCs with session id 0 are not accepted by check_session_id
+
+    Returns:
+        session id as single byte
+    """
+    return bytes([np.random.randint(1, 256)])
+
+
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
 def encode_grid(grid):
     """
     @author: DB1UJ
@@ -380,8 +343,18 @@ def decode_grid(b_code_word: bytes):
     Returns:
         grid:str: upper case maidenhead QTH locater [A-R][A-R][0-9][0-9][A-X][A-X]
     """
-    code_word = int.from_bytes(b_code_word, byteorder="big", signed=False)
+    return decode_grid_word(int.from_bytes(b_code_word, byteorder="big", signed=False))
+
+
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
+def decode_grid_word(code_word: int):
+    """
+    Args:
+        code_word:int: encoded grid locator
 
+    Returns:
+        grid:str: upper case maidenhead QTH locater [A-R][A-R][0-9][0-9][A-X][A-X]
+    """
     grid = chr((code_word & 0b11111) + 65)
     code_word >>= 5
 
@@ -398,6 +371,7 @@ def decode_grid(b_code_word: bytes):
     return chr(int(int_first) + 65) + chr(int(int_sec) + 65) + grid
 
 
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
 def encode_call(call):
     """
     @author: DB1UJ
@@ -434,7 +408,18 @@ def decode_call(b_code_word: bytes):
     Returns:
         call:str: upper case ham radio call sign [A-Z,0-9] + binary SSID
     """
-    code_word = int.from_bytes(b_code_word, byteorder="big", signed=False)
+    return decode_call_word(int.from_bytes(b_code_word, byteorder="big", signed=False))
+
+
+@functools.lru_cache(maxsize=CODEC_CACHE_SIZE)
+def decode_call_word(code_word: int):
+    """
+    Args:
+        code_word:int: encoded call sign
+
+    Returns:
+        call:str: upper case ham radio call sign [A-Z,0-9] + binary SSID
+    """
     ssid = chr(code_word & 0b111111)  # save the uncoded binary SSID
 
     call = str()
@@ -447,6 +432,112 @@ def decode_call(b_code_word: bytes):
     return call
 
 
+def encode_calls(calls) -> np.ndarray:
+    """
+    Encode many call signs at once, e.g. for replaying logs
+
+    Args:
+        calls: list of str, ham radio call signs [A-Z,0-9], last char SSID 0-63
+
+    Returns:
+        numpy array of shape (len(calls), 6) with the encoded call signs like encode_call
+    """
+    if any(len(call) > 8 for call in calls):
+        raise ValueError("call sign longer than 8 chars")
+    # right aligned, leading "0" chars are zero bits like in encode_call
+    chars = "".join(call.upper()[:-1].rjust(7, "0") + call[-1:].rjust(1, "0") for call in calls)
+    values = np.frombuffer(chars.encode("latin-1"), dtype=np.uint8).reshape(-1, 8).astype(np.uint64)
+    values[:, :7] -= 48
+    values &= 0b111111
+    code_words = np.zeros(len(values), dtype=np.uint64)
+    for position in range(8):
+        code_words = (code_words << np.uint64(6)) | values[:, position]
+    return code_words_to_bytes(code_words, 6)
+
+
+def decode_calls(code_words) -> list:
+    """
+    Decode many call signs at once, e.g. for the explorer feed
+
+    Args:
+        code_words: bytes or numpy array with 6 bytes per call sign
+
+    Returns:
+        list of str like decode_call
+    """
+    code_words = bytes_to_code_words(code_words, 6)
+    values = np.empty((len(code_words), 8), dtype=np.uint8)
+    for position in range(8):
+        values[:, 7 - position] = (code_words >> np.uint64(6 * position)) & np.uint64(0b111111)
+    chars = (values + 48).astype(np.uint8)
+    # leading zero bits are no chars, like in decode_call
+    nonzero = values != 0
+    first = np.where(nonzero.any(axis=1), nonzero.argmax(axis=1), 8)
+    return [
+        chars[row, first[row]:7].tobytes().decode("latin-1") + chr(values[row, 7])
+        for row in range(len(values))
+    ]
+
+
+def encode_grids(grids) -> np.ndarray:
+    """
+    Encode many grid locators at once
+
+    Args:
+        grids: list of str, maidenhead QTH locaters [a-r][a-r][0-9][0-9][a-x][a-x]
+
+    Returns:
+        numpy array of shape (len(grids), 4) with the encoded grids like encode_grid
+    """
+    if any(len(grid) != 6 for grid in grids):
+        raise ValueError("grid locator needs 6 chars")
+    chars = np.frombuffer("".join(grids).upper().encode("latin-1"), dtype=np.uint8).reshape(-1, 6).astype(np.uint64)
+    letters = chars - 65
+    numbers = (chars[:, 2] - 48) * 10 + chars[:, 3] - 48
+    code_words = ((letters[:, 0] * 18 + letters[:, 1]) & np.uint64(0b111111111)) << np.uint64(21)
+    code_words |= (numbers & np.uint64(0b1111111)) << np.uint64(12)
+    code_words |= (letters[:, 4] & np.uint64(0b11111)) << np.uint64(5)
+    code_words |= letters[:, 5] & np.uint64(0b11111)
+    return code_words_to_bytes(code_words, 4)
+
+
+def decode_grids(code_words) -> list:
+    """
+    Decode many grid locators at once
+
+    Args:
+        code_words: bytes or numpy array with 4 bytes per grid
+
+    Returns:
+        list of str like decode_grid
+    """
+    code_words = bytes_to_code_words(code_words, 4)
+    first, second = np.divmod((code_words >> np.uint64(21)) & np.uint64(0b111111111), np.uint64(18))
+    numbers = (code_words >> np.uint64(12)) & np.uint64(0b1111111)
+    letters = np.stack(
+        [first, second, (code_words >> np.uint64(5)) & np.uint64(0b11111), code_words & np.uint64(0b11111)],
+        axis=1,
+    ) + np.uint64(65)
+    return [
+        chr(row[0]) + chr(row[1]) + f"{number:02d}" + chr(row[2]) + chr(row[3])
+        for row, number in zip(letters.tolist(), numbers.tolist())
+    ]
+
+
+def code_words_to_bytes(code_words: np.ndarray, length: int) -> np.ndarray:
+    """Big endian bytes of code words, shape (n, length)"""
+    return code_words.astype(">u8").view(np.uint8).reshape(-1, 8)[:, 8 - length:]
+
+
+def bytes_to_code_words(data, length: int) -> np.ndarray:
+    """Code words from big endian bytes with length bytes per code word"""
+    data = np.frombuffer(bytes(data), dtype=np.uint8) if isinstance(data, (bytes, bytearray, memoryview)) else np.asarray(data, dtype=np.uint8)
+    data = data.reshape(-1, length)
+    padded = np.zeros((len(data), 8), dtype=np.uint8)
+    padded[:, 8 - length:] = data
+    return padded.view(">u8").reshape(-1).astype(np.uint64)
+
+
 def snr_to_bytes(snr):
     """create a byte from snr value """
     # make sure we have onl 1 byte snr
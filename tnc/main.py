@@ -19,7 +19,6 @@ import argparse
 import multiprocessing
 import os
 import signal
-import socketserver
 import sys
 import threading
 import time
@@ -165,6 +164,38 @@ if __name__ == "__main__":
         action="store_true",
         help="Enable FSK mode for ping, beacon and CQ",
     )
+    PARSER.add_argument(
+        "--demod-processes",
+        dest="enable_demod_processes",
+        action="store_true",
+        help="Run demodulators in separate processes for using all cpu cores",
+    )
+    PARSER.add_argument(
+        "--tx-buffer-all",
+        dest="tx_buffer_all",
+        action="store_true",
+        help="Render the whole burst before transmitting, may help on slow cpus",
+    )
+    PARSER.add_argument(
+        "--heard-stations-max",
+        dest="heard_stations_max",
+        default=200,
+        type=int,
+        help="Maximum number of heard stations to keep",
+    )
+    PARSER.add_argument(
+        "--arq-compression",
+        dest="arq_compression",
+        choices=["lzma", "zlib", "zstd"],
+        default="lzma",
+        help="Compression codec for arq data, zstd needs the zstandard package",
+    )
+    PARSER.add_argument(
+        "--arq-offset-header",
+        dest="arq_offset_header",
+        action="store_true",
+        help="Offer burst headers with data offset when opening a data channel",
+    )
     PARSER.add_argument(
         "--qrv",
         dest="enable_respond_to_cq",
@@ -307,6 +338,11 @@ if __name__ == "__main__":
             TCIParam.ip = ARGS.tci_ip
             TCIParam.port = ARGS.tci_port
             ModemParam.tx_delay = ARGS.tx_delay
+            ModemParam.enable_demod_processes = ARGS.enable_demod_processes
+            ModemParam.tx_buffer_all = ARGS.tx_buffer_all
+            ARQ.arq_offset_header = ARGS.arq_offset_header
+            ARQ.arq_compression = ARGS.arq_compression
+            TNC.heard_stations.max_size = ARGS.heard_stations_max
 
         except Exception as e:
             log.error("[DMN] Error reading config file", exception=e)
@@ -358,6 +394,11 @@ if __name__ == "__main__":
             TCIParam.ip = str(conf.get('TCI', 'tci_ip', 'localhost'))
             TCIParam.port = int(conf.get('TCI', 'tci_port', '50001'))
             ModemParam.tx_delay = int(conf.get('TNC', 'tx_delay', '0'))
+            ModemParam.enable_demod_processes = conf.get('TNC', 'demod_processes', 'False')
+            ModemParam.tx_buffer_all = conf.get('TNC', 'tx_buffer_all', 'False')
+            ARQ.arq_offset_header = conf.get('TNC', 'arq_offset_header', 'False')
+            ARQ.arq_compression = str(conf.get('TNC', 'arq_compression', 'lzma'))
+            TNC.heard_stations.max_size = int(conf.get('TNC', 'heard_stations_max', '200'))
         except KeyError as e:
             log.warning("[CFG] Error reading config file near", key=str(e))
         except Exception as e:
@@ -398,6 +439,11 @@ if __name__ == "__main__":
         "[TNC] Starting FreeDATA", author="DJ2LS", version=TNC.version
     )
 
+    # demodulator processes need multiprocessing.shared_memory
+    if ModemParam.enable_demod_processes and sys.version_info < (3, 8):
+        log.error("[TNC] --demod-processes needs python 3.8 or newer", version=sys.version)
+        sys.exit(1)
+
     # start data handler
     data_handler.DATA()
 
@@ -412,11 +458,7 @@ if __name__ == "__main__":
     # --------------------------------------------START CMD SERVER
     try:
         log.info("[TNC] Starting TCP/IP socket", port=TNC.port)
-        # https://stackoverflow.com/a/16641793
-        socketserver.TCPServer.allow_reuse_address = True
-        cmdserver = sock.ThreadedTCPServer(
-            (TNC.host, TNC.port), sock.ThreadedTCPRequestHandler
-        )
+        cmdserver = sock.AsyncCommandServer((TNC.host, TNC.port))
         server_thread = threading.Thread(target=cmdserver.serve_forever)
 
         server_thread.daemon = True
@@ -18,7 +18,8 @@ import time
 from collections import deque
 import wave
 import codec2
-import itertools
+import demodulator
+import frames
 import numpy as np
 import sock
 import sounddevice as sd
@@ -28,7 +29,7 @@ from static import FRAME_TYPE
 import structlog
 import ujson as json
 import tci
-from queues import DATA_QUEUE_RECEIVED, MODEM_RECEIVED_QUEUE, MODEM_TRANSMIT_QUEUE, RIGCTLD_COMMAND_QUEUE, \
+from queues import DATA_QUEUE_RECEIVED, MODEM_TRANSMIT_QUEUE, RIGCTLD_COMMAND_QUEUE, \
     AUDIO_RECEIVED_QUEUE, AUDIO_TRANSMIT_QUEUE
 
 TESTMODE = False
@@ -82,15 +83,48 @@ class RF:
         # https://github.com/DJ2LS/FreeDATA/issues/127
         # https://github.com/DJ2LS/FreeDATA/issues/99
         self.mod_out_locked = True
+        # Minimum of chunks rendered ahead before starting a streamed transmission
+        self.TX_STREAM_MARGIN_CHUNKS = 1
+        # chunks rendered ahead for the current transmission, see get_tx_stream_margin
+        self.tx_stream_margin_chunks = self.TX_STREAM_MARGIN_CHUNKS
+        # worst render time of a single frame per mode in the last transmission
+        self.tx_frame_render_time = {}
+        # True while a started transmission is still being rendered
+        self.tx_rendering = False
+        # chunks of silence sent within a transmission, as rendering fell behind
+        self.tx_underruns = 0
+        self.tx_samples_queued = 0
+        self.tx_start_time = 0.0
 
         # Make sure our resampler will work
         assert (self.AUDIO_SAMPLE_RATE_RX / self.MODEM_SAMPLE_RATE) == codec2.api.FDMDV_OS_48  # type: ignore
 
         # init codec2 resampler
-        self.resampler = codec2.resampler()
+        self.resampler = codec2.resampler(self.AUDIO_FRAMES_PER_BUFFER_RX)
+        # separate resampler for tx, as tx segments are re-sampled without history
+        self.tx_resampler = codec2.resampler()
+        # silence for flushing the tail of the tx resampler filter
+        self.tx_resampler_flush = np.zeros(self.tx_resampler.MEM8, dtype=np.int16)
+        # rendered preamble and postamble per tx mode
+        self.tx_segment_cache = {}
+
+        # Preallocated 8 kHz output blocks for the rx resampler. We alternate
+        # between two of them, so fft_data stays valid while the next block
+        # is resampled
+        self.resampler_out8 = [
+            np.zeros(
+                self.AUDIO_FRAMES_PER_BUFFER_RX // codec2.api.FDMDV_OS_48,
+                dtype=np.int16,
+            )
+            for _ in range(2)
+        ]
+        self.resampler_out8_index = 0
+        # small block for the mkfifo reader, its output is copied to the rx buffer
+        self.mkfifo_out8 = np.zeros(8, dtype=np.int16)
 
         self.modem_transmit_queue = MODEM_TRANSMIT_QUEUE
-        self.modem_received_queue = MODEM_RECEIVED_QUEUE
+        # received frames are handed to the data handler directly
+        self.data_queue_received = DATA_QUEUE_RECEIVED
 
         self.audio_received_queue = AUDIO_RECEIVED_QUEUE
         self.audio_transmit_queue = AUDIO_TRANSMIT_QUEUE
@@ -98,8 +132,22 @@ class RF:
         # Init FIFO queue to store modulation out in
         self.modoutqueue = deque()
 
-        # Define fft_data buffer
+        # Define fft_data buffer, fft_data_ready is set for every new block
         self.fft_data = bytes()
+        self.fft_data_ready = threading.Event()
+
+        # Shared 8 kHz receive buffer, every demodulator reads from it
+        # with its own reader, so each audio block is written only once
+        if ModemParam.enable_demod_processes:
+            # demodulators are running in worker processes
+            self.rx_audio_buffer = codec2.shared_audio_buffer(
+                2 * self.AUDIO_FRAMES_PER_BUFFER_RX, max_readers=7
+            )
+        else:
+            self.rx_audio_buffer = codec2.audio_buffer(
+                2 * self.AUDIO_FRAMES_PER_BUFFER_RX, default_reader=False
+            )
+        self.demodulator_pool = None
 
         # Open codec2 instances
 
@@ -285,7 +333,24 @@ class RF:
             )
             fft_thread.start()
 
+        # readers without a demodulator would block the shared buffer
         if TNC.enable_fsk:
+            unused_readers = [
+                self.sig0_datac13_buffer,
+                self.sig1_datac13_buffer,
+                self.dat0_datac1_buffer,
+                self.dat0_datac3_buffer,
+                self.dat0_datac4_buffer,
+            ]
+        else:
+            unused_readers = [self.fsk_ldpc_buffer_0, self.fsk_ldpc_buffer_1]
+        for reader in unused_readers:
+            self.rx_audio_buffer.remove_reader(reader)
+
+        if ModemParam.enable_demod_processes:
+            self.start_demodulator_processes()
+
+        elif TNC.enable_fsk:
             audio_thread_fsk_ldpc0 = threading.Thread(
                 target=self.audio_fsk_ldpc_0, name="AUDIO_THREAD FSK LDPC0", daemon=True
             )
@@ -332,12 +397,6 @@ class RF:
         )
         hamlib_set_thread.start()
 
-        # self.log.debug("[MDM] Starting worker_receive")
-        worker_received = threading.Thread(
-            target=self.worker_received, name="WORKER_THREAD", daemon=True
-        )
-        worker_received.start()
-
         worker_transmit = threading.Thread(
             target=self.worker_transmit, name="WORKER_THREAD", daemon=True
         )
@@ -376,22 +435,9 @@ class RF:
             # x = self.resampler.resample48_to_8(x)
 
             self.fft_data = x
+            self.fft_data_ready.set()
 
-            length_x = len(x)
-            for data_buffer, receive in [
-                (self.sig0_datac13_buffer, RECEIVE_SIG0),
-                (self.sig1_datac13_buffer, RECEIVE_SIG1),
-                (self.dat0_datac1_buffer, RECEIVE_DATAC1),
-                (self.dat0_datac3_buffer, RECEIVE_DATAC3),
-                (self.dat0_datac4_buffer, RECEIVE_DATAC4),
-                (self.fsk_ldpc_buffer_0, TNC.enable_fsk),
-                (self.fsk_ldpc_buffer_1, TNC.enable_fsk),
-            ]:
-                if (
-                        not (data_buffer.nbuffer + length_x) > data_buffer.size
-                        and receive
-                ):
-                    data_buffer.push(x)
+            self.push_audio_to_demodulators(x)
 
     def mkfifo_read_callback(self) -> None:
         """
@@ -408,24 +454,10 @@ class RF:
 
                     while len(data_in48k) >= 48:
                         x = np.frombuffer(data_in48k[:48], dtype=np.int16)
-                        x = self.resampler.resample48_to_8(x)
+                        x = self.resampler.resample48_to_8(x, out=self.mkfifo_out8)
                         data_in48k = data_in48k[48:]
 
-                        length_x = len(x)
-                        for data_buffer, receive in [
-                            (self.sig0_datac13_buffer, RECEIVE_SIG0),
-                            (self.sig1_datac13_buffer, RECEIVE_SIG1),
-                            (self.dat0_datac1_buffer, RECEIVE_DATAC1),
-                            (self.dat0_datac3_buffer, RECEIVE_DATAC3),
-                            (self.dat0_datac4_buffer, RECEIVE_DATAC4),
-                            (self.fsk_ldpc_buffer_0, TNC.enable_fsk),
-                            (self.fsk_ldpc_buffer_1, TNC.enable_fsk),
-                        ]:
-                            if (
-                                    not (data_buffer.nbuffer + length_x) > data_buffer.size
-                                    and receive
-                            ):
-                                data_buffer.push(x)
+                        self.push_audio_to_demodulators(x)
 
     def mkfifo_write_callback(self) -> None:
         """Support testing by writing the audio data to a pipe."""
@@ -442,6 +474,36 @@ class RF:
                     fifo_write.flush()
                     fifo_write.flush()
 
+    def push_audio_to_demodulators(self, x) -> None:
+        """
+        Write a block of 8 kHz audio to the shared receive buffer
+
+        The RECEIVE_* flags (un)subscribe the reader of the respective
+        demodulator. The block is always written, if a subscribed reader
+        can't keep up, it loses its oldest unread samples and a buffer
+        overflow is counted for this reader only.
+
+        Args:
+            x: audio data as np.int16
+        """
+        subscriptions = [
+            (self.sig0_datac13_buffer, RECEIVE_SIG0),
+            (self.sig1_datac13_buffer, RECEIVE_SIG1),
+            (self.dat0_datac1_buffer, RECEIVE_DATAC1),
+            (self.dat0_datac3_buffer, RECEIVE_DATAC3),
+            (self.dat0_datac4_buffer, RECEIVE_DATAC4),
+            (self.fsk_ldpc_buffer_0, TNC.enable_fsk),
+            (self.fsk_ldpc_buffer_1, TNC.enable_fsk),
+        ]
+        for reader, receive in subscriptions:
+            reader.subscribe(receive)
+
+        overrun = self.rx_audio_buffer.push(x)
+        if overrun:
+            for index, (reader, _) in enumerate(subscriptions):
+                if reader in overrun:
+                    AudioParam.buffer_overflow_counter[index] += 1
+
     # --------------------------------------------------------------------
     def callback(self, data_in48k, outdata, frames, time, status) -> None:
         """
@@ -457,7 +519,10 @@ class RF:
         """
         # self.log.debug("[MDM] callback")
         x = np.frombuffer(data_in48k, dtype=np.int16)
-        x = self.resampler.resample48_to_8(x)
+        self.resampler_out8_index ^= 1
+        x = self.resampler.resample48_to_8(
+            x, out=self.resampler_out8[self.resampler_out8_index]
+        )
 
         # audio recording for debugging purposes
         if AudioParam.audio_record:
@@ -467,27 +532,16 @@ class RF:
         # Avoid decoding when transmitting to reduce CPU
         # TODO: Overriding this for testing purposes
         # if not TNC.transmitting:
-        length_x = len(x)
-        # Avoid buffer overflow by filling only if buffer for
-        # selected datachannel mode is not full
-        for audiobuffer, receive, index in [
-            (self.sig0_datac13_buffer, RECEIVE_SIG0, 0),
-            (self.sig1_datac13_buffer, RECEIVE_SIG1, 1),
-            (self.dat0_datac1_buffer, RECEIVE_DATAC1, 2),
-            (self.dat0_datac3_buffer, RECEIVE_DATAC3, 3),
-            (self.dat0_datac4_buffer, RECEIVE_DATAC4, 4),
-            (self.fsk_ldpc_buffer_0, TNC.enable_fsk, 5),
-            (self.fsk_ldpc_buffer_1, TNC.enable_fsk, 6),
-        ]:
-            if (audiobuffer.nbuffer + length_x) > audiobuffer.size:
-                AudioParam.buffer_overflow_counter[index] += 1
-            elif receive:
-                audiobuffer.push(x)
+        self.push_audio_to_demodulators(x)
         # end of "not TNC.transmitting" if block
 
         if not self.modoutqueue or self.mod_out_locked:
+            if not self.mod_out_locked and self.tx_rendering:
+                # transmission has started, but the next chunk isn't rendered yet
+                self.tx_underruns += 1
             data_out48k = np.zeros(frames, dtype=np.int16)
             self.fft_data = x
+            self.fft_data_ready.set()
         else:
             if not HamlibParam.ptt_state:
                 # TODO: Moved to this place for testing
@@ -499,6 +553,7 @@ class RF:
 
             data_out48k = self.modoutqueue.popleft()
             self.fft_data = data_out48k
+            self.fft_data_ready.set()
 
         try:
             outdata[:] = data_out48k[:frames]
@@ -558,92 +613,9 @@ class RF:
         bytes_per_frame = int(codec2.api.freedv_get_bits_per_modem_frame(freedv) / 8)
         payload_bytes_per_frame = bytes_per_frame - 2
 
-        # Init buffer for data
+        # Get number of samples for data, preamble and postamble
         n_tx_modem_samples = codec2.api.freedv_get_n_tx_modem_samples(freedv)
-        mod_out = ctypes.create_string_buffer(n_tx_modem_samples * 2)
-
-        # Init buffer for preample
-        n_tx_preamble_modem_samples = codec2.api.freedv_get_n_tx_preamble_modem_samples(
-            freedv
-        )
-        mod_out_preamble = ctypes.create_string_buffer(n_tx_preamble_modem_samples * 2)
-
-        # Init buffer for postamble
-        n_tx_postamble_modem_samples = (
-            codec2.api.freedv_get_n_tx_postamble_modem_samples(freedv)
-        )
-        mod_out_postamble = ctypes.create_string_buffer(
-            n_tx_postamble_modem_samples * 2
-        )
-
-        # Add empty data to handle ptt toggle time
-        if ModemParam.tx_delay > 0:
-            data_delay = int(self.MODEM_SAMPLE_RATE * (ModemParam.tx_delay / 1000))  # type: ignore
-            mod_out_silence = ctypes.create_string_buffer(data_delay * 2)
-            txbuffer = bytes(mod_out_silence)
-        else:
-            txbuffer = bytes()
-
-        self.log.debug(
-            "[MDM] TRANSMIT", mode=self.MODE, payload=payload_bytes_per_frame, delay=ModemParam.tx_delay
-        )
-
-        for _ in range(repeats):
-
-            # Create modulation for all frames in the list
-            for frame in frames:
-                # Write preamble to txbuffer
-                # codec2 fsk preamble may be broken -
-                # at least it sounds like that, so we are disabling it for testing
-                if self.MODE not in [
-                    codec2.FREEDV_MODE.fsk_ldpc_0.value,
-                    codec2.FREEDV_MODE.fsk_ldpc_1.value,
-                ]:
-                    # Write preamble to txbuffer
-                    codec2.api.freedv_rawdatapreambletx(freedv, mod_out_preamble)
-                    txbuffer += bytes(mod_out_preamble)
-
-                # Create buffer for data
-                # Use this if CRC16 checksum is required (DATAc1-3)
-                buffer = bytearray(payload_bytes_per_frame)
-                # Set buffersize to length of data which will be send
-                buffer[: len(frame)] = frame  # type: ignore
-
-                # Create crc for data frame -
-                #   Use the crc function shipped with codec2
-                #   to avoid CRC algorithm incompatibilities
-                # Generate CRC16
-                crc = ctypes.c_ushort(
-                    codec2.api.freedv_gen_crc16(bytes(buffer), payload_bytes_per_frame)
-                )
-                # Convert crc to 2-byte (16-bit) hex string
-                crc = crc.value.to_bytes(2, byteorder="big")
-                # Append CRC to data buffer
-                buffer += crc
-
-                data = (ctypes.c_ubyte * bytes_per_frame).from_buffer_copy(buffer)
-                # modulate DATA and save it into mod_out pointer
-                codec2.api.freedv_rawdatatx(freedv, mod_out, data)
-                txbuffer += bytes(mod_out)
-
-                # codec2 fsk postamble may be broken -
-                # at least it sounds like that, so we are disabling it for testing
-                if self.MODE not in [
-                    codec2.FREEDV_MODE.fsk_ldpc_0.value,
-                    codec2.FREEDV_MODE.fsk_ldpc_1.value,
-                ]:
-                    # Write postamble to txbuffer
-                    codec2.api.freedv_rawdatapostambletx(freedv, mod_out_postamble)
-                    # Append postamble to txbuffer
-                    txbuffer += bytes(mod_out_postamble)
-
-            # Add delay to end of frames
-            samples_delay = int(self.MODEM_SAMPLE_RATE * (repeat_delay / 1000))  # type: ignore
-            mod_out_silence = ctypes.create_string_buffer(samples_delay * 2)
-            txbuffer += bytes(mod_out_silence)
-
-        # Re-sample back up to 48k (resampler works on np.int16)
-        x = np.frombuffer(txbuffer, dtype=np.int16)
+        mod_out = np.zeros(n_tx_modem_samples, dtype=np.int16)
 
         # enable / disable AUDIO TUNE Feature / ALC correction
         if AudioParam.audio_auto_tune:
@@ -672,41 +644,129 @@ class RF:
             else:
                 self.log.debug("[MDM] AUDIO TUNE", audio_level=str(AudioParam.tx_audio_level),
                                alc_level=str(HamlibParam.alc))
-        x = set_audio_volume(x, AudioParam.tx_audio_level)
 
+        # Get already rendered preamble and postamble for current tx audio level
+        preamble, postamble = self.get_tx_segments(mode, freedv)
+        n_tx_preamble_modem_samples = (
+            codec2.api.freedv_get_n_tx_preamble_modem_samples(freedv) if len(preamble) else 0
+        )
+        n_tx_postamble_modem_samples = (
+            codec2.api.freedv_get_n_tx_postamble_modem_samples(freedv) if len(postamble) else 0
+        )
+
+        # Add empty data to handle ptt toggle time
+        data_delay = max(int(self.MODEM_SAMPLE_RATE * (ModemParam.tx_delay / 1000)), 0)  # type: ignore
+        # Add delay to end of frames
+        samples_delay = int(self.MODEM_SAMPLE_RATE * (repeat_delay / 1000))  # type: ignore
+
+        # Calculate the length of the whole transmission, so we can render
+        # directly into a single buffer. Silence is already part of it.
+        samples_per_frame = (
+            n_tx_preamble_modem_samples + n_tx_modem_samples + n_tx_postamble_modem_samples
+        )
+        n_samples = data_delay + repeats * (len(frames) * samples_per_frame + samples_delay)
+
+        # Segments are rendered separately including the tail of the
+        # resampler filter, which overlaps the next segment. Pad the output
+        # to a multiple of the chunk length, so every chunk is a view into
+        # the same buffer
+        chunk_length = self.AUDIO_FRAMES_PER_BUFFER_TX  # 4800
         if not AudioParam.audio_enable_tci:
-            txbuffer_out = self.resampler.resample8_to_48(x)
+            oversampling = codec2.api.FDMDV_OS_48
+            n_out = (n_samples + self.tx_resampler.MEM8) * oversampling
         else:
-            txbuffer_out = x
+            oversampling = 1
+            n_out = n_samples
+        txbuffer_out = np.zeros(-(-n_out // chunk_length) * chunk_length, dtype=np.int16)
+        position = data_delay * oversampling
+
+        # Scratch buffers reused for every frame: rendered payload and the
+        # sum of a segment and the overlapping tail of the previous one
+        if AudioParam.audio_enable_tci:
+            payload_out = None
+            n_payload_out = n_tx_modem_samples
+        else:
+            n_payload_out = (n_tx_modem_samples + self.tx_resampler.MEM8) * oversampling
+            payload_out = np.zeros(n_payload_out, dtype=np.int16)
+        segment_sum = np.zeros(max(n_payload_out, len(preamble), len(postamble)), dtype=np.int32)
+
+        self.log.debug(
+            "[MDM] TRANSMIT", mode=self.MODE, payload=payload_bytes_per_frame, delay=ModemParam.tx_delay
+        )
 
         # Explicitly lock our usage of mod_out_queue if needed
         # This could avoid audio problems on slower CPU
         # we will fill our modout list with all data, then start
-        # processing it in audio callback
+        # processing it in audio callback.
+        # Otherwise we hand over chunks as soon as they are complete and
+        # start audio output while later frames are still being modulated
         self.mod_out_locked = True
+        self.tx_samples_queued = 0
+        self.tx_underruns = 0
+        self.tx_stream_margin_chunks = self.get_tx_stream_margin(
+            mode, samples_per_frame * oversampling, oversampling * self.MODEM_SAMPLE_RATE, chunk_length
+        )
+        frame_render_time = 0.0
+        self.tx_rendering = True
+        # Release the delay before the first frame right away
+        self.queue_tx_chunks(txbuffer_out, chunk_length, position)
 
-        # -------------------------------
-        chunk_length = self.AUDIO_FRAMES_PER_BUFFER_TX  # 4800
-        chunk = [
-            txbuffer_out[i: i + chunk_length]
-            for i in range(0, len(txbuffer_out), chunk_length)
-        ]
-        for c in chunk:
-            # Pad the chunk, if needed
-            if len(c) < chunk_length:
-                delta = chunk_length - len(c)
-                delta_zeros = np.zeros(delta, dtype=np.int16)
-                c = np.append(c, delta_zeros)
-                # self.log.debug("[MDM] mod out shorter than audio buffer", delta=delta)
-            self.modoutqueue.append(c)
-
-        # Release our mod_out_lock, so we can use the queue
-        self.mod_out_locked = False
+        for _ in range(repeats):
+
+            # Create modulation for all frames in the list
+            for frame in frames:
+                render_start = time.monotonic()
+                if n_tx_preamble_modem_samples:
+                    # Add preamble to txbuffer
+                    add_tx_segment(txbuffer_out, position, preamble, segment_sum)
+                    position += n_tx_preamble_modem_samples * oversampling
+                    self.queue_tx_chunks(txbuffer_out, chunk_length, position)
+
+                # Create buffer for data
+                # Use this if CRC16 checksum is required (DATAc1-3)
+                buffer = bytearray(payload_bytes_per_frame)
+                # Set buffersize to length of data which will be send
+                buffer[: len(frame)] = frame  # type: ignore
+
+                # Create crc for data frame -
+                #   Use the crc function shipped with codec2
+                #   to avoid CRC algorithm incompatibilities
+                # Generate CRC16
+                crc = ctypes.c_ushort(
+                    codec2.api.freedv_gen_crc16(bytes(buffer), payload_bytes_per_frame)
+                )
+                # Convert crc to 2-byte (16-bit) hex string
+                crc = crc.value.to_bytes(2, byteorder="big")
+                # Append CRC to data buffer
+                buffer += crc
+
+                data = (ctypes.c_ubyte * bytes_per_frame).from_buffer_copy(buffer)
+                # modulate DATA and add it to txbuffer
+                codec2.api.freedv_rawdatatx(freedv, mod_out.ctypes, data)
+                payload = self.render_tx_segment(mod_out, out=payload_out)
+                add_tx_segment(txbuffer_out, position, payload, segment_sum)
+                position += n_tx_modem_samples * oversampling
+                self.queue_tx_chunks(txbuffer_out, chunk_length, position)
+
+                if n_tx_postamble_modem_samples:
+                    # Add postamble to txbuffer
+                    add_tx_segment(txbuffer_out, position, postamble, segment_sum)
+                    position += n_tx_postamble_modem_samples * oversampling
+                    self.queue_tx_chunks(txbuffer_out, chunk_length, position)
+                frame_render_time = max(frame_render_time, time.monotonic() - render_start)
+
+            # Delay at end of frames is already zero
+            position += samples_delay * oversampling
+
+        # Queue the remaining chunks including the resampler filter tail
+        self.queue_tx_chunks(txbuffer_out, chunk_length, len(txbuffer_out), final=True)
+        self.tx_rendering = False
+        self.tx_frame_render_time[mode] = frame_render_time
 
         # we need to wait manually for tci processing
         if AudioParam.audio_enable_tci:
             duration = len(txbuffer_out) / 8000
-            timestamp_to_sleep = time.time() + duration
+            timestamp_to_sleep = self.tx_start_time + duration
             self.log.debug("[MDM] TCI calculated duration", duration=duration)
             tci_timeout_reached = False
             #while time.time() < timestamp_to_sleep:
@@ -744,10 +804,150 @@ class RF:
         end_of_transmission = time.time()
         transmission_time = end_of_transmission - start_of_transmission
         self.log.debug("[MDM] ON AIR TIME", time=transmission_time)
+        if self.tx_underruns:
+            self.log.warning(
+                "[MDM] Audio gaps within transmission, rendering was too slow - consider --tx-buffer-all",
+                underruns=self.tx_underruns,
+                margin_chunks=self.tx_stream_margin_chunks,
+            )
+
+    def render_tx_segment(self, samples, out=None) -> np.ndarray:
+        """
+        Scale a segment of 8 kHz modulation by the tx audio level and
+        re-sample it to 48 kHz, if not using TCI
+
+        The segment is re-sampled without history and includes the tail of
+        the re-sampling filter, so segments can be added to the tx buffer
+        with overlap, giving the same audio as re-sampling all at once.
+
+        :param samples: 8 kHz modulation
+        :type samples: NDArray[np.int16]
+        :param out: optional array for the re-sampled segment, reused by the caller
+        :type out: NDArray[np.int16]
+        :return: rendered segment
+        :rtype: NDArray[np.int16]
+        """
+        x = set_audio_volume(samples, AudioParam.tx_audio_level)
+        if AudioParam.audio_enable_tci:
+            return x
+
+        n_segment = (len(x) + self.tx_resampler.MEM8) * codec2.api.FDMDV_OS_48
+        if out is None:
+            out = np.zeros(n_segment, dtype=np.int16)
+        n48 = len(x) * codec2.api.FDMDV_OS_48
+
+        # Re-sample back up to 48k (resampler works on np.int16),
+        # followed by silence for the tail of the filter
+        self.tx_resampler.reset()
+        self.tx_resampler.resample8_to_48(x, out=out[:n48])
+        self.tx_resampler.resample8_to_48(self.tx_resampler_flush, out=out[n48:n_segment])
+        return out[:n_segment]
+
+    def get_tx_segments(self, mode: int, freedv: ctypes.c_void_p) -> tuple:
+        """
+        Return rendered preamble and postamble of a mode from cache
+
+        Preamble and postamble are the same for every transmission, so they
+        only need to be modulated and re-sampled again if the tx audio level
+        changes.
+
+        :param mode: codec2 mode
+        :type mode: int
+        :param freedv: codec2 tx instance of this mode
+        :type freedv: ctypes.c_void_p
+        :return: preamble, postamble, empty if not used by this mode
+        :rtype: tuple
+        """
+        key = (AudioParam.tx_audio_level, AudioParam.audio_enable_tci)
+        cached = self.tx_segment_cache.get(mode)
+        if cached and cached[0] == key:
+            return cached[1], cached[2]
+
+        # codec2 fsk preamble and postamble may be broken -
+        # at least it sounds like that, so we are disabling it for testing
+        if mode in [
+            codec2.FREEDV_MODE.fsk_ldpc_0.value,
+            codec2.FREEDV_MODE.fsk_ldpc_1.value,
+        ]:
+            preamble = postamble = np.zeros(0, dtype=np.int16)
+        else:
+            mod_out_preamble = np.zeros(
+                codec2.api.freedv_get_n_tx_preamble_modem_samples(freedv), dtype=np.int16
+            )
+            codec2.api.freedv_rawdatapreambletx(freedv, mod_out_preamble.ctypes)
+            preamble = self.render_tx_segment(mod_out_preamble)
+
+            mod_out_postamble = np.zeros(
+                codec2.api.freedv_get_n_tx_postamble_modem_samples(freedv), dtype=np.int16
+            )
+            codec2.api.freedv_rawdatapostambletx(freedv, mod_out_postamble.ctypes)
+            postamble = self.render_tx_segment(mod_out_postamble)
+
+        self.log.debug("[MDM] Rendered preamble and postamble", mode=mode, level=AudioParam.tx_audio_level)
+        self.tx_segment_cache[mode] = (key, preamble, postamble)
+        return preamble, postamble
+
+    def get_tx_stream_margin(self, mode: int, samples_per_frame: int, sample_rate: int, chunk_length: int) -> int:
+        """
+        Number of chunks to render ahead before starting a streamed transmission
+
+        The margin covers the worst render time of a single frame of the
+        last transmission in this mode twice. Without a measurement, a
+        whole frame is rendered ahead.
+
+        :param mode: codec2 mode
+        :type mode: int
+        :param samples_per_frame: output samples of preamble, payload and postamble
+        :type samples_per_frame: int
+        :param sample_rate: output sample rate
+        :type sample_rate: int
+        :param chunk_length: samples per chunk
+        :type chunk_length: int
+        :return: number of chunks
+        :rtype: int
+        """
+        render_time = self.tx_frame_render_time.get(mode)
+        if render_time is None:
+            margin_samples = samples_per_frame
+        else:
+            margin_samples = 2 * render_time * sample_rate
+        return max(self.TX_STREAM_MARGIN_CHUNKS, int(-(-margin_samples // chunk_length)))
+
+    def queue_tx_chunks(self, txbuffer_out, chunk_length: int, end: int, final: bool = False) -> None:
+        """
+        Hand over completed chunks of the tx buffer to the audio callback
+
+        Segments are only added at or after the current render position,
+        so every chunk before it is complete. Unless the whole burst has to
+        be rendered first, the queue is unlocked as soon as the first chunk
+        and a safety margin are available.
+
+        :param txbuffer_out: tx buffer of the current transmission
+        :type txbuffer_out: NDArray[np.int16]
+        :param chunk_length: samples per chunk
+        :type chunk_length: int
+        :param end: current render position
+        :type end: int
+        :param final: rendering is finished, release everything
+        :type final: bool
+        """
+        end -= end % chunk_length
+        for i in range(self.tx_samples_queued, end, chunk_length):
+            self.modoutqueue.append(txbuffer_out[i: i + chunk_length])
+        self.tx_samples_queued = max(self.tx_samples_queued, end)
+
+        if self.mod_out_locked and (
+            final
+            or not ModemParam.tx_buffer_all
+            and len(self.modoutqueue) > self.tx_stream_margin_chunks
+        ):
+            # Release our mod_out_lock, so we can use the queue
+            self.tx_start_time = time.time()
+            self.mod_out_locked = False
 
     def demodulate_audio(
             self,
-            audiobuffer: codec2.audio_buffer,
+            audiobuffer: codec2.audio_buffer_reader,
             nin: int,
             freedv: ctypes.c_void_p,
             bytes_out,
@@ -757,10 +957,12 @@ class RF:
     ) -> int:
         """
         De-modulate supplied audio stream with supplied codec2 instance.
-        Decoded audio is placed into `bytes_out`.
+        Decoded audio is placed into `bytes_out`. A buffer holding a received
+        frame is handed to the data handler, which releases it to the frame pool
+        after processing, and decoding continues with a buffer from the pool.
 
         :param audiobuffer: Incoming audio
-        :type audiobuffer: codec2.audio_buffer
+        :type audiobuffer: codec2.audio_buffer_reader
         :param nin: Number of frames codec2 is expecting
         :type nin: int
         :param freedv: codec2 instance
@@ -777,13 +979,19 @@ class RF:
         :rtype: int
         """
         nbytes = 0
+        # outputs of codec2.rx_step
+        rx_status_out = ctypes.c_int()
+        nin_out = ctypes.c_int()
         try:
             while self.stream.active:
-                threading.Event().wait(0.01)
+                # sleep until the audio producer signals enough samples,
+                # the timeout is only needed for checking the stream state
+                audiobuffer.wait_for_samples(nin, timeout=1)
                 while audiobuffer.nbuffer >= nin:
-                    # demodulate audio
-                    nbytes = codec2.api.freedv_rawdatarx(
-                        freedv, bytes_out, audiobuffer.buffer.ctypes
+                    # demodulate audio and get current modem state and nin
+                    # with a single call
+                    nbytes = codec2.rx_step(
+                        freedv, bytes_out, audiobuffer.buffer.ctypes, rx_status_out, nin_out
                     )
                     # get current modem states and write to list
                     # 1 trial
@@ -791,7 +999,7 @@ class RF:
                     # 3 trial sync
                     # 6 decoded
                     # 10 error decoding == NACK
-                    rx_status = codec2.api.freedv_get_rx_status(freedv)
+                    rx_status = rx_status_out.value
 
                     if rx_status != 0:
                         # we need to disable this if in testmode as its causing problems with FIFO it seems
@@ -809,7 +1017,7 @@ class RF:
                         state_buffer.append(rx_status)
 
                     audiobuffer.pop(nin)
-                    nin = codec2.api.freedv_nin(freedv)
+                    nin = nin_out.value
                     if nbytes == bytes_per_frame:
 
                         # process commands only if TNC.listen = True
@@ -819,20 +1027,15 @@ class RF:
                             # ignore data channel opener frames for avoiding toggle states
                             # use case: opener already received, but ack got lost and we are receiving
                             # an opener again
-                            if mode_name in ["sig1-datac13"] and int.from_bytes(bytes(bytes_out[:1]), "big") in [
-                                FRAME_TYPE.ARQ_SESSION_OPEN.value,
-                                FRAME_TYPE.ARQ_DC_OPEN_W.value,
-                                FRAME_TYPE.ARQ_DC_OPEN_ACK_W.value,
-                                FRAME_TYPE.ARQ_DC_OPEN_N.value,
-                                FRAME_TYPE.ARQ_DC_OPEN_ACK_N.value
-                            ]:
+                            if is_ignored_opener(mode_name, bytes_out):
                                 print("dropp")
                             else:
                                 self.log.debug(
                                     "[MDM] [demod_audio] Pushing received data to received_queue", nbytes=nbytes
                                 )
 
-                                self.modem_received_queue.put([bytes_out, freedv, bytes_per_frame])
+                                self.data_queue_received.put([bytes_out, freedv, bytes_per_frame])
+                                bytes_out = frames.FRAME_POOL.acquire(bytes_per_frame)
                                 self.get_scatter(freedv)
                                 self.calculate_snr(freedv)
                                 state_buffer = []
@@ -857,45 +1060,20 @@ class RF:
         Returns:
             c2instance, bytes_per_frame, bytes_out, audio_buffer, nin
         """
-        if adv:
-            # FSK Long-distance Parity Code 1 - data frames
-            c2instance = ctypes.cast(
-                codec2.api.freedv_open_advanced(
-                    codec2.FREEDV_MODE.fsk_ldpc.value,
-                    ctypes.byref(adv),
-                ),
-                ctypes.c_void_p,
-            )
-        else:
-
-            # create codec2 instance
-            c2instance = ctypes.cast(
-                codec2.api.freedv_open(mode), ctypes.c_void_p
-            )
-
-        # set tuning range
-        codec2.api.freedv_set_tuning_range(
-            c2instance,
-            ctypes.c_float(ModemParam.tuning_range_fmin),
-            ctypes.c_float(ModemParam.tuning_range_fmax),
-        )
+        if ModemParam.enable_demod_processes:
+            # the codec2 instance is opened by the demodulator process,
+            # only the audio buffer reader is needed here
+            return None, 0, None, self.rx_audio_buffer.add_reader(), 0
 
-        # get bytes per frame
-        bytes_per_frame = int(
-            codec2.api.freedv_get_bits_per_modem_frame(c2instance) / 8
+        c2instance, bytes_per_frame, bytes_out, nin = demodulator.open_rx_instance(
+            mode, adv, ModemParam.tuning_range_fmin, ModemParam.tuning_range_fmax
         )
 
-        # create byte out buffer
-        bytes_out = ctypes.create_string_buffer(bytes_per_frame)
-
-        # set initial frames per burst
-        codec2.api.freedv_set_frames_per_burst(c2instance, 1)
-
-        # init audio buffer
-        audio_buffer = codec2.audio_buffer(2 * self.AUDIO_FRAMES_PER_BUFFER_RX)
+        # buffers for frames waiting in the data handler
+        frames.FRAME_POOL.preallocate(bytes_per_frame, 4)
 
-        # get initial nin
-        nin = codec2.api.freedv_nin(c2instance)
+        # subscribe to shared audio buffer
+        audio_buffer = self.rx_audio_buffer.add_reader()
 
         # Additional Datac0-specific information - these are not referenced anywhere else.
         # self.sig0_datac0_payload_per_frame = self.sig0_datac0_bytes_per_frame - 2
@@ -1015,16 +1193,83 @@ class RF:
             )
             # self.modem_transmit_queue.task_done()
 
-    def worker_received(self) -> None:
-        """Worker for FIFO queue for processing received frames"""
-        while True:
-            data = self.modem_received_queue.get()
-            self.log.debug("[MDM] worker_received: received data!")
-            # data[0] = bytes_out
-            # data[1] = freedv session
-            # data[2] = bytes_per_frame
-            DATA_QUEUE_RECEIVED.put([data[0], data[1], data[2]])
-            self.modem_received_queue.task_done()
+    def start_demodulator_processes(self) -> None:
+        """Run the demodulators in worker processes instead of threads"""
+        self.demodulator_pool = demodulator.DemodulatorPool(
+            self.rx_audio_buffer, self.process_demodulator_message
+        )
+        if TNC.enable_fsk:
+            demodulators = [
+                ("fsk_ldpc0", codec2.FREEDV_MODE.fsk_ldpc.value, "FREEDV_MODE_FSK_LDPC_0_ADV", self.fsk_ldpc_buffer_0),
+                ("fsk_ldpc1", codec2.FREEDV_MODE.fsk_ldpc.value, "FREEDV_MODE_FSK_LDPC_1_ADV", self.fsk_ldpc_buffer_1),
+            ]
+        else:
+            demodulators = [
+                ("sig0-datac13", codec2.FREEDV_MODE.datac13.value, None, self.sig0_datac13_buffer),
+                ("sig1-datac13", codec2.FREEDV_MODE.datac13.value, None, self.sig1_datac13_buffer),
+                ("dat0-datac1", codec2.FREEDV_MODE.datac1.value, None, self.dat0_datac1_buffer),
+                ("dat0-datac3", codec2.FREEDV_MODE.datac3.value, None, self.dat0_datac3_buffer),
+                ("dat0-datac4", codec2.FREEDV_MODE.datac4.value, None, self.dat0_datac4_buffer),
+            ]
+
+        for mode_name, mode, adv_name, reader in demodulators:
+            self.demodulator_pool.start(
+                mode_name,
+                mode,
+                adv_name,
+                reader,
+                (ModemParam.tuning_range_fmin, ModemParam.tuning_range_fmax),
+                ModemParam.enable_scatter,
+            )
+
+    def process_demodulator_message(self, mode_name: str, message: tuple) -> None:
+        """
+        Process modem states and received frames of a demodulator process,
+        same as demodulate_audio does for demodulator threads
+
+        :param mode_name: mode name
+        :type mode_name: str
+        :param message: ("state", rx_status) or ("frame", bytes_out, bytes_per_frame, snr, scatter)
+        :type message: tuple
+        """
+        if message[0] == "state":
+            rx_status = message[1]
+            # we need to disable this if in testmode as its causing problems with FIFO it seems
+            if not TESTMODE:
+                ModemParam.is_codec2_traffic = rx_status != 0
+            if rx_status == 10:
+                {
+                    "sig0-datac13": SIG0_DATAC13_STATE,
+                    "sig1-datac13": SIG1_DATAC13_STATE,
+                    "dat0-datac1": DAT0_DATAC1_STATE,
+                    "dat0-datac3": DAT0_DATAC3_STATE,
+                    "dat0-datac4": DAT0_DATAC4_STATE,
+                    "fsk_ldpc0": FSK_LDPC0_STATE,
+                    "fsk_ldpc1": FSK_LDPC1_STATE,
+                }[mode_name].append(rx_status)
+            return
+
+        _, bytes_out, bytes_per_frame, snr, scatter = message
+        # process commands only if TNC.listen = True
+        if not TNC.listen:
+            self.log.warning(
+                "[MDM] [demod_audio] received frame but ignored processing",
+                listen=TNC.listen
+            )
+            return
+        if is_ignored_opener(mode_name, bytes_out):
+            return
+
+        if ModemParam.enable_scatter:
+            ModemParam.scatter = scatter
+        self.log.info("[MDM] calculate_snr: ", snr=snr)
+        ModemParam.snr = snr
+
+        self.log.debug(
+            "[MDM] [demod_audio] Pushing received data to received_queue", nbytes=bytes_per_frame
+        )
+        # there is no local freedv instance for this frame
+        self.data_queue_received.put([bytes_out, None, bytes_per_frame])
 
     def get_frequency_offset(self, freedv: ctypes.c_void_p) -> float:
         """
@@ -1053,35 +1298,7 @@ class RF:
         if not ModemParam.enable_scatter:
             return
 
-        modemStats = codec2.MODEMSTATS()
-        ctypes.cast(
-            codec2.api.freedv_get_modem_extended_stats(freedv, ctypes.byref(modemStats)),
-            ctypes.c_void_p,
-        )
-
-        scatterdata = []
-        # original function before itertool
-        # for i in range(codec2.MODEM_STATS_NC_MAX):
-        #    for j in range(1, codec2.MODEM_STATS_NR_MAX, 2):
-        #        # print(f"{modemStats.rx_symbols[i][j]} - {modemStats.rx_symbols[i][j]}")
-        #        xsymbols = round(modemStats.rx_symbols[i][j - 1] // 1000)
-        #        ysymbols = round(modemStats.rx_symbols[i][j] // 1000)
-        #        if xsymbols != 0.0 and ysymbols != 0.0:
-        #            scatterdata.append({"x": str(xsymbols), "y": str(ysymbols)})
-
-        for i, j in itertools.product(range(codec2.MODEM_STATS_NC_MAX), range(1, codec2.MODEM_STATS_NR_MAX, 2)):
-            # print(f"{modemStats.rx_symbols[i][j]} - {modemStats.rx_symbols[i][j]}")
-            xsymbols = round(modemStats.rx_symbols[i][j - 1] // 1000)
-            ysymbols = round(modemStats.rx_symbols[i][j] // 1000)
-            if xsymbols != 0.0 and ysymbols != 0.0:
-                scatterdata.append({"x": str(xsymbols), "y": str(ysymbols)})
-
-        # Send all the data if we have too-few samples, otherwise send a sampling
-        if 150 > len(scatterdata) > 0:
-            ModemParam.scatter = scatterdata
-        else:
-            # only take every tenth data point
-            ModemParam.scatter = scatterdata[::10]
+        ModemParam.scatter = demodulator.get_scatter_data(freedv)
 
     def calculate_snr(self, freedv: ctypes.c_void_p) -> float:
         """
@@ -1095,16 +1312,7 @@ class RF:
         :rtype: float
         """
         try:
-            modem_stats_snr = ctypes.c_float()
-            modem_stats_sync = ctypes.c_int()
-
-            codec2.api.freedv_get_modem_stats(
-                freedv, ctypes.byref(modem_stats_sync), ctypes.byref(modem_stats_snr)
-            )
-            modem_stats_snr = modem_stats_snr.value
-            modem_stats_sync = modem_stats_sync.value
-
-            snr = round(modem_stats_snr, 1)
+            snr = demodulator.get_snr(freedv)
             self.log.info("[MDM] calculate_snr: ", snr=snr)
             ModemParam.snr = snr
             # ModemParam.snr = np.clip(
@@ -1162,6 +1370,10 @@ class RF:
         """
         Calculate an average signal strength of the channel to assess
         whether the channel is "busy."
+
+        The spectrum is calculated once for every new audio block, see
+        fft_data_ready. Windows and work arrays are kept per block length,
+        so only the rfft itself allocates.
         """
         # Initialize channel_busy_delay counter
         channel_busy_delay = 0
@@ -1169,115 +1381,121 @@ class RF:
         # Initialize dbfs counter
         rms_counter = 0
 
+        # Reduce area where the busy detection is enabled
+        # We want to have this in correlation with mode bandwidth
+        # TODO: This is not correctly and needs to be checked for correct maths
+        # dfft[0:1] = 10,15Hz
+        # Bandwidth[Hz] / 10,15
+        # narrowband = 563Hz = 56
+        # wideband = 1700Hz = 167
+        # 1500Hz = 148
+        # 2700Hz = 266
+        # 3200Hz = 315
+        # Start bins of the slots, the last slot ends with the spectrum
+        slot_starts = np.array([0, 65, 120, 176, 231])
+
+        # work buffers and slots per block length
+        fft_plans = {}
+
         while True:
-            # threading.Event().wait(0.01)
-            threading.Event().wait(0.01)
-            # WE NEED TO OPTIMIZE THIS!
+            # Wait for a new block of audio, timeout for catching a missed event
+            if not self.fft_data_ready.wait(1):
+                continue
+            self.fft_data_ready.clear()
+            data = self.fft_data
 
             # Start calculating the FFT once enough samples are captured.
-            if len(self.fft_data) >= 128:
-                # https://gist.github.com/ZWMiller/53232427efc5088007cab6feee7c6e4c
-                # Fast Fourier Transform, 10*log10(abs) is to scale it to dB
-                # and make sure it's not imaginary
-                try:
-                    fftarray = np.fft.rfft(self.fft_data)
-
-                    # Set value 0 to 1 to avoid division by zero
-                    fftarray[fftarray == 0] = 1
-                    dfft = 10.0 * np.log10(abs(fftarray))
-
-                    # get average of dfft
-                    avg = np.mean(dfft)
-
-                    # Detect signals which are higher than the
-                    # average + 10 (+10 smoothes the output).
-                    # Data higher than the average must be a signal.
-                    # Therefore we are setting it to 100 so it will be highlighted
-                    # Have to do this when we are not transmitting so our
-                    # own sending data will not affect this too much
-                    if not TNC.transmitting:
-                        dfft[dfft > avg + 15] = 100
-
-                        # Calculate audio dbfs
-                        # https://stackoverflow.com/a/9763652
-                        # calculate dbfs every 50 cycles for reducing CPU load
-                        rms_counter += 1
-                        if rms_counter > 50:
-                            d = np.frombuffer(self.fft_data, np.int16).astype(np.float32)
-                            # calculate RMS and then dBFS
-                            # https://dsp.stackexchange.com/questions/8785/how-to-compute-dbfs
-                            # try except for avoiding runtime errors by division/0
-                            try:
-                                rms = int(np.sqrt(np.max(d ** 2)))
-                                if rms == 0:
-                                    raise ZeroDivisionError
-                                AudioParam.audio_dbfs = 20 * np.log10(rms / 32768)
-                            except Exception as e:
-                                self.log.warning(
-                                    "[MDM] fft calculation error - please check your audio setup",
-                                    e=e,
-                                )
-                                AudioParam.audio_dbfs = -100
-
-                            rms_counter = 0
-
-                    # Convert data to int to decrease size
-                    dfft = dfft.astype(int)
-
-                    # Create list of dfft for later pushing to AudioParam.fft
-                    dfftlist = dfft.tolist()
-
-                    # Reduce area where the busy detection is enabled
-                    # We want to have this in correlation with mode bandwidth
-                    # TODO: This is not correctly and needs to be checked for correct maths
-                    # dfftlist[0:1] = 10,15Hz
-                    # Bandwidth[Hz] / 10,15
-                    # narrowband = 563Hz = 56
-                    # wideband = 1700Hz = 167
-                    # 1500Hz = 148
-                    # 2700Hz = 266
-                    # 3200Hz = 315
-
-                    # slot
-                    slot = 0
-                    slot1 = [0, 65]
-                    slot2 = [65,120]
-                    slot3 = [120, 176]
-                    slot4 = [176, 231]
-                    slot5 = [231, len(dfftlist)]
-                    for range in [slot1, slot2, slot3, slot4, slot5]:
-
-                        range_start = range[0]
-                        range_end = range[1]
-                        # define the area, we are detecting busy state
-                        #dfft = dfft[120:176] if TNC.low_bandwidth_mode else dfft[65:231]
-                        slotdfft = dfft[range_start:range_end]
-                        # Check for signals higher than average by checking for "100"
-                        # If we have a signal, increment our channel_busy delay counter
-                        # so we have a smoother state toggle
-                        if np.sum(slotdfft[slotdfft > avg + 15]) >= 200 and not TNC.transmitting:
-                            ModemParam.channel_busy = True
-                            ModemParam.channel_busy_slot[slot] = True
-                            # Limit delay counter to a maximum of 200. The higher this value,
-                            # the longer we will wait until releasing state
-                            channel_busy_delay = min(channel_busy_delay + 10, 200)
-                        else:
-                            # Decrement channel busy counter if no signal has been detected.
-                            channel_busy_delay = max(channel_busy_delay - 1, 0)
-                            # When our channel busy counter reaches 0, toggle state to False
-                            if channel_busy_delay == 0:
-                                ModemParam.channel_busy = False
-                                ModemParam.channel_busy_slot[slot] = False
-
-                        # increment slot
-                        slot += 1
-
-                    AudioParam.fft = dfftlist[:315]  # 315 --> bandwidth 3200
-                except Exception as err:
-                    self.log.error(f"[MDM] calculate_fft: Exception: {err}")
-                    self.log.debug("[MDM] Setting fft=0")
-                    # else 0
-                    AudioParam.fft = [0]
+            if len(data) < 128:
+                continue
+
+            # https://gist.github.com/ZWMiller/53232427efc5088007cab6feee7c6e4c
+            # Fast Fourier Transform, 10*log10(abs) is to scale it to dB
+            # and make sure it's not imaginary
+            try:
+                data = np.frombuffer(data, dtype=np.int16)
+                if len(data) not in fft_plans:
+                    n_bins = len(data) // 2 + 1
+                    fft_plans[len(data)] = (
+                        np.zeros(n_bins, dtype=np.float64),
+                        np.zeros(n_bins, dtype=bool),
+                        slot_starts[slot_starts < n_bins],
+                    )
+                dfft, busy_bins, slots = fft_plans[len(data)]
+
+                fftarray = np.fft.rfft(data)
+
+                # Set values below 1 to 1 to avoid log of zero
+                np.abs(fftarray, out=dfft)
+                np.maximum(dfft, 1, out=dfft)
+                np.log10(dfft, out=dfft)
+                dfft *= 10.0
+
+                # get average of dfft
+                avg = np.mean(dfft)
+
+                # Detect signals which are higher than the
+                # average + 15 (+15 smoothes the output).
+                # Data higher than the average must be a signal.
+                # Therefore we are setting it to 100 so it will be highlighted
+                # Have to do this when we are not transmitting so our
+                # own sending data will not affect this too much
+                np.greater(dfft, avg + 15, out=busy_bins)
+                if not TNC.transmitting:
+                    # A slot is busy if at least 2 of its bins are highlighted,
+                    # the same as a sum of "100" bins >= 200
+                    busy_slots = np.add.reduceat(busy_bins, slots, dtype=np.intp) >= 2
+                    dfft[busy_bins] = 100
+
+                    # Calculate audio dbfs
+                    # https://stackoverflow.com/a/9763652
+                    # calculate dbfs every 5 blocks for reducing CPU load
+                    rms_counter += 1
+                    if rms_counter > 5:
+                        # peak of the block and then dBFS
+                        # https://dsp.stackexchange.com/questions/8785/how-to-compute-dbfs
+                        # try except for avoiding runtime errors by division/0
+                        try:
+                            rms = max(int(data.max()), -int(data.min()))
+                            if rms == 0:
+                                raise ZeroDivisionError
+                            AudioParam.audio_dbfs = 20 * np.log10(rms / 32768)
+                        except Exception as e:
+                            self.log.warning(
+                                "[MDM] fft calculation error - please check your audio setup",
+                                e=e,
+                            )
+                            AudioParam.audio_dbfs = -100
+
+                        rms_counter = 0
+                else:
+                    busy_slots = np.zeros(len(slots), dtype=bool)
+
+                # The counter used to be updated every 10 ms, it's now updated
+                # once per audio block of 100 ms, so steps are scaled by 10
+                for slot, busy in enumerate(busy_slots):
+                    # If we have a signal, increment our channel_busy delay counter
+                    # so we have a smoother state toggle
+                    if busy:
+                        ModemParam.channel_busy = True
+                        ModemParam.channel_busy_slot[slot] = True
+                        # Limit delay counter to a maximum of 200. The higher this value,
+                        # the longer we will wait until releasing state
+                        channel_busy_delay = min(channel_busy_delay + 100, 200)
+                    else:
+                        # Decrement channel busy counter if no signal has been detected.
+                        channel_busy_delay = max(channel_busy_delay - 10, 0)
+                        # When our channel busy counter reaches 0, toggle state to False
+                        if channel_busy_delay == 0:
+                            ModemParam.channel_busy = False
+                            ModemParam.channel_busy_slot[slot] = False
+
+                # Publish as one byte per bin, 315 --> bandwidth 3200
+                AudioParam.fft = np.clip(dfft[:315], 0, 255).astype(np.uint8).tobytes()
+            except Exception as err:
+                self.log.error(f"[MDM] calculate_fft: Exception: {err}")
+                self.log.debug("[MDM] Setting fft=0")
+                # else 0
+                AudioParam.fft = bytes(1)
 
     def set_frames_per_burst(self, frames_per_burst: int) -> None:
         """
@@ -1292,6 +1510,15 @@ class RF:
 
         frames_per_burst = 1
 
+        if ModemParam.enable_demod_processes:
+            if self.demodulator_pool:
+                self.demodulator_pool.send_command(
+                    "frames_per_burst",
+                    frames_per_burst,
+                    ["dat0-datac1", "dat0-datac3", "dat0-datac4", "fsk_ldpc0"],
+                )
+            return
+
         codec2.api.freedv_set_frames_per_burst(self.dat0_datac1_freedv, frames_per_burst)
         codec2.api.freedv_set_frames_per_burst(self.dat0_datac3_freedv, frames_per_burst)
         codec2.api.freedv_set_frames_per_burst(self.dat0_datac4_freedv, frames_per_burst)
@@ -1304,6 +1531,12 @@ class RF:
         :param frames_per_burst: Number of frames per burst requested
         :type frames_per_burst: int
         """
+        if ModemParam.enable_demod_processes:
+            if self.demodulator_pool:
+                self.demodulator_pool.send_command(
+                    "sync", 0, ["dat0-datac1", "dat0-datac3", "dat0-datac4", "fsk_ldpc0"]
+                )
+            return
 
         codec2.api.freedv_set_sync(self.dat0_datac1_freedv, 0)
         codec2.api.freedv_set_sync(self.dat0_datac3_freedv, 0)
@@ -1311,6 +1544,31 @@ class RF:
         codec2.api.freedv_set_sync(self.fsk_ldpc_freedv_0, 0)
 
 
+def is_ignored_opener(mode_name: str, bytes_out) -> bool:
+    """
+    Check for data channel opener frames received in sig1 mode, which are
+    ignored for avoiding toggle states
+
+    use case: opener already received, but ack got lost and we are receiving
+    an opener again
+
+    :param mode_name: name of the receiving mode
+    :type mode_name: str
+    :param bytes_out: received frame
+    :return: True if frame should be dropped
+    :rtype: bool
+    """
+    return mode_name in ["sig1-datac13"] and int.from_bytes(bytes(bytes_out[:1]), "big") in [
+        FRAME_TYPE.ARQ_SESSION_OPEN.value,
+        FRAME_TYPE.ARQ_DC_OPEN_W.value,
+        FRAME_TYPE.ARQ_DC_OPEN_ACK_W.value,
+        FRAME_TYPE.ARQ_DC_OPEN_N.value,
+        FRAME_TYPE.ARQ_DC_OPEN_ACK_N.value,
+        FRAME_TYPE.ARQ_DC_OPEN_OFFSET_W.value,
+        FRAME_TYPE.ARQ_DC_OPEN_OFFSET_N.value,
+    ]
+
+
 def open_codec2_instance(mode: int) -> ctypes.c_void_p:
     """
     Return a codec2 instance of the type `mode`
@@ -1356,6 +1614,28 @@ def get_bytes_per_frame(mode: int) -> int:
     return int(codec2.api.freedv_get_bits_per_modem_frame(freedv) / 8)
 
 
+def add_tx_segment(txbuffer_out, position: int, segment, segment_sum) -> None:
+    """
+    Add a rendered segment to the tx buffer. The segment overlaps the
+    filter tail of the previous segment, so the sum is calculated in int32
+    and clipped, as int16 would wrap around near full scale.
+
+    :param txbuffer_out: tx buffer
+    :type txbuffer_out: NDArray[np.int16]
+    :param position: start of the segment in the tx buffer
+    :type position: int
+    :param segment: rendered segment
+    :type segment: NDArray[np.int16]
+    :param segment_sum: scratch buffer, at least as long as the segment
+    :type segment_sum: NDArray[np.int32]
+    """
+    end = position + len(segment)
+    total = segment_sum[: len(segment)]
+    np.add(txbuffer_out[position:end], segment, out=total, dtype=np.int32)
+    np.clip(total, -32768, 32767, out=total)
+    txbuffer_out[position:end] = total
+
+
 def set_audio_volume(datalist, volume: float) -> np.int16:
     """
     Scale values for the provided audio samples by volume,
@@ -1378,7 +1658,7 @@ def set_audio_volume(datalist, volume: float) -> np.int16:
     # Clip volume provided to acceptable values
     volume = np.clip(volume, 0, 200)  # limit to max value of 255
     # Scale samples by the ratio of volume / 100.0
-    data = np.fromstring(datalist, np.int16) * (volume / 100.0)  # type: ignore
+    data = np.frombuffer(datalist, dtype=np.int16) * (volume / 100.0)  # type: ignore
     return data.astype(np.int16)
 
 
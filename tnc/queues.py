@@ -1,6 +1,7 @@
 """
 Hold queues used by more than one module to eliminate cyclic imports.
 """
+import collections
 import queue
 import static
 from static import ARQ, AudioParam, Beacon, Channel, Daemon, HamlibParam, ModemParam, Station, TCIParam, TNC
@@ -8,16 +9,83 @@ from static import ARQ, AudioParam, Beacon, Channel, Daemon, HamlibParam, ModemP
 DATA_QUEUE_TRANSMIT = queue.Queue()
 DATA_QUEUE_RECEIVED = queue.Queue()
 
-# Initialize FIFO queue to store received frames
-MODEM_RECEIVED_QUEUE = queue.Queue()
+# Initialize FIFO queue to store frames for transmission
 MODEM_TRANSMIT_QUEUE = queue.Queue()
 
 # Initialize FIFO queue to store audio frames
 AUDIO_RECEIVED_QUEUE = queue.Queue()
 AUDIO_TRANSMIT_QUEUE = queue.Queue()
 
+
+class RxBuffer(queue.Queue):
+    """
+    FIFO queue of received data with an index by uuid
+
+    Items are lists of [uuid, timestamp, dxcallsign, dxgrid, base64 data],
+    added in order of their timestamp. Timestamps are float unix time, so
+    items received within the same second can be told apart by "since".
+    """
+
+    def _init(self, maxsize):
+        self.queue = collections.deque()
+        self.index = {}
+
+    def _put(self, item):
+        self.queue.append(item)
+        self.index[item[0]] = item
+
+    def _get(self):
+        item = self.queue.popleft()
+        if self.index.get(item[0]) is item:
+            del self.index[item[0]]
+        return item
+
+    def clear(self):
+        """Remove all items"""
+        with self.mutex:
+            self.queue.clear()
+            self.index.clear()
+
+    def get_by_uuid(self, uuid):
+        """
+        Get an item without removing it
+
+        Args:
+            uuid: uuid of the transmission
+
+        Returns:
+            item or None
+        """
+        with self.mutex:
+            return self.index.get(uuid)
+
+    def since(self, timestamp) -> list:
+        """
+        Get all items received after a timestamp without removing them
+
+        Args:
+            timestamp: unix time, usually the timestamp of the last item a client got
+
+        Returns:
+            list of items, oldest first
+        """
+        with self.mutex:
+            items = []
+            for item in reversed(self.queue):
+                if item[1] <= timestamp:
+                    break
+                items.append(item)
+        items.reverse()
+        return items
+
+    def items(self) -> list:
+        """Get a copy of all items, oldest first"""
+        with self.mutex:
+            return list(self.queue)
+
+
 # Initialize FIFO queue to finally store received data
-RX_BUFFER = queue.Queue(maxsize=ARQ.rx_buffer_size)
+RX_BUFFER = RxBuffer(maxsize=ARQ.rx_buffer_size)
 
 # Commands we want to send to rigctld
 RIGCTLD_COMMAND_QUEUE = queue.Queue()
\ No newline at end of file
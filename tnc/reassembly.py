@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+reassembly.py
+
+Receive buffer for ARQ data frames. A data frame is
+BOF + crc32 (4) + total bytes (4) + compression factor (1) + codec (1) + payload + EOF
+and arrives in bursts, which are written to a preallocated bytearray.
+BOF and EOF are searched incrementally in the written data only, so every
+burst costs O(burst size) regardless of the size of the transmission.
+"""
+# pylint: disable=invalid-name, line-too-long
+
+
+class ReassemblyBuffer:
+    """Receive buffer for a single ARQ data frame"""
+
+    # crc32 + total bytes + compression factor + compression codec
+    HEADER_SIZE = 10
+    # limit for allocating from the header, it's not protected by a crc yet
+    MAX_RESERVE = 64 * 1024 * 1024
+
+    def __init__(self, bof: bytes, eof: bytes, capacity: int = 4096) -> None:
+        """
+        Args:
+            bof: begin of frame marker
+            eof: end of frame marker
+            capacity: initial size of the buffer
+        """
+        self.bof = bof
+        self.eof = eof
+        self.buffer = bytearray(capacity)
+        self.length = 0
+        # positions of the first BOF and EOF, -1 if not received yet
+        self.bof_position = -1
+        self.eof_position = -1
+        self.header_reserved = False
+        # start offsets of received bursts in ascending order
+        self.burst_offsets = []
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __bytes__(self) -> bytes:
+        return bytes(self.buffer[: self.length])
+
+    def clear(self) -> None:
+        """Reset for the next data frame, keeps the allocated buffer"""
+        self.length = 0
+        self.bof_position = -1
+        self.eof_position = -1
+        self.header_reserved = False
+        self.burst_offsets = []
+
+    def reserve(self, capacity: int) -> None:
+        """
+        Make sure the buffer can hold capacity bytes without growing
+
+        Args:
+            capacity: bytes
+        """
+        if capacity > len(self.buffer):
+            self.buffer.extend(bytes(capacity - len(self.buffer)))
+
+    def write(self, offset: int, data: bytes) -> None:
+        """
+        Write a burst at offset, data after offset is dropped
+
+        Args:
+            offset: position of the burst, not higher than the current length
+            data: payload of the burst
+        """
+        assert 0 <= offset <= self.length
+        end = offset + len(data)
+        if end > len(self.buffer):
+            # grow at least by half of the buffer to avoid frequent copies
+            self.reserve(max(end, len(self.buffer) + len(self.buffer) // 2))
+        self.buffer[offset:end] = data
+        self.length = end
+
+        # forget everything we have overwritten
+        while self.burst_offsets and self.burst_offsets[-1] >= offset:
+            self.burst_offsets.pop()
+        self.burst_offsets.append(offset)
+        if self.bof_position + len(self.bof) > offset:
+            self.bof_position = -1
+            self.header_reserved = False
+        if self.eof_position + len(self.eof) > offset:
+            self.eof_position = -1
+
+        # markers may span the previous and the new data
+        if self.bof_position < 0:
+            self.bof_position = self.find(self.bof, offset - len(self.bof) + 1)
+        if self.bof_position >= 0 and not self.header_reserved:
+            self.reserve_from_header()
+        if self.eof_position < 0 and self.bof_position >= 0:
+            self.eof_position = self.find(
+                self.eof,
+                max(offset - len(self.eof) + 1, self.bof_position + len(self.bof)),
+            )
+
+    def append(self, data: bytes) -> None:
+        """
+        Append a burst
+
+        Args:
+            data: payload of the burst
+        """
+        self.write(self.length, data)
+
+    def find(self, sub: bytes, start: int = 0) -> int:
+        """
+        Find sub in the received data
+
+        Args:
+            sub: bytes to search
+            start: first position to search
+
+        Returns:
+            position or -1
+        """
+        return self.buffer.find(sub, max(start, 0), self.length)
+
+    def endswith(self, data: bytes) -> bool:
+        """
+        Check if the received data ends with data
+        """
+        return len(data) <= self.length and self.buffer[self.length - len(data): self.length] == data
+
+    def find_burst(self, prefix: bytes, search_area: int) -> int:
+        """
+        Find the offset of an already received burst starting with prefix
+
+        Args:
+            prefix: first bytes of the burst
+            search_area: only check bursts within the last bytes
+
+        Returns:
+            offset of the last matching burst or -1
+        """
+        for offset in reversed(self.burst_offsets):
+            if offset < self.length - search_area:
+                break
+            if self.buffer[offset: offset + len(prefix)] == prefix:
+                return offset
+        return -1
+
+    def reserve_from_header(self) -> None:
+        """
+        Allocate the whole frame, as soon as the header after BOF arrived.
+        The header holds the uncompressed size, which is the upper limit of
+        the compressed payload except for some codec overhead
+        """
+        if not self.header_received:
+            return
+        header_start = self.bof_position + len(self.bof)
+        total_bytes = int.from_bytes(self.buffer[header_start + 4: header_start + 8], "big")
+        capacity = header_start + self.HEADER_SIZE + total_bytes + total_bytes // 100 + 1024 + len(self.eof)
+        self.reserve(min(capacity, self.MAX_RESERVE))
+        self.header_reserved = True
+
+    @property
+    def header_received(self) -> bool:
+        """True if BOF and the header after it have been received"""
+        return 0 <= self.bof_position and self.length >= self.bof_position + len(self.bof) + self.HEADER_SIZE
+
+    def header(self) -> bytes:
+        """Header after BOF, check header_received first"""
+        header_start = self.bof_position + len(self.bof)
+        return bytes(self.buffer[header_start: header_start + self.HEADER_SIZE])
+
+    def payload(self) -> bytes:
+        """Data between BOF and EOF including the header"""
+        return bytes(self.buffer[self.bof_position + len(self.bof): self.eof_position])
@@ -17,10 +17,13 @@ Created on Fri Dec 25 21:25:14 2020
     # "dxcallsign" : "..."
     # "data" : "..."
 """
+import asyncio
 import atexit
 import base64
 import queue
-import socketserver
+import socket
+import struct
+import tempfile
 import sys
 import threading
 import time
@@ -37,143 +40,212 @@ from queues import DATA_QUEUE_TRANSMIT, RX_BUFFER, RIGCTLD_COMMAND_QUEUE
 SOCKET_QUEUE = queue.Queue()
 DAEMON_QUEUE = queue.Queue()
 
-CONNECTED_CLIENTS = set()
+# request handler per client socket
+CONNECTED_CLIENTS = {}
+# clients which are receiving the tnc state as delta stream
+STATE_DELTA_CLIENTS = set()
 CLOSE_SIGNAL = False
 
+# chunked raw data uploads by uuid, see tnc_arq_send_raw_begin
+RAW_UPLOADS = {}
+# uploads are kept in memory up to this size, then moved to a temp file
+RAW_UPLOAD_SPOOL_SIZE = 1024 * 1024
+# seconds after which an upload without new chunks is dropped
+RAW_UPLOAD_TIMEOUT = 3600
+# maximum size of an upload in bytes
+RAW_UPLOAD_MAX_SIZE = 16 * 1024 * 1024
+
+# maximum number of messages waiting for a client
+CLIENT_BUFFER_SIZE = 200
+# seconds a client may block sending while its buffer is full
+CLIENT_SEND_TIMEOUT = 10
+# maximum length of a command line, raw data is sent within a single line
+COMMAND_LINE_LIMIT = 64 * 1024 * 1024
+PUBLISHER_LOCK = threading.Lock()
+PUBLISHER_STARTED = False
+
+# tnc_state fields per subscription group of the delta stream,
+# fields not listed here are always sent
+STATE_GROUPS = {
+    "spectrum": (
+        "fft",
+        "scatter",
+        "audio_dbfs",
+        "snr",
+        "channel_busy",
+        "channel_busy_slot",
+        "is_codec2_traffic",
+    ),
+    "arq": (
+        "arq_state",
+        "arq_session",
+        "arq_session_state",
+        "speed_level",
+        "arq_bytes_per_minute",
+        "arq_bytes_per_minute_burst",
+        "arq_seconds_until_finish",
+        "arq_compression_factor",
+        "arq_transmission_percent",
+        "speed_list",
+        "total_bytes",
+    ),
+    "rig": (
+        "frequency",
+        "rf_level",
+        "strength",
+        "alc",
+        "mode",
+        "bandwidth",
+        "hamlib_status",
+    ),
+    "stations": ("stations",),
+}
+
+# Binary frames of the delta stream, they start with a zero byte so they can't
+# be mistaken for a json line: 0x00, frame type, payload length (uint16 big endian)
+STATE_FRAME_HEADER = struct.Struct(">BBH")
+# one uint8 dB value per 10 Hz bin
+STATE_FRAME_FFT = 1
+# x, y pairs as int16 big endian
+STATE_FRAME_SCATTER = 2
+
+# (TNC.heard_stations.changes, stations of the tnc state), see get_heard_stations
+HEARD_STATIONS_CACHE = (-1, [])
+
 TESTMODE = False
 
 log = structlog.get_logger("sock")
 
 
-class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+def start_publisher(server_port):
     """
-    the socket handler base class
+    start the publisher thread, if not already running
+
+    Args:
+      server_port: port of the command server, selects tnc or daemon state
     """
+    global PUBLISHER_STARTED
+    with PUBLISHER_LOCK:
+        if PUBLISHER_STARTED:
+            return
+        PUBLISHER_STARTED = True
 
-    pass
+    threading.Thread(
+        target=publish_to_clients, args=[server_port], name="SOCKET PUBLISHER", daemon=True
+    ).start()
 
 
-# noinspection PyTypeChecker
-class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
-    """ """
-    connection_alive = False
-    log = structlog.get_logger("ThreadedTCPRequestHandler")
+def publish_to_clients(server_port):
+    """
+    single publisher for all clients. It creates the state stream once,
+    drains SOCKET_QUEUE and hands every message to the send buffer of
+    each client, so the cost per client is just a buffer append
 
-    def send_to_client(self):
-        """
-        function called by socket handler
-        send data to a network client if available
-        """
-        tempdata = b""
-        while self.connection_alive and not CLOSE_SIGNAL:
-            # send tnc state as network stream
-            # check server port against daemon port and send corresponding data
-            if self.server.server_address[1] == TNC.port and not Daemon.tncstarted:
-                data = send_tnc_state()
-                if data != tempdata:
-                    tempdata = data
-                    SOCKET_QUEUE.put(data)
+    Args:
+      server_port: port of the command server, selects tnc or daemon state
+    """
+    tempdata = ""
+    next_state_update = 0
+    while not CLOSE_SIGNAL:
+        # send tnc state as network stream
+        # check server port against daemon port and send corresponding data
+        if time.monotonic() >= next_state_update:
+            if is_tnc_state_port(server_port):
+                clients = list(CONNECTED_CLIENTS.values())
+                if any(client.request not in STATE_DELTA_CLIENTS for client in clients):
+                    data = send_tnc_state()
+                    if data != tempdata:
+                        tempdata = data
+                        SOCKET_QUEUE.put(data)
+
+                for client in clients:
+                    if client.request in STATE_DELTA_CLIENTS:
+                        sock_data = client.get_state_delta()
+                        if sock_data:
+                            client.enqueue(sock_data)
+
+                # we want to transmit scatter data only once to reduce network traffic
+                ModemParam.scatter = []
+                next_state_update = time.monotonic() + 0.15
             else:
                 data = send_daemon_state()
                 if data != tempdata:
                     tempdata = data
                     SOCKET_QUEUE.put(data)
-                threading.Event().wait(0.5)
-
-            while not SOCKET_QUEUE.empty():
-                data = SOCKET_QUEUE.get()
-                sock_data = bytes(data, "utf-8")
-                sock_data += b"\n"  # append line limiter
-
-                # send data to all clients
-                try:
-                    for client in CONNECTED_CLIENTS:
-                        try:
-                            client.send(sock_data)
-                        except Exception as err:
-                            self.log.info("[SCK] Connection lost", e=err)
-                            # TODO: Check if we really should set connection alive to false.
-                            # This might disconnect all other clients as well...
-                            self.connection_alive = False
-                except Exception as err:
-                    self.log.debug("[SCK] catch harmless RuntimeError: Set changed size during iteration", e=err)
-
-            # we want to transmit scatter data only once to reduce network traffic
-            ModemParam.scatter = []
-            # self.request.sendall(sock_data)
-            threading.Event().wait(0.15)
-
-    def receive_from_client(self):
-        """
-        function which is called by the socket handler
-        it processes the data which is returned by a client
-        """
-        data = bytes()
-        while self.connection_alive and not CLOSE_SIGNAL:
-            try:
-                chunk = self.request.recv(1024)
-                data += chunk
-
-                if chunk == b"":
-                    # print("connection broken. Closing...")
-                    self.connection_alive = False
-
-                if data.startswith(b"{") and data.endswith(b"}\n"):
-                    # split data by \n if we have multiple commands in socket buffer
-                    data = data.split(b"\n")
-                    # remove empty data
-                    data.remove(b"")
-
-                    # iterate thorugh data list
-                    for commands in data:
-                        if self.server.server_address[1] == TNC.port:
-                            self.process_tnc_commands(commands)
-                        else:
-                            self.process_daemon_commands(commands)
-
-                        # wait some time between processing multiple commands
-                        # this is only a first test to avoid doubled transmission
-                        # we might improve this by only processing one command or
-                        # doing some kind of selection to determine which commands need to be dropped
-                        # and which one can be processed during a running transmission
-                        threading.Event().wait(0.5)
-
-                    # finally delete our rx buffer to be ready for new commands
-                    data = bytes()
-            except Exception as err:
-                self.log.info(
-                    "[SCK] Connection closed",
-                    ip=self.client_address[0],
-                    port=self.client_address[1],
-                    e=err,
-                )
-                self.connection_alive = False
+                next_state_update = time.monotonic() + 0.5
 
-    def handle(self):
-        """
-        socket handler
-        """
-        CONNECTED_CLIENTS.add(self.request)
+        try:
+            data = SOCKET_QUEUE.get(timeout=max(next_state_update - time.monotonic(), 0))
+        except queue.Empty:
+            continue
 
-        self.log.debug(
-            "[SCK] Client connected",
-            ip=self.client_address[0],
-            port=self.client_address[1],
-        )
-        self.connection_alive = True
+        try:
+            sock_data = bytes(data, "utf-8")
+        except Exception as err:
+            log.warning("[SCK] Dropping invalid message", data=data, e=err)
+            continue
+        sock_data += b"\n"  # append line limiter
+        # delta stream clients get their own state updates
+        is_full_state = data.startswith('{"command":"tnc_state"')
 
-        self.sendThread = threading.Thread(
-            target=self.send_to_client, args=[], daemon=True
-        )
-        self.sendThread.start()
-        self.receiveThread = threading.Thread(
-            target=self.receive_from_client, args=[], daemon=True
-        )
-        self.receiveThread.start()
+        # send data to all clients
+        for client in list(CONNECTED_CLIENTS.values()):
+            if is_full_state and client.request in STATE_DELTA_CLIENTS:
+                continue
+            client.enqueue(sock_data)
 
-        # keep connection alive until we close it
-        while self.connection_alive and not CLOSE_SIGNAL:
-            threading.Event().wait(1)
+
+# noinspection PyTypeChecker
+class ThreadedTCPRequestHandler:
+    """
+    command processing of a client, the connection is handled by
+    AsyncRequestHandler
+    """
+    connection_alive = False
+    log = structlog.get_logger("ThreadedTCPRequestHandler")
+
+    def get_state_delta(self):
+        """
+        get the fields of the tnc state which changed since the last
+        update and are in a subscribed group. fft and scatter data are sent
+        as binary frames
+
+        Returns:
+          bytes to send, may be empty
+        """
+        state = get_tnc_state(self.state_groups)
+        sock_data = b""
+
+        fft = state.pop("fft", None)
+        if fft is not None and fft != self.last_state.get("fft"):
+            self.last_state["fft"] = fft
+            sock_data += STATE_FRAME_HEADER.pack(0, STATE_FRAME_FFT, len(fft)) + fft
+
+        # scatter is only sent once, so every non-empty scatter is new
+        scatter = state.pop("scatter", None)
+        if scatter:
+            values = []
+            for point in scatter:
+                values.extend(
+                    max(-32768, min(32767, int(point[axis]))) for axis in ("x", "y")
+                )
+            payload = struct.pack(f">{len(values)}h", *values)
+            sock_data += STATE_FRAME_HEADER.pack(0, STATE_FRAME_SCATTER, len(payload)) + payload
+
+        # heard stations are only rebuilt on changes, so an unchanged list is the same object
+        stations = state.pop("stations", None)
+        delta = {
+            key: value
+            for key, value in state.items()
+            if self.last_state.get(key) != value
+        }
+        if stations is not None and stations is not self.last_state.get("stations"):
+            delta["stations"] = stations
+        if delta:
+            self.last_state.update(delta)
+            sock_data += bytes(json.dumps({"command": "tnc_state_delta", **delta}), "utf-8") + b"\n"
+
+        return sock_data
 
     def finish(self):
         """ """
@@ -182,8 +254,13 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
             ip=self.client_address[0],
             port=self.client_address[1],
         )
+        STATE_DELTA_CLIENTS.discard(self.request)
+        # uploads of this client can't be committed anymore
+        for upload_uuid, upload in list(RAW_UPLOADS.items()):
+            if upload["client"] is self.request:
+                drop_raw_upload(upload_uuid)
         try:
-            CONNECTED_CLIENTS.remove(self.request)
+            del CONNECTED_CLIENTS[self.request]
         except Exception as e:
             self.log.warning(
                 "[SCK] client connection already removed from client list",
@@ -357,6 +434,38 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
                 else:
                     self.tnc_arq_send_raw(received_json)
 
+            # CHUNKED UPLOAD OF RAW DATA
+            if received_json["type"] == "arq" and received_json["command"] == "send_raw_begin":
+                if TESTMODE:
+                    ThreadedTCPRequestHandler.tnc_arq_send_raw_begin(None, received_json)
+                else:
+                    self.tnc_arq_send_raw_begin(received_json)
+
+            if received_json["type"] == "arq" and received_json["command"] == "send_raw_chunk":
+                if TESTMODE:
+                    ThreadedTCPRequestHandler.tnc_arq_send_raw_chunk(None, received_json)
+                else:
+                    self.tnc_arq_send_raw_chunk(received_json)
+
+            if received_json["type"] == "arq" and received_json["command"] == "send_raw_commit":
+                if TESTMODE:
+                    ThreadedTCPRequestHandler.tnc_arq_send_raw_commit(None, received_json)
+                elif TNC.tnc_state in ['busy']:
+                    log.warning(
+                        "[SCK] Dropping command",
+                        e="tnc state",
+                        state=TNC.tnc_state,
+                        command=received_json,
+                    )
+                else:
+                    self.tnc_arq_send_raw_commit(received_json)
+
+            if received_json["type"] == "arq" and received_json["command"] == "send_raw_abort":
+                if TESTMODE:
+                    ThreadedTCPRequestHandler.tnc_arq_send_raw_abort(None, received_json)
+                else:
+                    self.tnc_arq_send_raw_abort(received_json)
+
             # STOP TRANSMISSION
             if received_json["type"] == "arq" and received_json["command"] == "stop_transmission":
                 if TESTMODE:
@@ -371,6 +480,27 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
                 else:
                     self.tnc_get_rx_buffer(received_json)
 
+            # GET RX BUFFER WITHOUT DATA
+            if received_json["type"] == "get" and received_json["command"] == "rx_buffer_list":
+                if TESTMODE:
+                    ThreadedTCPRequestHandler.tnc_get_rx_buffer_list(None, received_json)
+                else:
+                    self.tnc_get_rx_buffer_list(received_json)
+
+            # GET RX BUFFER ITEM BY UUID
+            if received_json["type"] == "get" and received_json["command"] == "rx_buffer_fetch":
+                if TESTMODE:
+                    ThreadedTCPRequestHandler.tnc_get_rx_buffer_fetch(None, received_json)
+                else:
+                    self.tnc_get_rx_buffer_fetch(received_json)
+
+            # GET RX BUFFER ITEMS SINCE TIMESTAMP
+            if received_json["type"] == "get" and received_json["command"] == "rx_buffer_since":
+                if TESTMODE:
+                    ThreadedTCPRequestHandler.tnc_get_rx_buffer_since(None, received_json)
+                else:
+                    self.tnc_get_rx_buffer_since(received_json)
+
             # DELETE RX BUFFER
             if received_json["type"] == "set" and received_json["command"] == "del_rx_buffer":
                 if TESTMODE:
@@ -391,6 +521,11 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
                 else:
                     self.tnc_set_mode(received_json)
 
+            # SET TNC STATE STREAM
+            if received_json["type"] == "set" and received_json["command"] == "state_stream":
+                if not TESTMODE:
+                    self.tnc_set_state_stream(received_json)
+
         except Exception as err:
             log.error("[SCK] JSON decoding error", e=err)
 
@@ -671,78 +806,135 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
             )
 
     def tnc_arq_send_raw(self, received_json):
-        Beacon.beacon_pause = True
-
-        # wait some random time
-        helpers.wait(randrange(5, 25, 5) / 10.0)
-
-        # TODO: carefully test this
-        # avoid sending data while we are receiving codec2 signalling data
-        interrupt_time = time.time() + 5
-        while ModemParam.is_codec2_traffic and time.time() < interrupt_time:
-            threading.Event().wait(0.01)
-
-        # we need to warn if already in arq state
-        if ARQ.arq_state:
-            command_response("send_raw", False)
-            log.warning(
-                "[SCK] Send raw command execution warning",
-                e="already in arq state",
-                i="command queued",
-                command=received_json,
-            )
+        wait_before_send_raw(received_json)
 
         try:
+            mycallsign, dxcallsign, attempts, arq_uuid = get_send_raw_parameter(received_json)
             if not ARQ.arq_session:
-                dxcallsign = received_json["parameter"][0]["dxcallsign"]
-                # additional step for being sure our callsign is correctly
-                # in case we are not getting a station ssid
-                # then we are forcing a station ssid = 0
-                dxcallsign = helpers.callsign_to_bytes(dxcallsign)
-                dxcallsign = helpers.bytes_to_callsign(dxcallsign)
-
                 command_response("send_raw", True)
-            else:
-                dxcallsign = Station.dxcallsign
-                Station.dxcallsign_crc = helpers.get_crc_24(Station.dxcallsign)
 
             base64data = received_json["parameter"][0]["data"]
+            if len(base64data) % 4:
+                raise TypeError
 
-            # check if specific callsign is set with different SSID than the TNC is initialized
-            try:
-                mycallsign = received_json["parameter"][0]["mycallsign"]
-                mycallsign = helpers.callsign_to_bytes(mycallsign)
-                mycallsign = helpers.bytes_to_callsign(mycallsign)
-
-            except Exception:
-                mycallsign = Station.mycallsign
+            binarydata = base64.b64decode(base64data)
 
-            # check for connection attempts key
-            try:
-                attempts = int(received_json["parameter"][0]["attempts"])
+            DATA_QUEUE_TRANSMIT.put(
+                ["ARQ_RAW", binarydata, arq_uuid, mycallsign, dxcallsign, attempts]
+            )
 
-            except Exception:
-                attempts = 10
+        except Exception as err:
+            command_response("send_raw", False)
+            log.warning(
+                "[SCK] Send raw command execution error",
+                e=err,
+                command=received_json,
+            )
 
-            # check if transmission uuid provided else set no-uuid
-            try:
-                arq_uuid = received_json["uuid"]
-            except Exception:
-                arq_uuid = "no-uuid"
+    def tnc_arq_send_raw_begin(self, received_json):
+        """
+        start a chunked upload, parameters are the same as for send_raw
+        without data. The uuid identifies the upload
+        """
+        try:
+            arq_uuid = received_json["uuid"]
+            if arq_uuid in RAW_UPLOADS:
+                raise KeyError(f"upload {arq_uuid} already exists")
+
+            # remove uploads which have never been committed
+            for stale_uuid, upload in list(RAW_UPLOADS.items()):
+                if time.time() - upload["timestamp"] > RAW_UPLOAD_TIMEOUT:
+                    drop_raw_upload(stale_uuid)
+
+            mycallsign, dxcallsign, attempts, _ = get_send_raw_parameter(received_json)
+            RAW_UPLOADS[arq_uuid] = {
+                "file": tempfile.SpooledTemporaryFile(max_size=RAW_UPLOAD_SPOOL_SIZE),
+                "size": 0,
+                # the upload is dropped if this client disconnects
+                "client": self.request if self else None,
+                "mycallsign": mycallsign,
+                "dxcallsign": dxcallsign,
+                "attempts": attempts,
+                "timestamp": time.time(),
+            }
+            command_response("send_raw_begin", True)
+        except Exception as err:
+            command_response("send_raw_begin", False)
+            log.warning(
+                "[SCK] Send raw begin command execution error",
+                e=err,
+                command=received_json,
+            )
 
+    def tnc_arq_send_raw_chunk(self, received_json):
+        """
+        append a base64 encoded chunk to an upload, only failures are responded
+        """
+        try:
+            upload = RAW_UPLOADS[received_json["uuid"]]
+            base64data = received_json["data"]
             if len(base64data) % 4:
                 raise TypeError
 
-            binarydata = base64.b64decode(base64data)
+            data = base64.b64decode(base64data)
+            if upload["size"] + len(data) > RAW_UPLOAD_MAX_SIZE:
+                drop_raw_upload(received_json["uuid"])
+                raise ValueError(f"upload exceeds {RAW_UPLOAD_MAX_SIZE} bytes")
+            upload["file"].write(data)
+            upload["size"] += len(data)
+            upload["timestamp"] = time.time()
+        except Exception as err:
+            command_response("send_raw_chunk", False)
+            log.warning(
+                "[SCK] Send raw chunk command execution error",
+                e=err,
+                uuid=received_json.get("uuid"),
+            )
+
+    def tnc_arq_send_raw_commit(self, received_json):
+        """
+        finish an upload and hand it over to the arq transmitter, which
+        reads it from the spooled file
+        """
+        wait_before_send_raw(received_json)
 
+        try:
+            arq_uuid = received_json["uuid"]
+            upload = RAW_UPLOADS.pop(arq_uuid)
+            if not ARQ.arq_session:
+                command_response("send_raw", True)
+
+            upload["file"].seek(0)
             DATA_QUEUE_TRANSMIT.put(
-                ["ARQ_RAW", binarydata, arq_uuid, mycallsign, dxcallsign, attempts]
+                [
+                    "ARQ_RAW",
+                    upload["file"],
+                    arq_uuid,
+                    upload["mycallsign"],
+                    upload["dxcallsign"],
+                    upload["attempts"],
+                ]
             )
-
         except Exception as err:
             command_response("send_raw", False)
             log.warning(
-                "[SCK] Send raw command execution error",
+                "[SCK] Send raw commit command execution error",
+                e=err,
+                command=received_json,
+            )
+
+    def tnc_arq_send_raw_abort(self, received_json):
+        """
+        drop an upload which has not been committed
+        """
+        try:
+            if not drop_raw_upload(received_json["uuid"]):
+                raise KeyError(received_json["uuid"])
+            command_response("send_raw_abort", True)
+        except Exception as err:
+            command_response("send_raw_abort", False)
+            log.warning(
+                "[SCK] Send raw abort command execution error",
                 e=err,
                 command=received_json,
             )
@@ -766,20 +958,8 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
             if not RX_BUFFER.empty():
                 output = {
                     "command": "rx_buffer",
-                    "data-array": [],
+                    "data-array": [rx_buffer_item_to_json(item) for item in RX_BUFFER.items()],
                 }
-
-                for _buffer_length in range(RX_BUFFER.qsize()):
-                    base64_data = RX_BUFFER.queue[_buffer_length][4]
-                    output["data-array"].append(
-                        {
-                            "uuid": RX_BUFFER.queue[_buffer_length][0],
-                            "timestamp": RX_BUFFER.queue[_buffer_length][1],
-                            "dxcallsign": str(RX_BUFFER.queue[_buffer_length][2], "utf-8"),
-                            "dxgrid": str(RX_BUFFER.queue[_buffer_length][3], "utf-8"),
-                            "data": base64_data,
-                        }
-                    )
                 jsondata = json.dumps(output)
                 # self.request.sendall(bytes(jsondata, encoding))
                 SOCKET_QUEUE.put(jsondata)
@@ -793,9 +973,73 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
                 command=received_json,
             )
 
+    def tnc_get_rx_buffer_list(self, received_json):
+        """
+        send uuid, timestamp, callsign and size of all items in the rx
+        buffer without data
+        """
+        try:
+            output = {
+                "command": "rx_buffer_list",
+                "data-array": [
+                    rx_buffer_item_to_json(item, with_data=False) for item in RX_BUFFER.items()
+                ],
+            }
+            SOCKET_QUEUE.put(json.dumps(output))
+            command_response("rx_buffer_list", True)
+        except Exception as err:
+            command_response("rx_buffer_list", False)
+            log.warning(
+                "[SCK] Send RX buffer list command execution error",
+                e=err,
+                command=received_json,
+            )
+
+    def tnc_get_rx_buffer_fetch(self, received_json):
+        """
+        send a single item of the rx buffer by uuid
+        """
+        try:
+            item = RX_BUFFER.get_by_uuid(received_json["uuid"])
+            if item is None:
+                raise KeyError(received_json["uuid"])
+            output = {
+                "command": "rx_buffer",
+                "data-array": [rx_buffer_item_to_json(item)],
+            }
+            SOCKET_QUEUE.put(json.dumps(output))
+            command_response("rx_buffer_fetch", True)
+        except Exception as err:
+            command_response("rx_buffer_fetch", False)
+            log.warning(
+                "[SCK] Send RX buffer item command execution error",
+                e=err,
+                command=received_json,
+            )
+
+    def tnc_get_rx_buffer_since(self, received_json):
+        """
+        send all items of the rx buffer received after a timestamp
+        """
+        try:
+            items = RX_BUFFER.since(float(received_json["timestamp"]))
+            output = {
+                "command": "rx_buffer",
+                "data-array": [rx_buffer_item_to_json(item) for item in items],
+            }
+            SOCKET_QUEUE.put(json.dumps(output))
+            command_response("rx_buffer_since", True)
+        except Exception as err:
+            command_response("rx_buffer_since", False)
+            log.warning(
+                "[SCK] Send RX buffer since command execution error",
+                e=err,
+                command=received_json,
+            )
+
     def tnc_set_del_rx_buffer(self, received_json):
         try:
-            RX_BUFFER.queue.clear()
+            RX_BUFFER.clear()
             command_response("del_rx_buffer", True)
         except Exception as err:
             command_response("del_rx_buffer", False)
@@ -829,6 +1073,35 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
                 command=received_json,
             )
 
+    def tnc_set_state_stream(self, received_json):
+        """
+        switch between the full json tnc state and the delta stream
+
+        {"type": "set", "command": "state_stream", "mode": "delta",
+         "groups": ["spectrum", "arq", "rig", "stations"]}
+        """
+        try:
+            if received_json["mode"] == "delta":
+                groups = set(received_json.get("groups", STATE_GROUPS))
+                if not groups <= set(STATE_GROUPS):
+                    raise ValueError(f"unknown groups {groups - set(STATE_GROUPS)}")
+                self.state_groups = groups
+                # start with a complete snapshot
+                self.last_state = {"command": "tnc_state"}
+                STATE_DELTA_CLIENTS.add(self.request)
+            elif received_json["mode"] == "full":
+                STATE_DELTA_CLIENTS.discard(self.request)
+            else:
+                raise ValueError(f"unknown mode {received_json['mode']}")
+            command_response("state_stream", True)
+        except Exception as err:
+            command_response("state_stream", False)
+            log.warning(
+                "[SCK] Set state stream command execution error",
+                e=err,
+                command=received_json,
+            )
+
     # ------------------------ DAEMON COMMANDS
     def process_daemon_commands(self, data):
         """
@@ -870,7 +1143,7 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
             callsign = received_json["parameter"]
 
             if bytes(callsign, "utf-8") == b"":
-                self.request.sendall(b"INVALID CALLSIGN")
+                command_response("mycallsign", False)
                 log.warning(
                     "[SCK] SET MYCALL FAILED",
                     call=Station.mycallsign,
@@ -895,7 +1168,6 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
             mygrid = received_json["parameter"]
 
             if bytes(mygrid, "utf-8") == b"":
-                self.request.sendall(b"INVALID GRID")
                 command_response("mygrid", False)
             else:
                 Station.mygrid = bytes(mygrid, "utf-8")
@@ -1011,6 +1283,218 @@ class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
             log.warning("[SCK] command execution error", e=err, command=received_json)
 
 
+class AsyncCommandServer:
+    """
+    asyncio based server for the json lines command protocol. All clients
+    are served by a single event loop, so idle clients cost almost nothing
+    """
+
+    log = structlog.get_logger("AsyncCommandServer")
+
+    def __init__(self, server_address):
+        """
+        bind the server socket, so errors are raised on creation
+
+        Args:
+          server_address: (host, port)
+        """
+        # socket.create_server needs python 3.8
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            # on windows SO_REUSEADDR allows binding a port which is in use
+            if sys.platform not in ["win32", "cygwin"]:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(server_address)
+            self.socket.listen()
+        except OSError:
+            self.socket.close()
+            raise
+        self.server_address = self.socket.getsockname()
+
+    def serve_forever(self):
+        """
+        run the event loop of the server, blocks until the loop stops
+        """
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """ """
+        server = await asyncio.start_server(
+            self.handle_client, sock=self.socket, limit=COMMAND_LINE_LIMIT
+        )
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        """ """
+        await AsyncRequestHandler(self, reader, writer).handle()
+
+
+class AsyncRequestHandler(ThreadedTCPRequestHandler):
+    """
+    client of the AsyncCommandServer. Commands of ThreadedTCPRequestHandler
+    are executed in a worker thread, so a blocking command doesn't stall
+    the event loop
+    """
+
+    log = structlog.get_logger("AsyncRequestHandler")
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.request = writer
+        self.client_address = writer.get_extra_info("peername")[:2]
+        self.loop = asyncio.get_running_loop()
+        self.connection_alive = True
+        # tnc state stream settings, changed by the "state_stream" command
+        self.state_groups = set(STATE_GROUPS)
+        self.last_state = {"command": "tnc_state"}
+        self.send_buffer = asyncio.Queue(CLIENT_BUFFER_SIZE)
+
+    def enqueue(self, sock_data):
+        """
+        add data to the send buffer of this client, called by the
+        publisher thread
+
+        Args:
+          sock_data: bytes to send
+        """
+        self.loop.call_soon_threadsafe(self.enqueue_in_loop, sock_data)
+
+    def enqueue_in_loop(self, sock_data):
+        """
+        add data to the send buffer, if the client can't keep up the
+        oldest data will be dropped
+        """
+        if self.send_buffer.full():
+            self.send_buffer.get_nowait()
+        self.send_buffer.put_nowait(sock_data)
+
+    async def send_to_client(self):
+        """
+        send data from the send buffer of this client
+        """
+        while self.connection_alive and not CLOSE_SIGNAL:
+            sock_data = await self.send_buffer.get()
+            self.request.write(sock_data)
+            try:
+                await asyncio.wait_for(self.request.drain(), CLIENT_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.log.warning(
+                    "[SCK] Disconnecting slow client",
+                    ip=self.client_address[0],
+                    port=self.client_address[1],
+                )
+                break
+            except ConnectionError as err:
+                self.log.info("[SCK] Connection lost", e=err)
+                break
+        self.connection_alive = False
+
+    async def receive_from_client(self):
+        """
+        read commands line by line and process them one after another
+        """
+        while self.connection_alive and not CLOSE_SIGNAL:
+            try:
+                data = await self.reader.readline()
+            except (ConnectionError, ValueError) as err:
+                # ValueError if the line is longer than COMMAND_LINE_LIMIT
+                self.log.info(
+                    "[SCK] Connection closed",
+                    ip=self.client_address[0],
+                    port=self.client_address[1],
+                    e=err,
+                )
+                break
+
+            if data == b"":
+                # connection closed by client
+                break
+
+            data = data.strip()
+            if not data:
+                continue
+
+            try:
+                await self.loop.run_in_executor(None, self.process_commands, data)
+            except Exception as err:
+                self.log.warning("[SCK] Command processing failed", e=err)
+        self.connection_alive = False
+
+    def process_commands(self, data):
+        """
+        process a single command line, runs in a worker thread
+
+        Args:
+          data: command as json
+        """
+        if self.server.server_address[1] == TNC.port:
+            self.process_tnc_commands(data)
+        else:
+            self.process_daemon_commands(data)
+
+    async def handle(self):
+        """
+        socket handler
+        """
+        CONNECTED_CLIENTS[self.request] = self
+        start_publisher(self.server.server_address[1])
+
+        self.log.debug(
+            "[SCK] Client connected",
+            ip=self.client_address[0],
+            port=self.client_address[1],
+        )
+
+        # the publisher only sends the state if it changed, so a new
+        # client gets the current state first
+        state = get_state(self.server.server_address[1])
+        if state:
+            self.enqueue_in_loop(bytes(state, "utf-8") + b"\n")
+
+        tasks = [
+            asyncio.create_task(self.send_to_client()),
+            asyncio.create_task(self.receive_from_client()),
+        ]
+        # keep connection alive until one side stops
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            task.cancel()
+
+        self.connection_alive = False
+        self.finish()
+        self.request.close()
+
+
+def is_tnc_state_port(server_port) -> bool:
+    """
+    check if clients of a command server get the tnc state or the daemon state
+
+    Args:
+      server_port: port of the command server
+
+    Returns:
+      True for the tnc state
+    """
+    return server_port == TNC.port and not Daemon.tncstarted
+
+
+def get_state(server_port):
+    """
+    current state for the clients of a command server
+
+    Args:
+      server_port: port of the command server
+
+    Returns:
+      tnc state or daemon state as json, None on errors
+    """
+    if is_tnc_state_port(server_port):
+        return send_tnc_state()
+    return send_daemon_state()
+
+
 def send_daemon_state():
     """
     send the daemon state to network
@@ -1047,64 +1531,225 @@ def send_tnc_state():
     """
     send the tnc state to network
     """
-    encoding = "utf-8"
-    output = {
-        "command": "tnc_state",
-        "ptt_state": str(HamlibParam.ptt_state),
-        "tnc_state": str(TNC.tnc_state),
-        "arq_state": str(ARQ.arq_state),
-        "arq_session": str(ARQ.arq_session),
-        "arq_session_state": str(ARQ.arq_session_state),
-        "audio_dbfs": str(AudioParam.audio_dbfs),
-        "snr": str(ModemParam.snr),
-        "frequency": str(HamlibParam.hamlib_frequency),
-        "rf_level": str(HamlibParam.hamlib_rf),
-        "strength": str(HamlibParam.hamlib_strength),
-        "alc": str(HamlibParam.alc),
-        "audio_level": str(AudioParam.tx_audio_level),
-        "audio_auto_tune": str(AudioParam.audio_auto_tune),
-        "speed_level": str(ARQ.arq_speed_level),
-        "mode": str(HamlibParam.hamlib_mode),
-        "bandwidth": str(HamlibParam.hamlib_bandwidth),
-        "fft": str(AudioParam.fft),
-        "channel_busy": str(ModemParam.channel_busy),
-        "channel_busy_slot": str(ModemParam.channel_busy_slot),
-        "is_codec2_traffic": str(ModemParam.is_codec2_traffic),
-        "scatter": ModemParam.scatter,
-        "rx_buffer_length": str(RX_BUFFER.qsize()),
-        "rx_msg_buffer_length": str(len(ARQ.rx_msg_buffer)),
-        "arq_bytes_per_minute": str(ARQ.bytes_per_minute),
-        "arq_bytes_per_minute_burst": str(ARQ.bytes_per_minute_burst),
-        "arq_seconds_until_finish": str(ARQ.arq_seconds_until_finish),
-        "arq_compression_factor": str(ARQ.arq_compression_factor),
-        "arq_transmission_percent": str(ARQ.arq_transmission_percent),
-        "speed_list": ARQ.speed_list,
-        "total_bytes": str(ARQ.total_bytes),
-        "beacon_state": str(Beacon.beacon_state),
-        "stations": [],
-        "mycallsign": str(Station.mycallsign, encoding),
-        "mygrid": str(Station.mygrid, encoding),
-        "dxcallsign": str(Station.dxcallsign, encoding),
-        "dxgrid": str(Station.dxgrid, encoding),
-        "hamlib_status": HamlibParam.hamlib_status,
-        "listen": str(TNC.listen),
-        "audio_recording": str(AudioParam.audio_record),
-    }
+    output = get_tnc_state()
+    output["fft"] = str(list(output["fft"]))
+    return json.dumps(output)
 
-    # add heard stations to heard stations object
-    for heard in TNC.heard_stations:
-        output["stations"].append(
-            {
-                "dxcallsign": str(heard[0], encoding),
-                "dxgrid": str(heard[1], encoding),
-                "timestamp": heard[2],
-                "datatype": heard[3],
-                "snr": heard[4],
-                "offset": heard[5],
-                "frequency": heard[6],
-            }
+
+# getters of the tnc_state fields, in the order they are sent
+TNC_STATE_FIELDS = {
+    "ptt_state": lambda: str(HamlibParam.ptt_state),
+    "tnc_state": lambda: str(TNC.tnc_state),
+    "arq_state": lambda: str(ARQ.arq_state),
+    "arq_session": lambda: str(ARQ.arq_session),
+    "arq_session_state": lambda: str(ARQ.arq_session_state),
+    "audio_dbfs": lambda: str(AudioParam.audio_dbfs),
+    "snr": lambda: str(ModemParam.snr),
+    "frequency": lambda: str(HamlibParam.hamlib_frequency),
+    "rf_level": lambda: str(HamlibParam.hamlib_rf),
+    "strength": lambda: str(HamlibParam.hamlib_strength),
+    "alc": lambda: str(HamlibParam.alc),
+    "audio_level": lambda: str(AudioParam.tx_audio_level),
+    "audio_auto_tune": lambda: str(AudioParam.audio_auto_tune),
+    "speed_level": lambda: str(ARQ.arq_speed_level),
+    "mode": lambda: str(HamlibParam.hamlib_mode),
+    "bandwidth": lambda: str(HamlibParam.hamlib_bandwidth),
+    "fft": lambda: AudioParam.fft,
+    "channel_busy": lambda: str(ModemParam.channel_busy),
+    "channel_busy_slot": lambda: str(ModemParam.channel_busy_slot),
+    "is_codec2_traffic": lambda: str(ModemParam.is_codec2_traffic),
+    "scatter": lambda: ModemParam.scatter,
+    "rx_buffer_length": lambda: str(RX_BUFFER.qsize()),
+    "rx_msg_buffer_length": lambda: str(len(ARQ.rx_msg_buffer)),
+    "arq_bytes_per_minute": lambda: str(ARQ.bytes_per_minute),
+    "arq_bytes_per_minute_burst": lambda: str(ARQ.bytes_per_minute_burst),
+    "arq_seconds_until_finish": lambda: str(ARQ.arq_seconds_until_finish),
+    "arq_compression_factor": lambda: str(ARQ.arq_compression_factor),
+    "arq_transmission_percent": lambda: str(ARQ.arq_transmission_percent),
+    "speed_list": lambda: ARQ.speed_list,
+    "total_bytes": lambda: str(ARQ.total_bytes),
+    "beacon_state": lambda: str(Beacon.beacon_state),
+    "stations": lambda: get_heard_stations(),
+    "mycallsign": lambda: str(Station.mycallsign, "utf-8"),
+    "mygrid": lambda: str(Station.mygrid, "utf-8"),
+    "dxcallsign": lambda: str(Station.dxcallsign, "utf-8"),
+    "dxgrid": lambda: str(Station.dxgrid, "utf-8"),
+    "hamlib_status": lambda: HamlibParam.hamlib_status,
+    "listen": lambda: str(TNC.listen),
+    "audio_recording": lambda: str(AudioParam.audio_record),
+}
+
+
+def get_tnc_state(groups=None) -> dict:
+    """
+    collect the tnc state, fields of groups which are not subscribed
+    are not built at all
+
+    Args:
+        groups: only include fields of these STATE_GROUPS, all if None
+
+    Returns:
+        tnc state with fft as bytes
+    """
+    skipped = ()
+    if groups is not None:
+        skipped = {
+            key for group in STATE_GROUPS.keys() - groups for key in STATE_GROUPS[group]
+        }
+
+    output = {"command": "tnc_state"}
+    for key, getter in TNC_STATE_FIELDS.items():
+        if key not in skipped:
+            output[key] = getter()
+    return output
+
+
+def get_heard_stations() -> list:
+    """
+    heard stations for the tnc state. The list is only built again
+    if the heard stations changed, so an unchanged list is the same object
+
+    Returns:
+      list of station dicts, first heard first
+    """
+    global HEARD_STATIONS_CACHE
+    TNC.heard_stations.expire()
+    changes, stations = HEARD_STATIONS_CACHE
+    if changes == TNC.heard_stations.changes:
+        return stations
+
+    changes = TNC.heard_stations.changes
+    stations = [
+        {
+            "dxcallsign": str(heard.dxcallsign, "utf-8"),
+            "dxgrid": str(heard.dxgrid, "utf-8"),
+            "timestamp": heard.timestamp,
+            "datatype": heard.datatype,
+            "snr": heard.snr,
+            "offset": heard.offset,
+            "frequency": heard.frequency,
+        }
+        for heard in TNC.heard_stations.first_heard_order()
+    ]
+    HEARD_STATIONS_CACHE = (changes, stations)
+    return stations
+
+
+def wait_before_send_raw(received_json):
+    """
+    pause beacons and wait for a free channel before sending raw data
+
+    Args:
+      received_json: the command, for logging
+    """
+    Beacon.beacon_pause = True
+
+    # wait some random time
+    helpers.wait(randrange(5, 25, 5) / 10.0)
+
+    # TODO: carefully test this
+    # avoid sending data while we are receiving codec2 signalling data
+    interrupt_time = time.time() + 5
+    while ModemParam.is_codec2_traffic and time.time() < interrupt_time:
+        threading.Event().wait(0.01)
+
+    # we need to warn if already in arq state
+    if ARQ.arq_state:
+        command_response("send_raw", False)
+        log.warning(
+            "[SCK] Send raw command execution warning",
+            e="already in arq state",
+            i="command queued",
+            command=received_json,
         )
-    return json.dumps(output)
+
+
+def drop_raw_upload(upload_uuid) -> bool:
+    """
+    remove an upload which has not been committed and close its file
+
+    Args:
+      upload_uuid: uuid of the upload
+
+    Returns:
+      True if the upload existed
+    """
+    upload = RAW_UPLOADS.pop(upload_uuid, None)
+    if upload is None:
+        return False
+    upload["file"].close()
+    return True
+
+
+def get_send_raw_parameter(received_json):
+    """
+    read the parameters of a send_raw command
+
+    Args:
+      received_json: the command
+
+    Returns:
+      mycallsign, dxcallsign, attempts, uuid
+    """
+    if not ARQ.arq_session:
+        dxcallsign = received_json["parameter"][0]["dxcallsign"]
+        # additional step for being sure our callsign is correctly
+        # in case we are not getting a station ssid
+        # then we are forcing a station ssid = 0
+        dxcallsign = helpers.callsign_to_bytes(dxcallsign)
+        dxcallsign = helpers.bytes_to_callsign(dxcallsign)
+    else:
+        dxcallsign = Station.dxcallsign
+        Station.dxcallsign_crc = helpers.get_crc_24(Station.dxcallsign)
+
+    # check if specific callsign is set with different SSID than the TNC is initialized
+    try:
+        mycallsign = received_json["parameter"][0]["mycallsign"]
+        mycallsign = helpers.callsign_to_bytes(mycallsign)
+        mycallsign = helpers.bytes_to_callsign(mycallsign)
+
+    except Exception:
+        mycallsign = Station.mycallsign
+
+    # check for connection attempts key
+    try:
+        attempts = int(received_json["parameter"][0]["attempts"])
+
+    except Exception:
+        attempts = 10
+
+    # check if transmission uuid provided else set no-uuid
+    try:
+        arq_uuid = received_json["uuid"]
+    except Exception:
+        arq_uuid = "no-uuid"
+
+    return mycallsign, dxcallsign, attempts, arq_uuid
+
+
+def rx_buffer_item_to_json(item, with_data=True) -> dict:
+    """
+    convert an item of the rx buffer for sending it to the network
+
+    Args:
+      item: [uuid, timestamp, dxcallsign, dxgrid, base64 data]
+      with_data: include the data, else only its size in bytes
+
+    Returns:
+      dict
+    """
+    output = {
+        "uuid": item[0],
+        "timestamp": item[1],
+        "dxcallsign": str(item[2], "utf-8"),
+        "dxgrid": str(item[3], "utf-8"),
+    }
+    if with_data:
+        output["data"] = item[4]
+    else:
+        # base64 without padding, as the data is encoded in one piece
+        output["size"] = len(item[4]) * 3 // 4 - item[4][-2:].count("=")
+    return output
 
 
 def command_response(command, status):
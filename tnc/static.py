@@ -11,6 +11,7 @@ from dataclasses import dataclass, field
 from typing import List
 import subprocess
 from enum import Enum
+from stations import HeardStations
 
 
 # CHANNEL_STATE = 'RECEIVING_SIGNALLING'
@@ -27,7 +28,7 @@ class ARQ:
     arq_bits_per_second: int = 0
     arq_seconds_until_finish: int = 0
     rx_buffer_size: int = 16
-    rx_frame_buffer: bytes = b""
+    rx_frame_buffer = b""  # reassembly.ReassemblyBuffer of the data handler
     rx_burst_buffer = []
     arq_session_state: str = "disconnected" # can be: disconnected, disconnecting, connected, connecting, failed
     arq_session: bool = False
@@ -35,7 +36,12 @@ class ARQ:
     # ARQ PROTOCOL VERSION
     # v.5 - signalling frame uses datac0
     # v.6 - signalling frame uses datac13
-    arq_protocol_version: int = 6
+    # v.7 - data frame header contains the compression codec
+    arq_protocol_version: int = 7
+    # preferred compression codec for arq data: lzma, zlib or zstd
+    arq_compression: str = "lzma"
+    # offer burst headers with data offset in the data channel opener
+    arq_offset_header: bool = False
     total_bytes: int = 0
     speed_list = []
     # set save to folder state for allowing downloading files to local file system
@@ -53,12 +59,12 @@ class AudioParam:
     audio_output_device: int = -2
     audio_record: bool = False
     audio_record_file = ''
-    buffer_overflow_counter = [0, 0, 0, 0, 0]
+    buffer_overflow_counter = [0, 0, 0, 0, 0, 0, 0]
     audio_auto_tune: bool = False
     # Audio TCI Support
     audio_enable_tci: bool = False
     audio_dbfs: int = 0
-    fft = []
+    fft = b""  # spectrum in dB, one byte per 10 Hz bin
     enable_fft: bool = True
 
 
@@ -104,6 +110,8 @@ class ModemParam:
     tx_delay: int = 0  # delay in ms before sending modulation for triggering VOX for example or slow PTT radios
     enable_scatter: bool = False
     scatter = []
+    enable_demod_processes: bool = False  # run demodulators in worker processes
+    tx_buffer_all: bool = False  # render the whole burst before keying ptt, for slow CPUs
 
 @dataclass
 class Station:
@@ -139,7 +147,7 @@ class TNC:
     enable_fsk: bool = False
     respond_to_cq: bool = True
     respond_to_call: bool = True  # respond to cq, ping, connection request, file request if not in session
-    heard_stations = []
+    heard_stations = HeardStations()
     listen: bool = True
 
     # ------------
@@ -171,6 +179,8 @@ class FRAME_TYPE(Enum):
     ARQ_DC_OPEN_ACK_W = 226
     ARQ_DC_OPEN_N = 227
     ARQ_DC_OPEN_ACK_N = 228
+    ARQ_DC_OPEN_OFFSET_W = 229
+    ARQ_DC_OPEN_OFFSET_N = 230
     ARQ_STOP = 249
     BEACON = 250
     FEC = 251
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+stations.py
+
+Table of heard stations, keyed by callsign. Stations are kept in least
+recently heard order, so stations which haven't been heard for longer than
+the ttl or exceed the maximum size are dropped from the front. Clients get
+them in first heard order like before, see first_heard_order.
+"""
+# pylint: disable=invalid-name, line-too-long
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+class HeardStation:
+    """A heard station"""
+
+    __slots__ = ("dxcallsign", "dxgrid", "timestamp", "datatype", "snr", "offset", "frequency", "first_heard")
+
+    def __init__(self, dxcallsign, dxgrid, timestamp, datatype, snr, offset, frequency, first_heard=0) -> None:
+        # sequence number of the first time we heard the station
+        self.first_heard = first_heard
+        self.dxcallsign = dxcallsign
+        self.dxgrid = dxgrid
+        self.timestamp = timestamp
+        self.datatype = datatype
+        self.snr = snr
+        self.offset = offset
+        self.frequency = frequency
+
+
+class HeardStations:
+    """Heard stations with LRU and TTL eviction"""
+
+    def __init__(self, max_size: int = 200, ttl: int = 86400) -> None:
+        """
+        Args:
+            max_size: maximum number of stations
+            ttl: seconds after which a station is dropped if not heard again
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        # incremented on every change, so readers can skip unchanged tables
+        self.changes = 0
+        self.stations = OrderedDict()
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def __iter__(self):
+        """Iterate over a snapshot of the stations, least recently heard first"""
+        with self.lock:
+            return iter(list(self.stations.values()))
+
+    def first_heard_order(self) -> list:
+        """Snapshot of the stations, first heard first"""
+        with self.lock:
+            return sorted(self.stations.values(), key=lambda station: station.first_heard)
+
+    def add(self, dxcallsign, dxgrid, datatype, snr, offset, frequency) -> None:
+        """
+        Add a station or update it, if we have already heard it
+
+        Args:
+            dxcallsign:
+            dxgrid:
+            datatype:
+            snr:
+            offset:
+            frequency:
+        """
+        timestamp = int(time.time())
+        with self.lock:
+            station = self.stations.get(dxcallsign)
+            if station is None:
+                self.stations[dxcallsign] = HeardStation(
+                    dxcallsign, dxgrid, timestamp, datatype, snr, offset, frequency, next(self.sequence)
+                )
+            else:
+                station.dxgrid = dxgrid
+                station.timestamp = timestamp
+                station.datatype = datatype
+                station.snr = snr
+                station.offset = offset
+                station.frequency = frequency
+                self.stations.move_to_end(dxcallsign)
+
+            while len(self.stations) > max(self.max_size, 1):
+                self.stations.popitem(last=False)
+            self.changes += 1
+        self.expire()
+
+    def expire(self) -> None:
+        """Drop stations we haven't heard within ttl seconds"""
+        deadline = time.time() - self.ttl
+        with self.lock:
+            expired = False
+            while self.stations and next(iter(self.stations.values())).timestamp < deadline:
+                self.stations.popitem(last=False)
+                expired = True
+            if expired:
+                self.changes += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.stations.clear()
+            self.changes += 1